@@ -1,5 +1,5 @@
 #!/bin/bash
 
 for ((i = 1; i <= $1; i++)); do
-  screen -dmS chinese-extraction-"$i" bash -c "source activate;conda activate nkunlp; bash loop.sh"
+  screen -dmS chinese-extraction-"$i" bash -c "source activate;conda activate nkunlp; PARTITION_INDEX=$((i - 1)) bash loop.sh"
 done
@@ -0,0 +1,190 @@
+"""Suppresses boilerplate lines, such as navigation bars, footers and cookie notices, that recur across a crawl.
+
+Pass one counts, for every line, the number of documents of a sample it appears in, into a
+count-min sketch that is saved to disk:
+
+    python src/boilerplate.py boilerplate.npz downloaded/crawl-data/CC-MAIN-2021-10/segments/1614178347293.1
+
+Pass two is run by the extraction when `boilerplate.enabled` is set, and drops the lines whose
+estimated count exceeds the threshold. The sketch takes `width * depth * 4` bytes whatever the
+size of the sample.
+"""
+import os
+import sys
+import time
+import hashlib
+import logging
+import pathlib
+import argparse
+import colorama
+import warcio
+import functools
+import numpy as np
+
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import utils
+import records
+
+WIDTH = 1 << 22
+DEPTH = 4
+DIGITS = str.maketrans('123456789', '000000000')
+
+
+def normalize(line: str) -> str:
+    """Lines that only differ by surrounding whitespace or by their digits, e.g. a year in a footer, are counted together."""
+    return line.strip().translate(DIGITS)
+
+
+def line_hashes(lines: List[str]) -> np.ndarray:
+    return np.array([int.from_bytes(hashlib.blake2b(normalize(line).encode('utf-8'), digest_size=8).digest(), 'little')
+                     for line in lines], dtype=np.uint64)
+
+
+class Sketch:
+    """A count-min sketch of line hashes, with the number of documents counted."""
+
+    def __init__(self, width: int = WIDTH, depth: int = DEPTH, table: Optional[np.ndarray] = None, documents: int = 0):
+        self.table = np.zeros((depth, width), dtype=np.uint32) if table is None else table
+        self.documents = documents
+
+    @property
+    def width(self) -> int:
+        return self.table.shape[1]
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        # The rows are indexed by `h1 + i * h2`, which is as good as independent hash functions.
+        h1 = hashes & np.uint64(0xffffffff)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(len(self.table), dtype=np.uint64)[:, None]
+        return ((h1[None, :] + rows * h2[None, :]) % np.uint64(self.width)).astype(np.int64)
+
+    def add(self, hashes: np.ndarray, documents: int):
+        """Counts the hashes of `documents` documents, each hash once per document."""
+        for row, columns in zip(self.table, self._columns(hashes)):
+            columns, counts = np.unique(columns, return_counts=True)
+            row[columns] += counts.astype(np.uint32)
+        self.documents += documents
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """The number of documents each hash was seen in, possibly overestimated, never underestimated."""
+        if len(hashes) == 0:
+            return np.zeros(0, dtype=np.uint32)
+        return np.take_along_axis(self.table, self._columns(hashes), axis=1).min(axis=0)
+
+    def save(self, path: Union[str, pathlib.Path]):
+        part = pathlib.Path(f'{path}.part')
+        with open(part, 'wb') as f:
+            np.savez(f, table=self.table, documents=self.documents)
+        os.replace(part, path)
+
+    @classmethod
+    def load(cls, path: Union[str, pathlib.Path]) -> 'Sketch':
+        with np.load(path) as data:
+            return cls(table=data['table'], documents=int(data['documents']))
+
+
+@functools.lru_cache(maxsize=None)
+def load(path: str) -> Sketch:
+    """The sketch at `path`, loaded once per process."""
+    return Sketch.load(path)
+
+
+class Filter(NamedTuple):
+    """Drops the lines seen in at least `fraction` of the documents of the sketch, and in at least `min_documents`."""
+    sketch: str
+    fraction: float
+    min_documents: int
+
+    def strip(self, text: str, counts: Optional[Counter] = None, stats: Optional[Dict] = None) -> str:
+        """Strips the boilerplate lines of extracted text, where every line ends with a newline.
+
+        The lines dropped are counted as `boilerplate` in `counts`, and the `stats` of the text,
+        if given, are computed again when lines are dropped.
+        """
+        if text == '':
+            return text
+        sketch = load(self.sketch)
+        lines = text.split('\n')[:-1]
+        keep = sketch.estimate(line_hashes(lines)) < max(self.min_documents, self.fraction * sketch.documents)
+        n_dropped = len(lines) - int(np.count_nonzero(keep))
+        if counts is not None:
+            counts['boilerplate'] += n_dropped
+        if n_dropped == 0:
+            return text
+        text = ''.join(lines[i] + '\n' for i in np.flatnonzero(keep))
+        if stats is not None:
+            stats.update(utils.text_stats(text))
+        return text
+
+
+def documents_of(path: pathlib.Path) -> Iterator[str]:
+    """The extracted text of the records of a segment, or of a file written by the extraction."""
+    if path.name.endswith('.warc.wet.gz'):
+        with open(path, 'rb') as stream:
+            for record in warcio.ArchiveIterator(stream):
+                yield utils.extract_chinese(record, policy='skip')
+    else:
+        for _, record in records.read_records(path):
+            yield record['data']
+
+
+def sample_file(path: pathlib.Path) -> Tuple[np.ndarray, int]:
+    """The line hashes of a file, each hash once per document, and the number of documents with Chinese text."""
+    hashes = []
+    documents = 0
+    for text in documents_of(path):
+        if text == '':
+            continue
+        hashes.append(np.unique(line_hashes(text.split('\n')[:-1])))
+        documents += 1
+    return (np.concatenate(hashes) if hashes else np.zeros(0, dtype=np.uint64)), documents
+
+
+def sample_files(paths: List[str]) -> List[pathlib.Path]:
+    files = []
+    for path in map(pathlib.Path, paths):
+        if path.is_dir():
+            files += list(path.rglob('*.warc.wet.gz')) + records.glob(path)
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def build(sketch: Sketch, files: List[pathlib.Path], processes: int) -> Sketch:
+    """Counts the lines of `files`, read and hashed on `processes` processes."""
+    progbar = utils.ProgBar(len(files))
+    with Pool(processes=processes) as pool:
+        for hashes, documents in pool.imap_unordered(sample_file, files):
+            sketch.add(hashes, documents)
+            progbar.add(1, values=[('documents', documents)])
+    return sketch
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Counts the lines of a sample of the crawl into a count-min sketch.')
+    parser.add_argument('sketch', type=str, help='the sketch file, updated if it exists')
+    parser.add_argument('paths', type=str, nargs='+', help='WET segments or extracted files, or folders of them')
+    parser.add_argument('--width', type=int, default=WIDTH, help='counters per row')
+    parser.add_argument('--depth', type=int, default=DEPTH, help='rows')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='files read in parallel')
+    args = parser.parse_args()
+
+    colorama.init()
+    logging.basicConfig(level=logging.INFO,
+                        format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
+    start = time.time()
+    files = sample_files(args.paths)
+    if len(files) == 0:
+        logging.critical('No file to sample.')
+        sys.exit(-1)
+    sketch = Sketch.load(args.sketch) if os.path.exists(args.sketch) else Sketch(args.width, args.depth)
+    build(sketch, files, args.processes)
+    sketch.save(args.sketch)
+    logging.info(f'Sketch saved: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{files={len(files)}, documents={sketch.documents}, time={time.time() - start:.2f}s}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
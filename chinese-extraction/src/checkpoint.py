@@ -0,0 +1,95 @@
+"""Checkpoints of the extraction of a segment, so that a job stopped halfway resumes where it was.
+
+A checkpoint is taken between two records and holds the offset of the next record in the
+segment, the size of the `.part` output up to it, the counts so far and the state of the
+deduplicator, if any. It is saved next to
+the output as `<output>.checkpoint`, and the `.part` file is kept when the job is cancelled
+or crashes, so that the worker that claims the job again seeks to the offset and appends.
+"""
+import os
+import time
+import json
+import pathlib
+
+import dedup
+import records
+import parallel
+
+from typing import Dict, Iterator, NamedTuple, Optional, Union
+
+
+class Checkpoint(NamedTuple):
+    offset: int
+    size: int
+    n_records: int
+    counts: Dict[str, int]
+    dedup: str = ''
+
+
+def path_of(processed_data: Union[str, pathlib.Path]) -> pathlib.Path:
+    processed_data = pathlib.Path(processed_data)
+    return processed_data.with_name(processed_data.name + '.checkpoint')
+
+
+def save(processed_data: Union[str, pathlib.Path], checkpoint: Checkpoint):
+    path = path_of(processed_data)
+    part = path.with_name(path.name + '.part')
+    with open(part, 'w') as f:
+        json.dump(checkpoint._asdict(), f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(part, path)
+
+
+def restore(processed_data: Union[str, pathlib.Path],
+            downloaded_data: Union[str, pathlib.Path]) -> Optional[Checkpoint]:
+    """The checkpoint to resume a segment from, with its `.part` output cut back to it, or None to start over.
+
+    A checkpoint whose `.part` output is missing or short, or whose offset is not the start
+    of a record of the segment, is not resumed from.
+    """
+    path = path_of(processed_data)
+    part = records.part_of(processed_data)
+    if not path.exists() or not part.exists():
+        return None
+    with open(path) as f:
+        checkpoint = Checkpoint(**json.load(f))
+    if part.stat().st_size < checkpoint.size:
+        return None
+    with open(downloaded_data, 'rb') as f:
+        if checkpoint.offset != os.fstat(f.fileno()).st_size and not parallel.is_member_start(f, checkpoint.offset):
+            return None
+    with open(part, 'r+b') as f:
+        f.truncate(checkpoint.size)
+    return checkpoint
+
+
+def written(processed_data: Union[str, pathlib.Path]) -> Iterator[Dict]:
+    """The records in the `.part` output of a restored checkpoint."""
+    for _, data in records.read_records(records.part_of(processed_data), records.format_of(processed_data)):
+        yield data
+
+
+def discard(processed_data: Union[str, pathlib.Path]):
+    """Removes the checkpoint of a segment and its `.part` output, once the job is over."""
+    path_of(processed_data).unlink(missing_ok=True)
+    records.part_of(processed_data).unlink(missing_ok=True)
+
+
+class Checkpointer:
+    """Saves a checkpoint of the records written to `out` at most once every `interval` seconds."""
+
+    def __init__(self, processed_data: Union[str, pathlib.Path], out: records.RecordWriter, interval: float):
+        self.processed_data = processed_data
+        self.out = out
+        self.interval = interval
+        self._saved_at = time.monotonic()
+
+    def due(self) -> bool:
+        return time.monotonic() - self._saved_at >= self.interval
+
+    def save(self, offset: int, n_records: int, counts: Dict[str, int], seen: Optional[dedup.Deduplicator] = None):
+        """Saves a checkpoint before the record at `offset`, once `n_records` records are read."""
+        save(self.processed_data, Checkpoint(offset=offset, size=self.out.checkpoint(), n_records=n_records,
+                                             counts=dict(counts), dedup='' if seen is None else seen.state()))
+        self._saved_at = time.monotonic()
@@ -0,0 +1,76 @@
+import base64
+import hashlib
+
+import utils
+
+from collections import Counter
+from typing import Dict, List, Optional, Set
+
+
+def digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest()
+
+
+class Deduplicator:
+    """Drops the records of a segment that are exact copies of an earlier one, and optionally the lines already seen.
+
+    Records are compared once their lines are stripped of surrounding whitespace, so mirrors
+    that only differ by indentation count as copies. Only 8-byte digests are kept, for one
+    segment at a time.
+
+    A deduplicator is restored from the records written before a checkpoint with `remember`,
+    together with its `state`: the digests of the records that were not written as they came,
+    which cannot be told from the output.
+    """
+
+    def __init__(self, lines: bool = False):
+        self.lines = lines
+        self._records: Set[bytes] = set()
+        self._lines: Set[bytes] = set()
+        self._unwritten: List[bytes] = []
+
+    def state(self) -> str:
+        return base64.b64encode(b''.join(self._unwritten)).decode('ascii')
+
+    def restore(self, state: str):
+        unwritten = base64.b64decode(state)
+        self._unwritten = [unwritten[i:i + 8] for i in range(0, len(unwritten), 8)]
+        self._records.update(self._unwritten)
+
+    def remember(self, data: Dict):
+        """Takes a record already written, e.g. before a checkpoint, as seen."""
+        lines = [line.strip() for line in data['data'].split('\n')[:-1]]
+        self._records.add(digest('\n'.join(lines)))
+        if self.lines:
+            self._lines.update(digest(line) for line in lines)
+
+    def dedup(self, data: Dict, counts: Optional[Counter] = None) -> Optional[Dict]:
+        """The record made by `utils.dump_data` without its repeated lines, or None if nothing new is left.
+
+        Records dropped are counted as `duplicates` in `counts`, and the lines as `duplicate_lines`.
+        """
+        counts = Counter() if counts is None else counts
+        lines = [line.strip() for line in data['data'].split('\n')[:-1]]
+        record = digest('\n'.join(lines))
+        if record in self._records:
+            counts['duplicates'] += 1
+            return None
+        self._records.add(record)
+        if not self.lines:
+            return data
+        keep = []
+        for i, line in enumerate(lines):
+            line = digest(line)
+            if line not in self._lines:
+                self._lines.add(line)
+                keep.append(i)
+        counts['duplicate_lines'] += len(lines) - len(keep)
+        if len(keep) == len(lines):
+            return data
+        self._unwritten.append(record)
+        if len(keep) == 0:
+            return None
+        # Also seen as written, as `remember` takes it after a checkpoint.
+        self._records.add(digest('\n'.join(lines[i] for i in keep)))
+        text = data['data'].split('\n')
+        return utils.with_data(data, ''.join(text[i] + '\n' for i in keep))
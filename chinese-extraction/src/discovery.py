@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import pathlib
+
+import models
+
+from typing import Dict, List, Optional, Sequence, Set
+from sqlalchemy.orm import Query, Session
+
+
+class Listing:
+    """The segments in the download folder, rescanned at most once every `ttl` seconds.
+
+    Segments claimed by this worker are dropped from the listing without a rescan. `idle` is
+    set once the listing has been rescanned for want of a job, and cleared by the next claim.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        self.path = pathlib.Path(path)
+        self.ttl = ttl
+        self.idle = False
+        self._uris: List[str] = []
+        self._scanned_at: Optional[float] = None
+
+    def uris(self, refresh: bool = False) -> List[str]:
+        if refresh or self._scanned_at is None or time.monotonic() - self._scanned_at > self.ttl:
+            self._uris = [file.relative_to(self.path).as_posix() for file in self.path.rglob('*.warc.wet.gz')]
+            self._scanned_at = time.monotonic()
+        return self._uris
+
+    def discard(self, uri: str):
+        if uri in self._uris:
+            self._uris.remove(uri)
+
+
+def pending(session: Session, sync: bool = True) -> Query:
+    """The rows to claim, locked for update. Without `sync`, segments already processed are taken again."""
+    query = session \
+        .query(models.Data) \
+        .with_for_update(of=models.Data, skip_locked=True)
+    if sync:
+        query = query.filter(models.Data.process_state == models.Data.PROCESS_PENDING)
+    return query
+
+
+def existing(root: pathlib.Path, uris: Sequence[str]) -> Set[str]:
+    """The `uris` whose files are under `root`, listing every folder once rather than checking every file."""
+    folders: Dict[str, Set[str]] = {}
+    found = set()
+    for uri in uris:
+        folder, _, name = uri.rpartition('/')
+        if folder not in folders:
+            try:
+                folders[folder] = set(os.listdir(root.joinpath(folder)))
+            except (FileNotFoundError, NotADirectoryError):
+                folders[folder] = set()
+        if name in folders[folder]:
+            found.add(uri)
+    return found
+
+
+def find_downloaded_job(session: Session, download_path: str, downloaders: Sequence[str],
+                        batch_size: int, sync: bool = True) -> Optional[models.Data]:
+    """A pending segment downloaded by one of `downloaders`, whose file is in `download_path`.
+
+    The candidates are read `batch_size` at a time in the order of their ids, without locking
+    them, so that rows whose files are not here yet neither hide the later ones nor stay locked
+    for other workers. Only the row claimed is locked.
+    """
+    last_id = 0
+    while True:
+        query = session \
+            .query(models.Data.id, models.Data.uri) \
+            .join(models.Data.worker) \
+            .filter(models.Data.download_state == models.Data.DOWNLOAD_FINISHED,
+                    models.Worker.name.in_(downloaders),
+                    models.Data.id > last_id)
+        if sync:
+            query = query.filter(models.Data.process_state == models.Data.PROCESS_PENDING)
+        candidates = query.order_by(models.Data.id).limit(batch_size).all()
+        if len(candidates) == 0:
+            return None
+        here = existing(pathlib.Path(download_path), [uri for _, uri in candidates])
+        for id_, uri in candidates:
+            if uri in here:
+                job = pending(session, sync).filter(models.Data.id == id_).first()
+                if job is not None:
+                    return job
+        last_id = candidates[-1].id
+
+
+def find_listed_job(session: Session, listing: Listing, batch_size: int, refresh: bool = False,
+                    sync: bool = True) -> Optional[models.Data]:
+    """A pending segment of the listing, looked up `batch_size` files at a time in random order."""
+    uris = listing.uris(refresh=refresh)
+    uris = random.sample(uris, len(uris))
+    for i in range(0, len(uris), batch_size):
+        job = pending(session, sync).filter(models.Data.uri.in_(uris[i:i + batch_size])).first()
+        if job is not None:
+            return job
+    return None
+
+
+def find_job(session: Session, listing: Listing, downloaders: Sequence[str], batch_size: int,
+             sync: bool = True) -> Optional[models.Data]:
+    """A pending segment whose file is on this device, locked for update.
+
+    The rows of `downloaders` are looked up first. The listing is used if there are none. It
+    is rescanned before giving up, in case files arrived since it was taken, but only once
+    until a job is claimed again, so that an idle worker does not rescan the download folder
+    on every poll; after that it is rescanned when its `ttl` runs out.
+    """
+    job = None
+    if len(downloaders) > 0:
+        job = find_downloaded_job(session, str(listing.path), downloaders, batch_size, sync)
+    if job is None:
+        job = find_listed_job(session, listing, batch_size, sync=sync)
+    if job is None and not listing.idle:
+        listing.idle = True
+        job = find_listed_job(session, listing, batch_size, refresh=True, sync=sync)
+    if job is not None:
+        listing.idle = False
+        listing.discard(job.uri)
+    return job
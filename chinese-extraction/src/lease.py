@@ -0,0 +1,149 @@
+import os
+import time
+import pytz
+import socket
+import logging
+import datetime
+import colorama
+import threading
+
+from typing import Any, Optional, Sequence, Set, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy.engine import Engine
+
+DURATION = 300
+HEARTBEAT_INTERVAL = 60
+
+
+def default_owner(name: str = '') -> str:
+    return f'{name}@{socket.gethostname()}:{os.getpid()}'[:128]
+
+
+class Leases:
+    """Keeps the leases on the rows claimed by this process alive.
+
+    A claimed row carries `lease_owner` and `lease_expires_at`. While the row is held,
+    the heartbeat pushes its expiry forward every `interval` seconds. If the process
+    dies without releasing it, the lease runs out and `reap` returns the row to its
+    pending state, so that another worker can pick it up.
+    """
+
+    def __init__(self,
+                 model: Any,
+                 owner: str,
+                 duration: int = DURATION,
+                 interval: int = HEARTBEAT_INTERVAL,
+                 timezone: str = 'Asia/Shanghai',
+                 key: str = 'id'):
+        self._model = model
+        self._key = key
+        self._duration = duration
+        self._interval = interval
+        self._timezone = pytz.timezone(timezone)
+        self._held: Set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._reaped_at = 0.0
+        self.owner = owner
+
+    def now(self) -> datetime.datetime:
+        return datetime.datetime.now(tz=self._timezone)
+
+    def expires_at(self) -> datetime.datetime:
+        return self.now() + datetime.timedelta(seconds=self._duration)
+
+    def values(self) -> dict:
+        """Column values that put a freshly claimed row under this process's lease."""
+        return {self._model.lease_owner: self.owner, self._model.lease_expires_at: self.expires_at()}
+
+    def cleared(self) -> dict:
+        """Column values that release a row."""
+        return {self._model.lease_owner: None, self._model.lease_expires_at: None}
+
+    def take(self, job: Any):
+        job.lease_owner = self.owner
+        job.lease_expires_at = self.expires_at()
+        self.hold(getattr(job, self._key))
+
+    def drop(self, job: Any):
+        job.lease_owner = None
+        job.lease_expires_at = None
+        self.unhold(getattr(job, self._key))
+
+    def hold(self, *keys):
+        with self._lock:
+            self._held.update(keys)
+
+    def unhold(self, *keys):
+        with self._lock:
+            self._held.difference_update(keys)
+
+    def renew(self, session: Session):
+        with self._lock:
+            keys = list(self._held)
+        if len(keys) == 0:
+            return
+        renewed = session \
+            .query(self._model) \
+            .filter(getattr(self._model, self._key).in_(keys),
+                    self._model.lease_owner == self.owner) \
+            .update({self._model.lease_expires_at: self.expires_at()}, synchronize_session=False)
+        session.commit()
+        if renewed < len(keys):
+            logging.warning(f'{colorama.Fore.LIGHTYELLOW_EX}'
+                            f'{len(keys) - renewed} of {len(keys)} leases have been lost, '
+                            f'the rows may be processed by another worker.'
+                            f'{colorama.Fore.RESET}')
+
+    def reap(self, session: Session, states: Sequence[Tuple[Any, int, int]]) -> int:
+        """Returns the rows whose lease has expired to their pending state.
+
+        `states` lists `(column, in_progress, pending)` for every state column of the
+        table. Runs at most once per heartbeat interval.
+        """
+        if time.monotonic() - self._reaped_at < self._interval:
+            return 0
+        self._reaped_at = time.monotonic()
+        expired = self._model.lease_expires_at < self.now()
+        reaped = 0
+        for column, in_progress, pending in states:
+            reaped += session \
+                .query(self._model) \
+                .filter(column == in_progress, expired) \
+                .update({column: pending}, synchronize_session=False)
+        session \
+            .query(self._model) \
+            .filter(expired) \
+            .update(self.cleared(), synchronize_session=False)
+        session.commit()
+        if reaped > 0:
+            logging.warning(f'{colorama.Fore.LIGHTYELLOW_EX}'
+                            f'{reaped} stalled jobs with expired leases have been returned to pending.'
+                            f'{colorama.Fore.RESET}')
+        return reaped
+
+    def _run(self, db_engine: Engine):
+        while not self._stop.wait(self._interval):
+            session = Session(bind=db_engine)
+            try:
+                self.renew(session)
+            except Exception as e:
+                session.rollback()
+                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                              f'Failed to renew leases: {e}'
+                              f'{colorama.Fore.RESET}')
+            finally:
+                session.close()
+
+    def start(self, db_engine: Engine):
+        """Starts the heartbeat thread."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(db_engine,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,7 +1,7 @@
+import os
 import sys
 import time
 import pytz
-import simdjson as json
 import socket
 import warcio
 import random
@@ -9,19 +9,40 @@ import logging
 import pathlib
 import colorama
 import datetime
+import functools
+import http.client
 
 import db
+import lease
+import health
 import utils
 import models
 import configs
+import records
+import parallel
+import boilerplate
+import dedup
+import discovery
+import checkpoint
+import partition
+import selective
 
-from urllib.request import urlopen
+from collections import Counter
+from multiprocessing import Pool
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, NoResultFound
 
-CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 TIMEZONE = 'Asia/Shanghai'
+HTTP_ERRORS = (URLError, ConnectionError, TimeoutError, socket.gaierror, http.client.HTTPException)
 CONFIG_PATH = 'configs'
+LEASE_STATES = [(models.Data.download_state, models.Data.DOWNLOAD_DOWNLOADING, models.Data.DOWNLOAD_PENDING),
+                (models.Data.process_state, models.Data.PROCESS_PROCESSING, models.Data.PROCESS_PENDING)]
 
 
 def panic(message: str):
@@ -29,38 +50,196 @@ def panic(message: str):
     sys.exit(-1)
 
 
-def check_connectivity():
-    tries = 0
-    while True:
-        try:
-            urlopen(CONNECTIVITY_CHECK_URL, timeout=30)
-        except Exception as e:
-            if tries < RETRIES:
-                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                              f'Connectivity check failed: {e}'
-                              f'{colorama.Fore.RESET}')
-                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                time.sleep(RETRY_INTERVAL)
-                tries += 1
-            else:
-                panic(f'{colorama.Fore.LIGHTRED_EX}'
-                      f'Connectivity check failed after {RETRIES} retries.'
-                      f'{colorama.Fore.RESET}')
-            continue
-        break
-
-
-def process_data(processed_data: pathlib.Path, downloaded_data: pathlib.Path) -> int:
-    data_list = []
-    with open(downloaded_data, 'rb') as stream, open(processed_data, 'w') as out:
+def probe_database(db_engine: Engine):
+    with db_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def probe_stream_url_base():
+    try:
+        with urlopen(Request(STREAM_URL_BASE, method='HEAD'), timeout=SOCKET_TIMEOUT):
+            pass
+    except HTTPError:
+        # The server has answered, which is all the probe needs to know.
+        pass
+
+
+def register_health(db_engine: Optional[Engine], stream: bool = False):
+    """Tracks the database and, when streaming, Common Crawl. The local pipeline needs no internet access."""
+    if db_engine is not None:
+        health.register('database', (DBAPIError,),
+                        probe=functools.partial(probe_database, db_engine),
+                        threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
+    if stream:
+        health.register(urlparse(STREAM_URL_BASE).hostname, HTTP_ERRORS,
+                        probe=probe_stream_url_base,
+                        threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
+
+
+def output_of(uri: str) -> str:
+    """The path of the processed file of a segment, relative to `PROCESS_PATH`."""
+    return records.with_format(uri, OUTPUT_FORMAT).as_posix()
+
+
+def log_counts(counts: Counter, n_records: int):
+    """Logs the records of a segment rejected before decoding, by reason, those that failed to decode, and the
+    boilerplate and duplicates dropped."""
+    reasons = []
+    if PRECHECK is not None:
+        reasons += ['language', 'density'] + (['missed'] if PRECHECK.audit else [])
+    if BOILERPLATE is not None:
+        reasons.append('boilerplate')
+    if DEDUP_ENABLED:
+        reasons += ['duplicates'] + (['duplicate_lines'] if DEDUP_LINES else [])
+    if counts['errors'] > 0:
+        reasons.append('errors')
+    if len(reasons) == 0:
+        return
+    print()
+    logging.info(f'Records: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{records={n_records}, {", ".join(f"{reason}={counts[reason]}" for reason in reasons)}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+
+def retriable(e: Exception) -> bool:
+    """Whether a job may succeed on another try. A record that is not valid UTF-8 fails every time."""
+    return not isinstance(e, UnicodeDecodeError)
+
+
+def deduplicator() -> Optional[dedup.Deduplicator]:
+    return dedup.Deduplicator(lines=DEDUP_LINES) if DEDUP_ENABLED else None
+
+
+def resumed(processed_data: pathlib.Path,
+            resume: Optional[checkpoint.Checkpoint]) -> Tuple[Counter, int, Optional[dedup.Deduplicator]]:
+    """The counts, the number of records read and the deduplicator to start a segment with, or to go on from `resume`."""
+    seen = deduplicator()
+    if resume is None:
+        return Counter(), 0, seen
+    if seen is not None:
+        seen.restore(resume.dedup)
+        for data in checkpoint.written(processed_data):
+            seen.remember(data)
+    logging.info(f'Resumed from checkpoint: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{offset={resume.offset}, records={resume.n_records}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+    return Counter(resume.counts), resume.n_records, seen
+
+
+def checkpointer(processed_data: pathlib.Path, out: records.RecordWriter) -> Optional[checkpoint.Checkpointer]:
+    return checkpoint.Checkpointer(processed_data, out, CHECKPOINT_INTERVAL) if CHECKPOINT_ENABLED else None
+
+
+def process_stream(processed_data: pathlib.Path, stream: BinaryIO, resume: Optional[checkpoint.Checkpoint] = None,
+                   checkpoints: bool = False) -> Tuple[int, Counter]:
+    """Returns the size of the processed file and the counts of the records and lines dropped, see `log_counts`.
+
+    With `checkpoints`, `stream` is a file that is checkpointed as it goes, and `resume` the
+    checkpoint it has been sought to, if any.
+    """
+    counts, n_records, seen = resumed(processed_data, resume)
+    with records.RecordWriter(processed_data, append=resume is not None) as out:
+        saver = checkpointer(processed_data, out) if checkpoints else None
         progbar = utils.ProgBar()
-        for record in warcio.ArchiveIterator(stream):
-            data = utils.extract_chinese(record)
+        iterator = warcio.ArchiveIterator(stream)
+        for record in iterator:
+            stats = {}
+            data = utils.extract_chinese(record, PRECHECK, counts, DECODE_ERRORS, stats)
+            if BOILERPLATE is not None:
+                data = BOILERPLATE.strip(data, counts, stats)
             if data != '':
-                data_list.append(utils.dump_data(data, record))
+                data = utils.dump_data(data, record, stats)
+                if seen is not None:
+                    data = seen.dedup(data, counts)
+                if data is not None:
+                    out.write(data)
+            n_records += 1
             progbar.add(1)
-        out.write(json.dumps({'data': data_list}))
-    return processed_data.stat().st_size
+            if saver is not None and saver.due():
+                saver.save(iterator.get_record_offset() + iterator.get_record_length(), n_records, counts, seen)
+    log_counts(counts, n_records)
+    records.write_meta(processed_data, {'records': n_records, **counts})
+    return processed_data.stat().st_size, counts
+
+
+def process_records(processed_data: pathlib.Path, url: str,
+                    entries: List[selective.IndexEntry]) -> Tuple[int, int, Counter]:
+    """Fetches the indexed records of one WARC file by byte range and extracts them.
+
+    Returns the size of the processed file, the number of bytes transferred and the counts of
+    the records and lines dropped.
+    """
+    transferred = 0
+    counts = Counter()
+    seen = deduplicator()
+    with records.RecordWriter(processed_data) as out:
+        progbar = utils.ProgBar()
+        for start, end, batch in selective.plan_ranges(entries, max_gap=SELECTIVE_MAX_GAP, max_span=SELECTIVE_MAX_SPAN):
+            payload = selective.fetch_range(url, start, end, timeout=SOCKET_TIMEOUT)
+            transferred += len(payload)
+            for record in selective.records_in(payload, start, batch):
+                stats = {}
+                body = utils.filter_chinese(selective.html_to_text(record), stats)
+                if BOILERPLATE is not None:
+                    body = BOILERPLATE.strip(body, counts, stats)
+                if body != '':
+                    data = utils.dump_data(body, record, stats)
+                    if seen is not None:
+                        data = seen.dedup(data, counts)
+                    if data is not None:
+                        out.write(data)
+            progbar.add(len(batch))
+    log_counts(counts, len(entries))
+    records.write_meta(processed_data, {'records': len(entries), **counts})
+    return processed_data.stat().st_size, transferred, counts
+
+
+def process_parallel(processed_data: pathlib.Path, downloaded_data: pathlib.Path,
+                     resume: Optional[checkpoint.Checkpoint] = None) -> Tuple[int, Counter]:
+    """Extracts a segment span by span on `PARALLEL_PROCESSES` processes, keeping the order of the records.
+
+    The records are deduplicated here, in order, so that copies in different spans are found.
+    Checkpoints are taken between spans.
+    """
+    counts, n_records, seen = resumed(processed_data, resume)
+    spans = parallel.member_spans(downloaded_data, PARALLEL_SPAN_SIZE, 0 if resume is None else resume.offset)
+    with Pool(processes=PARALLEL_PROCESSES) as pool, \
+            records.RecordWriter(processed_data, append=resume is not None) as out:
+        saver = checkpointer(processed_data, out)
+        progbar = utils.ProgBar()
+        results = parallel.extract_spans(pool, downloaded_data, spans, PRECHECK, DECODE_ERRORS, BOILERPLATE)
+        for (_, end), (data_list, span_records, span_counts) in zip(spans, results):
+            counts.update(span_counts)
+            for data in data_list:
+                if seen is not None:
+                    data = seen.dedup(data, counts)
+                if data is not None:
+                    out.write(data)
+            n_records += span_records
+            progbar.add(span_records)
+            if saver is not None and saver.due():
+                saver.save(end, n_records, counts, seen)
+    log_counts(counts, n_records)
+    records.write_meta(processed_data, {'records': n_records, **counts})
+    return processed_data.stat().st_size, counts
+
+
+def process_data(processed_data: pathlib.Path, downloaded_data: pathlib.Path) -> Tuple[int, Counter]:
+    """Extracts a downloaded segment, from its last checkpoint if `CHECKPOINT_ENABLED`."""
+    resume = checkpoint.restore(processed_data, downloaded_data) if CHECKPOINT_ENABLED else None
+    if PARALLEL_ENABLED:
+        result = process_parallel(processed_data, downloaded_data, resume)
+    else:
+        with open(downloaded_data, 'rb') as stream:
+            if resume is not None:
+                stream.seek(resume.offset)
+            result = process_stream(processed_data, stream, resume, checkpoints=True)
+    checkpoint.discard(processed_data)
+    return result
 
 
 def find_worker_by_name(session: Session, name: str) -> models.Worker:
@@ -83,11 +262,14 @@ def find_job_by_uri(session: Session, uri: str) -> models.Data:
 
 def main():
     db_engine = db.db_connect(DB_CONF)
+    LEASES.start(db_engine)
+    register_health(db_engine)
     download_path = pathlib.Path(DOWNLOAD_PATH)
+    listing = discovery.Listing(DOWNLOAD_PATH, ttl=DISCOVERY_LISTING_TTL)
 
     while True:
         try:
-            check_connectivity()
+            health.wait()
         except KeyboardInterrupt:
             logging.info(f'Bye.')
             return
@@ -98,6 +280,35 @@ def main():
         tries = 0
         while True:
             try:
+                if DISCOVERY_ENABLED:
+                    LEASES.reap(session, LEASE_STATES)
+                    session.begin()
+                    job = discovery.find_job(session, listing, DISCOVERY_DOWNLOADERS, DISCOVERY_BATCH_SIZE, SYNC)
+                    if job is None:
+                        session.commit()
+                        session.close()
+                        if len(listing.uris()) == 0:
+                            logging.info('No unclaimed job found. This program is about to exit.')
+                            return
+                        logging.warning(f'{colorama.Fore.LIGHTYELLOW_EX}'
+                                        f'The files in the download folder are not in the database or are being '
+                                        f'processed by other workers.'
+                                        f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds.')
+                        time.sleep(RETRY_INTERVAL)
+                        continue
+                    uri = job.uri
+                    job.process_state = models.Data.PROCESS_PROCESSING
+                    LEASES.take(job)
+                    session.add(job)
+                    session.commit()
+                    logging.info(f'New job fetched: '
+                                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                                 f'{{id={job.id}, uri={job.uri}}}'
+                                 f'{colorama.Fore.RESET}'
+                                 f'.')
+                    session.close()
+                    break
                 logging.info('Scanning download folder...')
                 data_list = list(download_path.rglob('*.warc.wet.gz'))
                 if len(data_list) == 0:
@@ -105,6 +316,7 @@ def main():
                     return
                 file = random.choice(data_list)
                 uri = str(file.relative_to(DOWNLOAD_PATH).as_posix())
+                LEASES.reap(session, LEASE_STATES)
                 session.begin()
                 if SYNC:
                     job: models.Data = session \
@@ -135,6 +347,7 @@ def main():
                     time.sleep(RETRY_INTERVAL)
                     continue
                 job.process_state = models.Data.PROCESS_PROCESSING
+                LEASES.take(job)
                 session.add(job)
                 session.commit()
                 logging.info(f'New job fetched: '
@@ -144,6 +357,7 @@ def main():
                              f'.')
                 session.close()
             except Exception as e:
+                health.record(e)
                 if tries < RETRIES:
                     session.rollback()
                     logging.error(f'{colorama.Fore.LIGHTRED_EX}'
@@ -165,21 +379,26 @@ def main():
             while True:
                 try:
                     downloaded_data = pathlib.Path(DOWNLOAD_PATH).joinpath(uri)
-                    processed_data = pathlib.Path(PROCESS_PATH).joinpath(uri).with_suffix('.json')
+                    processed_data = pathlib.Path(PROCESS_PATH).joinpath(output_of(uri))
                     processed_data.parent.mkdir(parents=True, exist_ok=True)
-                    size = process_data(processed_data, downloaded_data)
+                    size, counts = process_data(processed_data, downloaded_data)
                     print()
                     worker = find_worker_by_name(session=session, name=WORKER_NAME)
                     processed_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
                     job = find_job_by_uri(session, uri)
                     process = models.Process(data=job,
                                              size=size,
+                                             errors=counts['errors'],
+                                             duplicates=counts['duplicates'],
+                                             duplicate_lines=counts['duplicate_lines'],
                                              processed_at=processed_at,
                                              worker=worker,
-                                             uri=pathlib.Path(uri).with_suffix('.json'))
+                                             uri=output_of(uri))
                     session.add(process)
                     job.process_state = models.Data.PROCESS_FINISHED
+                    LEASES.drop(job)
                     downloaded_data.unlink()
+                    health.succeeded()
                     logging.info(f'Job '
                                  f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
                                  f'succeeded'
@@ -189,7 +408,8 @@ def main():
                 except KeyboardInterrupt:
                     raise KeyboardInterrupt
                 except Exception as e:
-                    if tries < RETRIES:
+                    health.record(e)
+                    if tries < RETRIES and retriable(e):
                         logging.error(f'{colorama.Fore.LIGHTRED_EX}'
                                       f'An error has occurred: {e}'
                                       f'{colorama.Fore.RESET}')
@@ -197,8 +417,411 @@ def main():
                         time.sleep(RETRY_INTERVAL)
                         tries += 1
                     else:
+                        checkpoint.discard(processed_data)
                         job = find_job_by_uri(session=session, uri=uri)
                         job.process_state = models.Data.PROCESS_FAILED
+                        LEASES.drop(job)
+                        logging.error(f'Job '
+                                      f'{colorama.Back.RED}'
+                                      f'failed'
+                                      f'{colorama.Back.RESET}'
+                                      f'.')
+                        break
+
+            session.add(job)
+            session.commit()
+            session.close()
+
+        except KeyboardInterrupt:
+            job = find_job_by_uri(session=session, uri=uri)
+            job.process_state = models.Data.PROCESS_PENDING
+            LEASES.drop(job)
+            logging.warning(f'Job '
+                            f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
+                            f'cancelled'
+                            f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                            f'.')
+            session.add(job)
+            session.commit()
+            session.close()
+            return
+
+
+def partition_main():
+    """Processes worker `PARTITION_INDEX` of `PARTITION_COUNT`'s share of the download folder without the database.
+
+    The outcome of every job goes to the local journal instead, and `reconcile.py` syncs
+    the journals into the process and data tables later in bulk.
+    """
+    if not 0 <= PARTITION_INDEX < PARTITION_COUNT:
+        panic(f'{colorama.Fore.LIGHTRED_EX}'
+              f'Partition index {PARTITION_INDEX} is out of range for {PARTITION_COUNT} partitions.'
+              f'{colorama.Fore.RESET}')
+    download_path = pathlib.Path(DOWNLOAD_PATH)
+    logging.info('Scanning download folder...')
+    # A file whose job has been journaled but not yet deleted is simply processed again.
+    uris = [uri for uri in (file.relative_to(DOWNLOAD_PATH).as_posix() for file in download_path.rglob('*.warc.wet.gz'))
+            if partition.owns(uri, PARTITION_INDEX, PARTITION_COUNT)]
+    logging.info(f'Partition loaded: '
+                 f'{colorama.Fore.LIGHTMAGENTA_EX}'
+                 f'{{index={PARTITION_INDEX}, count={PARTITION_COUNT}, jobs={len(uris)}, journal={JOURNAL.path}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+    try:
+        for uri in uris:
+            logging.info(f'New job fetched: '
+                         f'{colorama.Fore.LIGHTCYAN_EX}'
+                         f'{{uri={uri}}}'
+                         f'{colorama.Fore.RESET}'
+                         f'.')
+            tries = 0
+            while True:
+                try:
+                    downloaded_data = pathlib.Path(DOWNLOAD_PATH).joinpath(uri)
+                    processed_data = pathlib.Path(PROCESS_PATH).joinpath(output_of(uri))
+                    processed_data.parent.mkdir(parents=True, exist_ok=True)
+                    size, counts = process_data(processed_data, downloaded_data)
+                    print()
+                    JOURNAL.append(uri=uri,
+                                   state=partition.FINISHED,
+                                   size=size,
+                                   errors=counts['errors'],
+                                   duplicates=counts['duplicates'],
+                                   duplicate_lines=counts['duplicate_lines'],
+                                   output=output_of(uri),
+                                   worker=WORKER_NAME,
+                                   processed_at=datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).isoformat())
+                    downloaded_data.unlink()
+                    logging.info(f'Job '
+                                 f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
+                                 f'succeeded'
+                                 f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                                 f'.')
+                    break
+                except KeyboardInterrupt:
+                    raise KeyboardInterrupt
+                except Exception as e:
+                    if tries < RETRIES and retriable(e):
+                        logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                      f'An error has occurred: {e}'
+                                      f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        time.sleep(RETRY_INTERVAL)
+                        tries += 1
+                    else:
+                        checkpoint.discard(processed_data)
+                        JOURNAL.append(uri=uri,
+                                       state=partition.FAILED,
+                                       worker=WORKER_NAME,
+                                       processed_at=datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).isoformat())
+                        logging.error(f'Job '
+                                      f'{colorama.Back.RED}'
+                                      f'failed'
+                                      f'{colorama.Back.RESET}'
+                                      f'.')
+                        break
+        logging.info('No job left in this partition. This program is about to exit.')
+
+    except KeyboardInterrupt:
+        logging.warning(f'Job '
+                        f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
+                        f'cancelled'
+                        f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                        f'.')
+    finally:
+        JOURNAL.close()
+
+
+def stream_main():
+    """Downloads and extracts segments in one pass, without storing the `.warc.wet.gz` files."""
+    db_engine = db.db_connect(DB_CONF)
+    LEASES.start(db_engine)
+    register_health(db_engine, stream=True)
+
+    while True:
+        try:
+            health.wait()
+        except KeyboardInterrupt:
+            logging.info(f'Bye.')
+            return
+
+        logging.info('Fetching a new job...')
+        session = Session(bind=db_engine)
+        uri = None
+        tries = 0
+        while True:
+            try:
+                LEASES.reap(session, LEASE_STATES)
+                session.begin()
+                job: models.Data = session \
+                    .query(models.Data) \
+                    .with_for_update(of=models.Data, skip_locked=True) \
+                    .filter_by(download_state=models.Data.DOWNLOAD_PENDING,
+                               process_state=models.Data.PROCESS_PENDING) \
+                    .first()
+                if job is None:
+                    logging.info('No unclaimed job found. This program is about to exit.')
+                    session.close()
+                    return
+                uri = job.uri
+                job.started_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
+                job.download_state = models.Data.DOWNLOAD_DOWNLOADING
+                job.process_state = models.Data.PROCESS_PROCESSING
+                LEASES.take(job)
+                session.add(job)
+                session.commit()
+                logging.info(f'New job fetched: '
+                             f'{colorama.Fore.LIGHTCYAN_EX}'
+                             f'{{id={job.id}, uri={job.uri}}}'
+                             f'{colorama.Fore.RESET}'
+                             f'.')
+                session.close()
+            except Exception as e:
+                health.record(e)
+                if tries < RETRIES:
+                    session.rollback()
+                    logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                  f'An error has occurred: {e}'
+                                  f'{colorama.Fore.RESET}')
+                    logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                    time.sleep(RETRY_INTERVAL)
+                    tries += 1
+                else:
+                    panic(f'{colorama.Fore.LIGHTRED_EX}'
+                          f'Failed to fetch a new job after {RETRIES} retries.'
+                          f'{colorama.Fore.RESET}')
+                continue
+            break
+
+        url = f'{STREAM_URL_BASE}/{uri}'
+        logging.info(f'Stream from '
+                     f'{colorama.Fore.LIGHTCYAN_EX}'
+                     f'{url}'
+                     f'{colorama.Fore.RESET}')
+        session = Session(bind=db_engine)
+        try:
+            tries = 0
+            while True:
+                try:
+                    processed_data = pathlib.Path(PROCESS_PATH).joinpath(output_of(uri))
+                    processed_data.parent.mkdir(parents=True, exist_ok=True)
+                    with urlopen(url) as response:
+                        download_size = int(response.headers.get('Content-Length', -1))
+                        size, counts = process_stream(processed_data, response)
+                    print()
+                    worker = find_worker_by_name(session=session, name=WORKER_NAME)
+                    now = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
+                    job = find_job_by_uri(session, uri)
+                    process = models.Process(data=job,
+                                             size=size,
+                                             errors=counts['errors'],
+                                             duplicates=counts['duplicates'],
+                                             duplicate_lines=counts['duplicate_lines'],
+                                             processed_at=now,
+                                             worker=worker,
+                                             uri=output_of(uri))
+                    session.add(process)
+                    job.worker = worker
+                    job.finished_at = now
+                    job.size = download_size
+                    job.download_state = models.Data.DOWNLOAD_FINISHED
+                    job.process_state = models.Data.PROCESS_FINISHED
+                    LEASES.drop(job)
+                    health.succeeded()
+                    logging.info(f'Job '
+                                 f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
+                                 f'succeeded'
+                                 f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                                 f'.')
+                    break
+                except KeyboardInterrupt:
+                    raise KeyboardInterrupt
+                except Exception as e:
+                    health.record(e)
+                    if tries < RETRIES and retriable(e):
+                        session.rollback()
+                        logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                      f'An error has occurred: {e}'
+                                      f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        time.sleep(RETRY_INTERVAL)
+                        tries += 1
+                    else:
+                        job = find_job_by_uri(session=session, uri=uri)
+                        job.download_state = models.Data.DOWNLOAD_FAILED
+                        job.process_state = models.Data.PROCESS_PENDING
+                        LEASES.drop(job)
+                        logging.error(f'Job '
+                                      f'{colorama.Back.RED}'
+                                      f'failed'
+                                      f'{colorama.Back.RESET}'
+                                      f'.')
+                        break
+
+            session.add(job)
+            session.commit()
+            session.close()
+
+        except KeyboardInterrupt:
+            session.rollback()
+            job = find_job_by_uri(session=session, uri=uri)
+            job.started_at = None
+            job.download_state = models.Data.DOWNLOAD_PENDING
+            job.process_state = models.Data.PROCESS_PENDING
+            LEASES.drop(job)
+            logging.warning(f'Job '
+                            f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
+                            f'cancelled'
+                            f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                            f'.')
+            session.add(job)
+            session.commit()
+            session.close()
+            return
+
+
+def selective_main():
+    """Fetches only the records the index marks as Chinese, by byte range from the WARC files.
+
+    Jobs are still the WET segments of the data table; every segment is served from the
+    WARC file of the same name, and its output replaces what stream mode would write.
+    """
+    db_engine = db.db_connect(DB_CONF)
+    LEASES.start(db_engine)
+    register_health(db_engine, stream=True)
+    logging.info('Loading index...')
+    index: Dict[str, List[selective.IndexEntry]] = {
+        selective.wet_of(filename): entries
+        for filename, entries in selective.load_index(SELECTIVE_INDEX, SELECTIVE_LANGUAGES).items()
+    }
+    logging.info(f'Index loaded: '
+                 f'{colorama.Fore.LIGHTMAGENTA_EX}'
+                 f'{{files={len(index)}, records={sum(len(entries) for entries in index.values())}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+    candidates = list(index)
+
+    while True:
+        try:
+            health.wait()
+        except KeyboardInterrupt:
+            logging.info(f'Bye.')
+            return
+
+        logging.info('Fetching a new job...')
+        session = Session(bind=db_engine)
+        uri = None
+        tries = 0
+        while True:
+            try:
+                if len(candidates) == 0:
+                    logging.info('No unclaimed job found. This program is about to exit.')
+                    session.close()
+                    return
+                uri = candidates.pop(random.randrange(len(candidates)))
+                LEASES.reap(session, LEASE_STATES)
+                session.begin()
+                job: models.Data = session \
+                    .query(models.Data) \
+                    .with_for_update(of=models.Data, skip_locked=True) \
+                    .filter_by(uri=uri,
+                               download_state=models.Data.DOWNLOAD_PENDING,
+                               process_state=models.Data.PROCESS_PENDING) \
+                    .first()
+                if job is None:
+                    # Done, failed or being processed by another worker.
+                    session.commit()
+                    continue
+                job.started_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
+                job.download_state = models.Data.DOWNLOAD_DOWNLOADING
+                job.process_state = models.Data.PROCESS_PROCESSING
+                LEASES.take(job)
+                session.add(job)
+                session.commit()
+                logging.info(f'New job fetched: '
+                             f'{colorama.Fore.LIGHTCYAN_EX}'
+                             f'{{id={job.id}, uri={job.uri}, records={len(index[uri])}}}'
+                             f'{colorama.Fore.RESET}'
+                             f'.')
+                session.close()
+            except Exception as e:
+                health.record(e)
+                if tries < RETRIES:
+                    session.rollback()
+                    if uri is not None:
+                        candidates.append(uri)
+                    logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                  f'An error has occurred: {e}'
+                                  f'{colorama.Fore.RESET}')
+                    logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                    time.sleep(RETRY_INTERVAL)
+                    tries += 1
+                else:
+                    panic(f'{colorama.Fore.LIGHTRED_EX}'
+                          f'Failed to fetch a new job after {RETRIES} retries.'
+                          f'{colorama.Fore.RESET}')
+                continue
+            break
+
+        url = f'{STREAM_URL_BASE}/{selective.warc_of(uri)}'
+        logging.info(f'Fetch records from '
+                     f'{colorama.Fore.LIGHTCYAN_EX}'
+                     f'{url}'
+                     f'{colorama.Fore.RESET}')
+        session = Session(bind=db_engine)
+        try:
+            tries = 0
+            while True:
+                try:
+                    processed_data = pathlib.Path(PROCESS_PATH).joinpath(output_of(uri))
+                    processed_data.parent.mkdir(parents=True, exist_ok=True)
+                    size, transferred, counts = process_records(processed_data, url, index[uri])
+                    print()
+                    worker = find_worker_by_name(session=session, name=WORKER_NAME)
+                    now = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
+                    job = find_job_by_uri(session, uri)
+                    process = models.Process(data=job,
+                                             size=size,
+                                             duplicates=counts['duplicates'],
+                                             duplicate_lines=counts['duplicate_lines'],
+                                             processed_at=now,
+                                             worker=worker,
+                                             uri=output_of(uri))
+                    session.add(process)
+                    job.worker = worker
+                    job.finished_at = now
+                    job.size = transferred
+                    job.download_state = models.Data.DOWNLOAD_FINISHED
+                    job.process_state = models.Data.PROCESS_FINISHED
+                    LEASES.drop(job)
+                    health.succeeded()
+                    logging.info(f'Job '
+                                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                                 f'{{transferred={transferred}}}'
+                                 f'{colorama.Fore.RESET} '
+                                 f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
+                                 f'succeeded'
+                                 f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                                 f'.')
+                    break
+                except KeyboardInterrupt:
+                    raise KeyboardInterrupt
+                except Exception as e:
+                    health.record(e)
+                    if tries < RETRIES:
+                        session.rollback()
+                        logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                      f'An error has occurred: {e}'
+                                      f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        time.sleep(RETRY_INTERVAL)
+                        tries += 1
+                    else:
+                        job = find_job_by_uri(session=session, uri=uri)
+                        job.download_state = models.Data.DOWNLOAD_FAILED
+                        job.process_state = models.Data.PROCESS_PENDING
+                        LEASES.drop(job)
                         logging.error(f'Job '
                                       f'{colorama.Back.RED}'
                                       f'failed'
@@ -211,8 +834,12 @@ def main():
             session.close()
 
         except KeyboardInterrupt:
+            session.rollback()
             job = find_job_by_uri(session=session, uri=uri)
+            job.started_at = None
+            job.download_state = models.Data.DOWNLOAD_PENDING
             job.process_state = models.Data.PROCESS_PENDING
+            LEASES.drop(job)
             logging.warning(f'Job '
                             f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
                             f'cancelled'
@@ -234,9 +861,66 @@ if __name__ == '__main__':
     DOWNLOAD_PATH = config.get('worker', 'download_path')
     PROCESS_PATH = config.get('worker', 'process_path')
     SYNC = config.getboolean('worker', 'sync')
+    DECODE_ERRORS = config.get('worker', 'decode_errors')
+    if DECODE_ERRORS not in utils.DECODE_POLICIES:
+        panic(f'Unknown decoding policy {DECODE_ERRORS}, expected one of {", ".join(utils.DECODE_POLICIES)}.')
+    OUTPUT_FORMAT = config.get('worker', 'output_format')
+    if OUTPUT_FORMAT not in records.FORMATS:
+        panic(f'Unknown output format {OUTPUT_FORMAT}, expected one of {", ".join(records.FORMATS)}.')
+    LEASES = lease.Leases(models.Data,
+                          owner=lease.default_owner(WORKER_NAME),
+                          duration=config.getint('lease', 'duration'),
+                          interval=config.getint('lease', 'heartbeat_interval'),
+                          timezone=TIMEZONE)
+    HEALTH_THRESHOLD = config.getint('health', 'threshold')
+    HEALTH_BACKOFF = config.getfloat('health', 'backoff')
+    HEALTH_MAX_BACKOFF = config.getfloat('health', 'max_backoff')
+    STREAM_ENABLED = config.getboolean('stream', 'enabled')
+    STREAM_URL_BASE = config.get('stream', 'url_base')
+    PARTITION_ENABLED = config.getboolean('partition', 'enabled')
+    PARTITION_INDEX = int(os.environ.get('PARTITION_INDEX', config.get('partition', 'index')))
+    PARTITION_COUNT = config.getint('partition', 'count')
+    JOURNAL = partition.Journal(pathlib.Path(config.get('partition', 'journal_path'))
+                                .joinpath(f'{PARTITION_INDEX}-of-{PARTITION_COUNT}.jsonl'))
+    SELECTIVE_ENABLED = config.getboolean('selective', 'enabled')
+    SELECTIVE_INDEX = [source.strip() for source in config.get('selective', 'index').split(',') if source.strip()]
+    SELECTIVE_LANGUAGES = {language.strip() for language in config.get('selective', 'languages').split(',')}
+    SELECTIVE_MAX_GAP = config.getint('selective', 'max_gap')
+    SELECTIVE_MAX_SPAN = config.getint('selective', 'max_span')
+    DISCOVERY_ENABLED = config.getboolean('discovery', 'enabled')
+    DISCOVERY_DOWNLOADERS = [name.strip() for name in config.get('discovery', 'downloaders').split(',') if name.strip()]
+    DISCOVERY_LISTING_TTL = config.getfloat('discovery', 'listing_ttl')
+    DISCOVERY_BATCH_SIZE = config.getint('discovery', 'batch_size')
+    PRECHECK = utils.Precheck(
+        languages=frozenset(language.strip() for language in config.get('precheck', 'languages').split(',')),
+        sample_size=config.getint('precheck', 'sample_size'),
+        min_density=config.getfloat('precheck', 'min_density'),
+        audit=config.getboolean('precheck', 'audit')
+    ) if config.getboolean('precheck', 'enabled') else None
+    BOILERPLATE = boilerplate.Filter(
+        sketch=config.get('boilerplate', 'sketch'),
+        fraction=config.getfloat('boilerplate', 'fraction'),
+        min_documents=config.getint('boilerplate', 'min_documents')
+    ) if config.getboolean('boilerplate', 'enabled') else None
+    DEDUP_ENABLED = config.getboolean('dedup', 'enabled')
+    DEDUP_LINES = config.getboolean('dedup', 'lines')
+    PARALLEL_ENABLED = config.getboolean('parallel', 'enabled')
+    PARALLEL_PROCESSES = config.getint('parallel', 'processes') or os.cpu_count()
+    PARALLEL_SPAN_SIZE = config.getint('parallel', 'span_size')
+    CHECKPOINT_ENABLED = config.getboolean('checkpoint', 'enabled')
+    CHECKPOINT_INTERVAL = config.getfloat('checkpoint', 'interval')
+    if CHECKPOINT_ENABLED and OUTPUT_FORMAT == records.JSON:
+        panic(f'Checkpoints need an output format of JSON lines, not {OUTPUT_FORMAT}.')
 
     colorama.init()
     logging.basicConfig(level=logging.INFO,
                         format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
     socket.setdefaulttimeout(SOCKET_TIMEOUT)
-    main()
+    if PARTITION_ENABLED:
+        partition_main()
+    elif SELECTIVE_ENABLED:
+        selective_main()
+    elif STREAM_ENABLED:
+        stream_main()
+    else:
+        main()
@@ -26,6 +26,8 @@ class Data(Base):
     download_state = Column(SmallInteger, nullable=False, default=0)
     id_worker = Column(Integer, ForeignKey('worker.id'))
     archive = Column(String(30))
+    lease_owner = Column(String(128))
+    lease_expires_at = Column(DateTime)
 
     worker = relationship('Worker', back_populates='data')
     process = relationship('Process', uselist=False, back_populates='data')
@@ -37,6 +39,9 @@ class Process(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     id_data = Column(Integer, ForeignKey('data.id'), nullable=False)
     size = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    duplicates = Column(Integer, nullable=False, default=0)
+    duplicate_lines = Column(Integer, nullable=False, default=0)
     processed_at = Column(DateTime)
     id_worker = Column(Integer, ForeignKey('worker.id'))
     uri = Column(String(256))
@@ -0,0 +1,107 @@
+import io
+import os
+import zlib
+import pathlib
+import warcio
+
+import utils
+import boilerplate
+
+from collections import Counter
+from multiprocessing.pool import Pool
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+GZIP_MAGIC = b'\x1f\x8b\x08'
+WARC_MAGIC = b'WARC/'
+PROBE_SIZE = 64 * 1024
+
+
+def is_member_start(f: io.BufferedIOBase, offset: int) -> bool:
+    """Whether a gzip member holding a WARC record starts at `offset`.
+
+    The gzip magic also turns up inside compressed data, so a candidate only counts if it
+    inflates and the inflated bytes begin a WARC record.
+    """
+    f.seek(offset)
+    try:
+        return zlib.decompressobj(wbits=31).decompress(f.read(PROBE_SIZE), len(WARC_MAGIC)) == WARC_MAGIC
+    except zlib.error:
+        return False
+
+
+def next_member(f: io.BufferedIOBase, offset: int, end: int) -> int:
+    """The offset of the first gzip member starting in `[offset, end)`, or `end` if there is none."""
+    while offset < end:
+        f.seek(offset)
+        window = f.read(min(end - offset, PROBE_SIZE) + len(GZIP_MAGIC) - 1)
+        position = window.find(GZIP_MAGIC)
+        while position != -1:
+            if offset + position >= end:
+                return end
+            if is_member_start(f, offset + position):
+                return offset + position
+            position = window.find(GZIP_MAGIC, position + 1)
+        offset += PROBE_SIZE
+    return end
+
+
+def member_spans(path: Union[str, pathlib.Path], span_size: int, start: int = 0) -> List[Tuple[int, int]]:
+    """Cuts a multi-member `.warc.wet.gz` into byte spans of about `span_size` that begin and end on member boundaries.
+
+    A single-member file, or one whose members cannot be told apart, is one span. The spans
+    begin at `start`, which must be a member boundary, such as the offset of a checkpoint.
+    """
+    size = os.path.getsize(path)
+    if start >= size:
+        return []
+    starts = [start]
+    with open(path, 'rb') as f:
+        for offset in range(start + span_size, size, span_size):
+            if offset > starts[-1]:
+                member = next_member(f, offset, size)
+                if member < size:
+                    starts.append(member)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def extract_span(path: str, start: int, end: int, precheck: Optional[utils.Precheck] = None,
+                 policy: str = 'strict',
+                 boilerplate_filter: Optional[boilerplate.Filter] = None) -> Tuple[List[Dict], int, Counter]:
+    """Extracts the records of one span.
+
+    Returns the records kept, the number of records read, and the rejections of `precheck` by
+    reason along with the decoding errors and the boilerplate lines dropped.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        stream = io.BytesIO(f.read(end - start))
+    data_list = []
+    n_records = 0
+    counts = Counter()
+    for record in warcio.ArchiveIterator(stream):
+        stats = {}
+        data = utils.extract_chinese(record, precheck, counts, policy, stats)
+        if boilerplate_filter is not None:
+            data = boilerplate_filter.strip(data, counts, stats)
+        if data != '':
+            data_list.append(utils.dump_data(data, record, stats))
+        n_records += 1
+    return data_list, n_records, counts
+
+
+def extract(pool: Pool, path: Union[str, pathlib.Path], span_size: int, precheck: Optional[utils.Precheck] = None,
+            policy: str = 'strict',
+            boilerplate_filter: Optional[boilerplate.Filter] = None) -> Iterator[Tuple[List[Dict], int, Counter]]:
+    """Extracts the spans of a segment on `pool`, yielding their results in the order of the file."""
+    return extract_spans(pool, path, member_spans(path, span_size), precheck, policy, boilerplate_filter)
+
+
+def extract_spans(pool: Pool, path: Union[str, pathlib.Path], spans: List[Tuple[int, int]],
+                  precheck: Optional[utils.Precheck] = None, policy: str = 'strict',
+                  boilerplate_filter: Optional[boilerplate.Filter] = None) -> Iterator[Tuple[List[Dict], int, Counter]]:
+    return pool.imap(_extract_span, [(str(path), start, end, precheck, policy, boilerplate_filter)
+                                     for start, end in spans])
+
+
+def _extract_span(args: Tuple) -> Tuple[List[Dict], int, Counter]:
+    return extract_span(*args)
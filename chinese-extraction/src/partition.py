@@ -0,0 +1,99 @@
+import os
+import zlib
+import json
+import logging
+import pathlib
+import datetime
+import colorama
+import threading
+
+from typing import Dict, Iterable, Iterator, Tuple
+
+FINISHED = 'finished'
+FAILED = 'failed'
+
+
+def partition_of(uri: str, count: int) -> int:
+    """A stable partition of `uri`. Python's `hash` is salted per process, so CRC32 is used instead."""
+    return zlib.crc32(uri.encode('utf-8')) % count
+
+
+def owns(uri: str, index: int, count: int) -> bool:
+    return partition_of(uri, count) == index
+
+
+def precedence(entry: Dict) -> Tuple[bool, datetime.datetime]:
+    """Orders the entries of a URI: a finished job wins over a failed one, then the latest one wins."""
+    return (entry['state'] == FINISHED,
+            datetime.datetime.fromisoformat(entry.get('finished_at') or entry['processed_at']))
+
+
+def merge(journals: Iterable['Journal']) -> Dict[str, Dict]:
+    """The entry of every URI across `journals` that takes `precedence`, whatever order they are read in.
+
+    A job may be journaled by several workers, e.g. when its lease ran out, so the last entry
+    of one journal can be older than the entry of another.
+    """
+    entries = {}
+    for journal in journals:
+        for uri, entry in journal.latest().items():
+            if uri not in entries or precedence(entry) > precedence(entries[uri]):
+                entries[uri] = entry
+    return entries
+
+
+class Journal:
+    """An append-only JSON lines file recording the outcome of every job, one line per job.
+
+    Lines are flushed and synced as they are written, so a crash loses at most the line
+    being written. A torn last line is skipped when the journal is read back.
+    """
+
+    def __init__(self, path: str):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __iter__(self) -> Iterator[Dict]:
+        if not self.path.exists():
+            return
+        with open(self.path, 'rb') as f:
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logging.warning(f'{colorama.Fore.LIGHTYELLOW_EX}'
+                                    f'Skipped a malformed line {n} of {self.path}.'
+                                    f'{colorama.Fore.RESET}')
+
+    def latest(self) -> Dict[str, Dict]:
+        """The entry of every URI that takes `precedence` over the others, as in `merge`."""
+        entries = {}
+        for entry in self:
+            uri = entry['uri']
+            if uri not in entries or precedence(entry) >= precedence(entries[uri]):
+                entries[uri] = entry
+        return entries
+
+    def append(self, **entry):
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, 'ab')
+                if self._file.tell() > 0:
+                    # Starts on a fresh line after a torn write.
+                    with open(self.path, 'rb') as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            self._file.write(b'\n')
+            self._file.write(json.dumps(entry).encode('utf-8') + b'\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
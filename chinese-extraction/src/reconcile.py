@@ -0,0 +1,101 @@
+import time
+import logging
+import pathlib
+import datetime
+import argparse
+import colorama
+
+import db
+import models
+import configs
+import partition
+
+from typing import Dict, List
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.engine import Engine
+
+CONFIG_PATH = 'configs'
+BATCH_SIZE = 5000
+
+
+def worker_ids(db_engine: Engine, names: List[str]) -> Dict[str, int]:
+    """Returns the ids of the named workers, creating the missing ones."""
+    table = models.Worker.__table__
+    with db_engine.begin() as connection:
+        ids = dict(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names))).all())
+        for name in names:
+            if name not in ids:
+                ids[name] = connection.execute(table.insert().values(name=name)).inserted_primary_key[0]
+    return ids
+
+
+def apply_batch(db_engine: Engine, entries: List[Dict]) -> int:
+    """Writes the journaled outcome of a batch of jobs into the process and data tables.
+
+    Segments that are already processed in the database, or that are not in the data table,
+    are left out. Returns the number of segments updated.
+    """
+    ids = worker_ids(db_engine, sorted({entry['worker'] for entry in entries}))
+    data = models.Data.__table__
+    with db_engine.begin() as connection:
+        pending = dict(connection.execute(
+            select(data.c.uri, data.c.id)
+            .where(data.c.uri.in_([entry['uri'] for entry in entries]),
+                   data.c.process_state != models.Data.PROCESS_FINISHED)
+        ).all())
+        entries = [entry for entry in entries if entry['uri'] in pending]
+        finished = [entry for entry in entries if entry['state'] == partition.FINISHED]
+        if len(finished) > 0:
+            connection.execute(
+                insert(models.Process.__table__)
+                .prefix_with('IGNORE', dialect='mysql')
+                .prefix_with('OR IGNORE', dialect='sqlite'),
+                [{'id_data': pending[entry['uri']],
+                  'size': entry['size'],
+                  'errors': entry.get('errors', 0),
+                  'duplicates': entry.get('duplicates', 0),
+                  'duplicate_lines': entry.get('duplicate_lines', 0),
+                  'processed_at': datetime.datetime.fromisoformat(entry['processed_at']),
+                  'id_worker': ids[entry['worker']],
+                  'uri': entry.get('output', pathlib.Path(entry['uri']).with_suffix('.json').as_posix())}
+                 for entry in finished])
+        if len(entries) > 0:
+            connection.execute(
+                update(data)
+                .where(data.c.id == bindparam('b_id'))
+                .values(process_state=bindparam('b_state'), lease_owner=None, lease_expires_at=None),
+                [{'b_id': pending[entry['uri']],
+                  'b_state': models.Data.PROCESS_FINISHED if entry['state'] == partition.FINISHED
+                  else models.Data.PROCESS_FAILED}
+                 for entry in entries])
+    return len(entries)
+
+
+def reconcile(db_engine: Engine, journals: List[str], batch_size: int = BATCH_SIZE):
+    start = time.time()
+    entries = list(partition.merge(partition.Journal(path) for path in journals).values())
+    updated = 0
+    for i in range(0, len(entries), batch_size):
+        updated += apply_batch(db_engine, entries[i:i + batch_size])
+        logging.info(f'{min(i + batch_size, len(entries))} of {len(entries)} journal entries applied.')
+    logging.info(f'Journals reconciled: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{journals={len(journals)}, entries={len(entries)}, updated={updated}, '
+                 f'time={time.time() - start:.2f}s}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Syncs the journals of partitioned workers into the process table.')
+    parser.add_argument('journals', type=str, nargs='+', help='journal files written in partition mode')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='segments per transaction')
+    args = parser.parse_args()
+
+    colorama.init()
+    logging.basicConfig(level=logging.INFO,
+                        format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
+    config = configs.config(CONFIG_PATH)
+    engine = db.db_connect(db.get_database_config(config))
+    reconcile(engine, args.journals, batch_size=args.batch_size)
+    engine.dispose()
@@ -0,0 +1,176 @@
+import os
+import gzip
+import pathlib
+import simdjson as json
+
+from typing import Dict, IO, Iterator, List, Optional, Tuple, Union
+
+JSON = 'json'
+JSONL = 'jsonl'
+JSONL_GZ = 'jsonl.gz'
+FORMATS = (JSONL_GZ, JSONL, JSON)
+COMPRESS_LEVEL = 6
+
+
+def format_of(path: Union[str, pathlib.Path]) -> str:
+    name = pathlib.Path(path).name
+    for format_ in FORMATS:
+        if name.endswith(f'.{format_}'):
+            return format_
+    raise ValueError(f'Unknown record format: {path}')
+
+
+def with_format(path: Union[str, pathlib.Path], format_: str) -> pathlib.Path:
+    """Replaces the suffix of a segment or record file, e.g. `X.warc.wet.gz` becomes `X.warc.wet.jsonl`."""
+    path = pathlib.Path(path)
+    name = path.name
+    for suffix in [f'.{format_}' for format_ in FORMATS] + ['.gz']:
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+            break
+    return path.with_name(f'{name}.{format_}')
+
+
+def glob(root: Union[str, pathlib.Path], stem: str = '*.warc.wet') -> List[pathlib.Path]:
+    """All record files under `root`, in any format."""
+    root = pathlib.Path(root)
+    return [file for format_ in FORMATS for file in root.rglob(f'{stem}.{format_}')]
+
+
+def part_of(path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """The file a `RecordWriter` of `path` writes to until it is closed."""
+    path = pathlib.Path(path)
+    return path.with_name(path.name + '.part')
+
+
+def meta_of(path: Union[str, pathlib.Path]) -> pathlib.Path:
+    """The metadata written next to a record file, e.g. the counts of the records dropped from it."""
+    path = pathlib.Path(path)
+    return path.with_name(path.name + '.meta')
+
+
+def write_meta(path: Union[str, pathlib.Path], meta: Dict):
+    meta_path = meta_of(path)
+    part = part_of(meta_path)
+    with open(part, 'w') as f:
+        f.write(json.dumps(meta))
+    os.replace(part, meta_path)
+
+
+def read_meta(path: Union[str, pathlib.Path]) -> Optional[Dict]:
+    meta_path = meta_of(path)
+    if not meta_path.exists():
+        return None
+    with open(meta_path, 'rb') as f:
+        return json.loads(f.read())
+
+
+def read_records(path: Union[str, pathlib.Path], format_: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """Yields `(id, record)` from a record file of any format, given by its suffix unless `format_` is set.
+
+    The legacy format is either `{"data": [record, ...]}`, where the ids are the positions
+    in the list, or `{id: record, ...}`. It is loaded at once; the JSON lines formats are
+    read one record at a time and carry their id in the record, if any.
+    """
+    format_ = format_ or format_of(path)
+    if format_ == JSON:
+        with open(path, 'rb') as f:
+            data = json.load(f)
+        if isinstance(data.get('data'), list):
+            yield from ((str(id_), record) for id_, record in enumerate(data['data']))
+        else:
+            yield from data.items()
+        return
+    with (gzip.open(path, 'rb') if format_ == JSONL_GZ else open(path, 'rb')) as f:
+        for n, line in enumerate(f):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.pop('id', n)), record
+
+
+class RecordWriter:
+    """Writes records to `path` in the format given by its suffix.
+
+    JSON lines are written as the records come, into a `.part` file that is renamed once
+    the writer is closed, so that a partial file is never picked up by a later stage. The
+    legacy format has to be built in memory and is only written on close, as
+    `{id: record, ...}` if `keyed`, or else as `{"data": [record, ...]}`.
+
+    The JSON lines formats can be checkpointed, see `checkpoint`, and a later writer with
+    `append` goes on with the `.part` file of an earlier one. Once checkpointed, the `.part`
+    file is kept if writing fails.
+    """
+
+    def __init__(self, path: Union[str, pathlib.Path], keyed: bool = False, append: bool = False):
+        self.path = pathlib.Path(path)
+        self.format = format_of(path)
+        self.keyed = keyed
+        self._part = part_of(self.path)
+        self._raw: Optional[IO[bytes]] = None
+        self._file: Optional[IO[bytes]] = None
+        self._list: List[Dict] = []
+        self._dict: Dict[str, Dict] = {}
+        self._checkpointed = append
+        if self.format in (JSONL_GZ, JSONL):
+            self._raw = open(self._part, 'ab' if append else 'wb')
+            self._file = self._raw
+        if self.format == JSONL_GZ:
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=COMPRESS_LEVEL)
+
+    def write(self, record: Dict, id_: Optional[str] = None):
+        if self._file is None:
+            if self.keyed:
+                self._dict[id_] = record
+            else:
+                self._list.append(record)
+            return
+        if id_ is not None:
+            record = {'id': id_, **record}
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+
+    def checkpoint(self) -> int:
+        """Flushes the records written so far to disk and returns the size of the `.part` file.
+
+        A `.jsonl.gz` file gets a new gzip member, so that it can be cut back to this size.
+        """
+        if self._file is None:
+            raise ValueError(f'Records in the {self.format} format cannot be checkpointed: {self.path}')
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        size = self._raw.tell()
+        if self._file is not self._raw:
+            self._file = gzip.GzipFile(fileobj=self._raw, mode='wb', compresslevel=COMPRESS_LEVEL)
+        self._checkpointed = True
+        return size
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._raw.close()
+
+    def close(self) -> int:
+        """Returns the size of the file written."""
+        if self._file is None:
+            with open(self._part, 'w') as f:
+                json.dump(self._dict if self.keyed else {'data': self._list}, f)
+        else:
+            self._close_files()
+        os.replace(self._part, self.path)
+        return self.path.stat().st_size
+
+    def discard(self):
+        self._close_files()
+        self._part.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        elif self._checkpointed:
+            self._close_files()
+        else:
+            self.discard()
@@ -0,0 +1,206 @@
+import io
+import re
+import csv
+import gzip
+import codecs
+import itertools
+import contextlib
+import collections
+import simdjson as json
+import warcio
+
+from html.parser import HTMLParser
+from typing import Dict, IO, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+from urllib.request import Request, urlopen
+from warcio.recordloader import ArcWarcRecord
+
+MAX_GAP = 64 * 1024
+MAX_SPAN = 16 * 1024 * 1024
+CHARSET_PATTERN = re.compile(rb'charset\s*=\s*["\']?\s*([-\w.:]+)', re.IGNORECASE)
+
+
+class IndexEntry(NamedTuple):
+    filename: str
+    offset: int
+    length: int
+    url: str
+    languages: Tuple[str, ...]
+
+
+def warc_of(wet_uri: str) -> str:
+    """Maps `.../wet/X.warc.wet.gz` to the WARC file of the same segment, `.../warc/X.warc.gz`."""
+    return re.sub(r'/wet/([^/]+)\.warc\.wet\.gz$', r'/warc/\1.warc.gz', wet_uri)
+
+
+def wet_of(warc_filename: str) -> str:
+    return re.sub(r'/warc/([^/]+)\.warc\.gz$', r'/wet/\1.warc.wet.gz', warc_filename)
+
+
+def _languages(value: Optional[str]) -> Tuple[str, ...]:
+    return tuple(language.strip() for language in (value or '').split(',') if language.strip())
+
+
+def parse_cdxj(line: str) -> Optional[IndexEntry]:
+    """Parses a line of the CDX index, `<surt> <timestamp> {"url": ..., "filename": ..., ...}`."""
+    start = line.find('{')
+    if start < 0:
+        return None
+    fields = json.loads(line[start:])
+    if 'filename' not in fields or 'offset' not in fields or 'length' not in fields:
+        return None
+    return IndexEntry(filename=fields['filename'],
+                      offset=int(fields['offset']),
+                      length=int(fields['length']),
+                      url=fields.get('url', ''),
+                      languages=_languages(fields.get('languages')))
+
+
+def parse_columnar(row: Dict[str, str]) -> IndexEntry:
+    """Parses a row exported from the columnar index with its column names as the CSV header."""
+    return IndexEntry(filename=row['warc_filename'],
+                      offset=int(row['warc_record_offset']),
+                      length=int(row['warc_record_length']),
+                      url=row.get('url', ''),
+                      languages=_languages(row.get('content_languages')))
+
+
+@contextlib.contextmanager
+def open_index(source: str) -> Iterator[IO[str]]:
+    """Opens a local or remote index file as text, decompressing it if it is gzipped."""
+    if re.match(r'https?://', source):
+        raw = urlopen(source)
+    else:
+        raw = open(source, 'rb')
+    with raw:
+        if source.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw) as stream:
+                yield io.TextIOWrapper(stream, encoding='utf-8')
+        else:
+            yield io.TextIOWrapper(raw, encoding='utf-8')
+
+
+def read_index(stream: IO[str]) -> Iterator[IndexEntry]:
+    """Reads CDXJ lines or a columnar index CSV export, telling them apart by the first line."""
+    first = stream.readline()
+    if 'warc_filename' in first:
+        for row in csv.DictReader(stream, fieldnames=next(csv.reader([first]))):
+            yield parse_columnar(row)
+        return
+    for line in itertools.chain([first], stream):
+        if line.strip():
+            entry = parse_cdxj(line)
+            if entry is not None:
+                yield entry
+
+
+def load_index(sources: Iterable[str], languages: Set[str]) -> Dict[str, List[IndexEntry]]:
+    """Returns the records in any of `languages`, grouped by WARC file and sorted by offset."""
+    files = collections.defaultdict(list)
+    for source in sources:
+        with open_index(source) as stream:
+            for entry in read_index(stream):
+                if languages.intersection(entry.languages):
+                    files[entry.filename].append(entry)
+    for entries in files.values():
+        entries.sort(key=lambda entry: entry.offset)
+    return dict(files)
+
+
+def plan_ranges(entries: Sequence[IndexEntry],
+                max_gap: int = MAX_GAP,
+                max_span: int = MAX_SPAN) -> List[Tuple[int, int, List[IndexEntry]]]:
+    """Merges records of one file into `(start, end, entries)` byte ranges.
+
+    Records less than `max_gap` bytes apart are fetched in a single request, as long as
+    the request stays within `max_span` bytes, which trades a little extra transfer for
+    fewer round trips.
+    """
+    ranges = []
+    for entry in sorted(entries, key=lambda entry: entry.offset):
+        end = entry.offset + entry.length
+        if len(ranges) > 0:
+            start, last, batch = ranges[-1]
+            if entry.offset - last <= max_gap and end - start <= max_span:
+                ranges[-1] = (start, max(last, end), batch + [entry])
+                continue
+        ranges.append((entry.offset, end, [entry]))
+    return ranges
+
+
+def fetch_range(url: str, start: int, end: int, timeout: Optional[float] = None) -> bytes:
+    request = Request(url, headers={'Range': f'bytes={start}-{end - 1}'})
+    with urlopen(request, timeout=timeout) as response:
+        if response.status != 206:
+            raise IOError(f'{url} does not support range requests (status {response.status}).')
+        data = response.read()
+    if len(data) != end - start:
+        raise IOError(f'Expected {end - start} bytes from {url}, got {len(data)}.')
+    return data
+
+
+def records_in(data: bytes, start: int, entries: Sequence[IndexEntry]) -> Iterator[ArcWarcRecord]:
+    """Yields the response records of `entries` from `data`, the bytes of the file from offset `start`.
+
+    Every record of a WARC file is a gzip member of its own, so each slice is readable on its own.
+    """
+    for entry in entries:
+        member = io.BytesIO(data[entry.offset - start:entry.offset - start + entry.length])
+        for record in warcio.ArchiveIterator(member):
+            if record.rec_type == 'response':
+                yield record
+
+
+class _TextParser(HTMLParser):
+    SKIPPED = {'script', 'style', 'noscript', 'template'}
+    BLOCKS = {'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+              'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav',
+              'ol', 'p', 'pre', 'section', 'table', 'td', 'th', 'title', 'tr', 'ul'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED:
+            self._skipping = max(self._skipping - 1, 0)
+        elif tag in self.BLOCKS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self._skipping == 0:
+            self.parts.append(data)
+
+
+def charset_of(record: ArcWarcRecord, payload: bytes) -> str:
+    match = None
+    if record.http_headers is not None:
+        content_type = record.http_headers.get_header('Content-Type') or ''
+        match = CHARSET_PATTERN.search(content_type.encode('latin-1', errors='replace'))
+    if match is None:
+        match = CHARSET_PATTERN.search(payload[:4096])
+    charset = match.group(1).decode('ascii').lower() if match is not None else 'utf-8'
+    # GB2312 and GBK pages routinely use characters only GB18030 covers.
+    if charset in ('gb2312', 'gbk', 'x-gbk'):
+        charset = 'gb18030'
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'utf-8'
+    return charset
+
+
+def html_to_text(record: ArcWarcRecord) -> str:
+    """Turns the HTML of a WARC response record into plain text lines, like the WET files have."""
+    payload = record.content_stream().read()
+    parser = _TextParser()
+    parser.feed(payload.decode(charset_of(record, payload), errors='replace'))
+    parser.close()
+    lines = (' '.join(line.split()) for line in ''.join(parser.parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
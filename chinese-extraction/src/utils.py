@@ -1,9 +1,11 @@
 import os
 import sys
 import time
+import hashlib
 import numpy as np
 
-from typing import Iterable, List, Dict, Optional
+from collections import Counter
+from typing import FrozenSet, Iterable, List, Dict, NamedTuple, Optional
 
 
 class ProgBar:
@@ -156,7 +158,8 @@ class ProgBar:
         self.update(self._seen_so_far + n, values)
 
 
-def dump_data(data: str, record) -> Dict:
+def dump_data(data: str, record, stats: Optional[Dict] = None) -> Dict:
+    """The record of the text extracted from a WARC record, with the `stats` of the text computed if not given."""
     url = record.rec_headers.get_header('WARC-Target-URI')
     date = record.rec_headers.get_header('WARC-Date')
     length = record.rec_headers.get_header('Content-Length')
@@ -165,35 +168,183 @@ def dump_data(data: str, record) -> Dict:
         'date': date,
         'content_length': int(length),
         'data': data,
-        'data_length': len(data)
+        'data_length': len(data),
+        'stats': text_stats(data) if stats is None else stats
     }
 
 
+def with_data(data: Dict, text: str) -> Dict:
+    """A record made by `dump_data` with its text replaced."""
+    return {**data, 'data': text, 'data_length': len(text), 'stats': text_stats(text)}
+
+
+CHINESE_RANGES = [('\u2000', '\u206f'), ('\u3000', '\u303f'), ('\u4e00', '\u9fef'), ('\uff00', '\uffef')]
+# Characters that do not count towards the length of a line. Note that `0` and `9` do count.
+IGNORED_CHARS = '12345678 .'
+
+
 def is_chinese_char(char: str) -> bool:
-    if '\u2000' < char < '\u206f' \
-            or '\u3000' < char < '\u303f' \
-            or '\u4e00' < char < '\u9fef' \
-            or '\uff00' < char < '\uffef':
-        return True
+    for start, end in CHINESE_RANGES:
+        if start < char < end:
+            return True
     return False
 
 
-def extract_chinese(record) -> str:
-    data = ''
-    lines = record.content_stream().read()
-    lines = str(lines, encoding='utf-8')
-    lines = lines.split('\n')
-    for line in lines:
-        n_valid_chars = len(line)
-        n_chinese_chars = 0
-        for ch in line:
-            if '0' < ch < '9' or ch == ' ' or ch == '.':
-                n_valid_chars -= 1
-            else:
-                n_chinese_chars += 1 if is_chinese_char(ch) else 0
-        if n_chinese_chars > n_valid_chars * 0.8 \
-                or n_chinese_chars > n_valid_chars * 0.7 and n_chinese_chars > 50 \
-                or n_chinese_chars > n_valid_chars * 0.6 and n_chinese_chars > 150:
-            data += line
-            data += '\n'
+def _char_classes() -> np.ndarray:
+    """The class of every code point of the BMP: 1 for Chinese, -1 for ignored and 0 for any other character."""
+    classes = np.zeros(0x10000, dtype=np.int8)
+    for start, end in CHINESE_RANGES:
+        classes[ord(start) + 1:ord(end)] = 1
+    classes[[ord(ch) for ch in IGNORED_CHARS]] = -1
+    return classes
+
+
+CHAR_CLASSES = _char_classes()
+
+DIGIT_CHARS = '0123456789\uff10\uff11\uff12\uff13\uff14\uff15\uff16\uff17\uff18\uff19'
+SPACE_CHARS = ' \t\r\x0b\x0c\xa0\u3000'
+SENTENCE_ENDS = '\u3002\uff01\uff1f\uff1b\u2026.!?;'
+DIGIT = 1
+SPACE = 2
+SENTENCE_END = 3
+
+
+def _stat_classes() -> np.ndarray:
+    """The class of every code point of the BMP for the `stats` of a record: digit, space, sentence end or 0."""
+    classes = np.zeros(0x10000, dtype=np.int8)
+    for class_, chars in [(DIGIT, DIGIT_CHARS), (SPACE, SPACE_CHARS), (SENTENCE_END, SENTENCE_ENDS)]:
+        classes[[ord(ch) for ch in chars]] = class_
+    return classes
+
+
+STAT_CLASSES = _stat_classes()
+
+
+def _code_points(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode('utf-32-le', errors='surrogatepass'), dtype=np.uint32)
+
+
+def _stats(text: str, chinese: np.ndarray, classes: np.ndarray, n_lines: int) -> Dict:
+    """The `stats` of `text`, from whether each of its characters is Chinese and its class in `STAT_CLASSES`."""
+    ends = np.flatnonzero(classes == SENTENCE_END)
+    return {
+        'chinese_chars': int(np.count_nonzero(chinese)),
+        'lines': n_lines,
+        'digits': int(np.count_nonzero(classes == DIGIT)),
+        'spaces': int(np.count_nonzero(classes == SPACE)),
+        'last_end': int(ends[-1]) if len(ends) > 0 else -1,
+        'hash': hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=8).hexdigest()
+    }
+
+
+def text_stats(text: str) -> Dict:
+    """The statistics of extracted text that the later stages would otherwise count again.
+
+    They are the counts of Chinese characters, lines, digits and spaces, the offset of the
+    last sentence end, or -1, and the hex of a 64-bit blake2b of the text as `hash`.
+    """
+    codes = _code_points(text)
+    bmp = np.minimum(codes, 0xffff)
+    return _stats(text, CHAR_CLASSES[bmp] == 1, STAT_CLASSES[bmp], int(np.count_nonzero(codes == ord('\n'))))
+
+
+LANGUAGE_HEADER = 'WARC-Identified-Content-Language'
+# Lead bytes of the 3-byte UTF-8 sequences, U+2000 to U+FFFF, which hold every Chinese range.
+CJK_LEAD_BYTES = bytes(range(0xe2, 0xf0))
+
+
+class Precheck(NamedTuple):
+    """Rejects records that are clearly not Chinese before their payload is decoded.
+
+    The language header of newer WET files is trusted when present, otherwise the first
+    `sample_size` bytes of the payload must have a density of CJK lead bytes of at least
+    `min_density`. With `audit`, rejected records are extracted all the same and kept, and
+    those that had Chinese lines are counted as `missed`.
+    """
+    languages: FrozenSet[str]
+    sample_size: int
+    min_density: float
+    audit: bool = False
+
+    def reject(self, record, sample: bytes) -> Optional[str]:
+        """The reason to reject the record, or None."""
+        languages = record.rec_headers.get_header(LANGUAGE_HEADER)
+        if languages is not None:
+            return None if self.languages.intersection(languages.split(',')) else 'language'
+        n_cjk = len(sample) - len(sample.translate(None, CJK_LEAD_BYTES))
+        return None if n_cjk >= len(sample) * self.min_density else 'density'
+
+
+DECODE_POLICIES = ('strict', 'replace', 'skip')
+
+
+def decode(payload: bytes, policy: str = 'strict', counts: Optional[Counter] = None) -> str:
+    """Decodes a payload as UTF-8.
+
+    A payload that is not valid UTF-8 raises with the `strict` policy, has its invalid bytes
+    replaced with `replace`, or is dropped as an empty string with `skip`. The last two are
+    counted as `errors` in `counts`.
+    """
+    try:
+        return str(payload, encoding='utf-8')
+    except UnicodeDecodeError:
+        if policy == 'strict':
+            raise
+        if counts is not None:
+            counts['errors'] += 1
+        return str(payload, encoding='utf-8', errors='replace') if policy == 'replace' else ''
+
+
+def extract_chinese(record, precheck: Optional[Precheck] = None, counts: Optional[Counter] = None,
+                    policy: str = 'strict', stats: Optional[Dict] = None) -> str:
+    """The Chinese lines of a record.
+
+    Rejections of `precheck` are counted by reason in `counts`, as are decoding errors, see `decode`.
+    `stats` is filled as by `filter_chinese`.
+    """
+    stream = record.content_stream()
+    if precheck is None:
+        return filter_chinese(decode(stream.read(), policy, counts), stats)
+    sample = stream.read(precheck.sample_size)
+    reason = precheck.reject(record, sample)
+    if reason is None:
+        return filter_chinese(decode(sample + stream.read(), policy, counts), stats)
+    if counts is not None:
+        counts[reason] += 1
+    if not precheck.audit:
+        return ''
+    data = filter_chinese(decode(sample + stream.read(), policy, counts), stats)
+    if counts is not None and data != '':
+        counts['missed'] += 1
+    return data
+
+
+def filter_chinese(text: str, stats: Optional[Dict] = None) -> str:
+    """Keeps the lines of `text` that are mostly Chinese, each followed by a newline.
+
+    The characters are classified in one pass with a lookup table over the UTF-32 code
+    points, and counted per line from cumulative sums, instead of looping in Python. If
+    given, `stats` is filled with the `text_stats` of the lines kept, from the same pass.
+    """
+    codes = _code_points(text)
+    # Code points beyond the BMP fall on U+FFFF, which is of class 0 like them.
+    bmp = np.minimum(codes, 0xffff)
+    classes = CHAR_CLASSES[bmp]
+    newlines = np.flatnonzero(codes == ord('\n'))
+    starts = np.concatenate(([0], newlines + 1))
+    ends = np.concatenate((newlines, [len(codes)]))
+    n_ignored = np.concatenate(([0], np.cumsum(classes == -1)))
+    n_chinese = np.concatenate(([0], np.cumsum(classes == 1)))
+    n_chinese_chars = n_chinese[ends] - n_chinese[starts]
+    n_valid_chars = ends - starts - (n_ignored[ends] - n_ignored[starts])
+    keep = (n_chinese_chars > n_valid_chars * 0.8) \
+        | (n_chinese_chars > n_valid_chars * 0.7) & (n_chinese_chars > 50) \
+        | (n_chinese_chars > n_valid_chars * 0.6) & (n_chinese_chars > 150)
+    lines = text.split('\n')
+    kept = np.flatnonzero(keep)
+    data = ''.join(lines[i] + '\n' for i in kept)
+    if stats is not None:
+        # Every line with its newline; the last line has none, but no character of it comes after.
+        mask = np.repeat(keep, ends - starts + 1)[:len(codes)]
+        stats.update(_stats(data, classes[mask] == 1, STAT_CLASSES[bmp[mask]], len(kept)))
     return data
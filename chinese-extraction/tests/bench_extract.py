@@ -0,0 +1,74 @@
+"""Measures `filter_chinese` in records per second against the original per-character loop.
+
+Runs on synthetic WET records by default, or on the records of a real segment:
+
+    python tests/bench_extract.py --records 2000
+    python tests/bench_extract.py --wet downloaded/crawl-data/.../CC-MAIN-...-00000.warc.wet.gz
+"""
+import sys
+import time
+import random
+import pathlib
+import argparse
+import warcio
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import test_extract
+import selective_server
+
+from typing import Callable, List
+
+
+def synthetic_records(n_records: int, chinese: float, seed: int = 0) -> List[str]:
+    """Pages of WET-like text lines, a share of them Chinese, with navigation and boilerplate lines mixed in."""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n_records):
+        is_chinese = rng.random() < chinese
+        lines = []
+        for _ in range(rng.randint(20, 80)):
+            if rng.random() < 0.3:
+                lines.append(' | '.join(rng.choice(selective_server.ENGLISH) for _ in range(rng.randint(2, 8))))
+            elif is_chinese:
+                lines.append(''.join(rng.choice(selective_server.CHINESE) for _ in range(rng.randint(10, 200))))
+            else:
+                lines.append(' '.join(rng.choice(selective_server.ENGLISH) for _ in range(rng.randint(5, 60))))
+        records.append('\n'.join(lines))
+    return records
+
+
+def wet_records(path: str, limit: int) -> List[str]:
+    records = []
+    with open(path, 'rb') as stream:
+        for record in warcio.ArchiveIterator(stream):
+            if record.rec_type == 'conversion':
+                records.append(str(record.content_stream().read(), encoding='utf-8'))
+                if len(records) >= limit:
+                    break
+    return records
+
+
+def measure(fn: Callable[[str], str], records: List[str]) -> float:
+    start = time.perf_counter()
+    for text in records:
+        fn(text)
+    return len(records) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='filter_chinese throughput benchmark.')
+    parser.add_argument('--records', type=int, default=2000, help='number of records')
+    parser.add_argument('--chinese', type=float, default=0.2, help='share of Chinese synthetic records')
+    parser.add_argument('--wet', type=str, default=None, help='read the records from a WET file instead')
+    args = parser.parse_args()
+
+    records = wet_records(args.wet, args.records) if args.wet else synthetic_records(args.records, args.chinese)
+    assert all(utils.filter_chinese(text) == test_extract.filter_chinese_loop(text) for text in records)
+    size = sum(len(text) for text in records) / 1024 / 1024
+    print(f'{len(records)} records, {size:.1f} M characters')
+    print(f'{"implementation":<16}{"records/s":>12}{"M chars/s":>12}')
+    for name, fn in [('loop', test_extract.filter_chinese_loop), ('vectorized', utils.filter_chinese)]:
+        rate = measure(fn, records)
+        print(f'{name:<16}{rate:>12.0f}{rate * size / len(records):>12.2f}')
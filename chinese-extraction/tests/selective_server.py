@@ -0,0 +1,131 @@
+"""A local stand-in for the Common Crawl bucket that serves a synthetic WARC file with its CDX index.
+
+    python tests/selective_server.py --records 200 --chinese 0.1 --port 8000
+"""
+import io
+import re
+import random
+import argparse
+import threading
+import simdjson as json
+
+from typing import List, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from warcio.warcwriter import WARCWriter
+from warcio.statusandheaders import StatusAndHeaders
+
+WARC_URI = 'crawl-data/CC-MAIN-TEST/segments/0/warc/CC-MAIN-TEST-00000.warc.gz'
+WET_URI = 'crawl-data/CC-MAIN-TEST/segments/0/wet/CC-MAIN-TEST-00000.warc.wet.gz'
+CHINESE = '的一是不了人我在有他这中大来上国个到说们为子和你地出道也时年得就那要下以生会自着去之过家学对可里后小么心多天而能好都然没日于起还发成事只作当想看无开手十用主行方又如前所本见经头面公同三已老从动两长知民样现'
+ENGLISH = 'the of and to in is was for that with as on by at from his her are this be which or it an had not'.split()
+
+
+def synthetic_page(rng: random.Random, chinese: bool) -> str:
+    paragraphs = []
+    for _ in range(rng.randint(3, 8)):
+        if chinese:
+            paragraphs.append(''.join(rng.choice(CHINESE) for _ in range(rng.randint(60, 200))) + '。')
+        else:
+            paragraphs.append(' '.join(rng.choice(ENGLISH) for _ in range(rng.randint(40, 120))) + '.')
+    body = ''.join(f'<p>{paragraph}</p>\n' for paragraph in paragraphs)
+    return f'<html><head><title>page</title><script>var x = 1;</script></head><body>\n{body}</body></html>'
+
+
+def synthetic_warc(n_records: int, chinese: float, seed: int = 0) -> Tuple[bytes, List[str], List[str]]:
+    """Returns a WARC file, its CDXJ index lines and the pages the index marks as Chinese.
+
+    Every other Chinese page is encoded in GBK with the charset only in its Content-Type.
+    """
+    rng = random.Random(seed)
+    out = io.BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    index = []
+    pages = []
+    for i in range(n_records):
+        is_chinese = rng.random() < chinese
+        page = synthetic_page(rng, is_chinese)
+        charset = 'gbk' if is_chinese and i % 2 == 0 else 'utf-8'
+        url = f'http://example.com/{i}'
+        http_headers = StatusAndHeaders('200 OK', [('Content-Type', f'text/html; charset={charset}')],
+                                        protocol='HTTP/1.1')
+        record = writer.create_warc_record(url, 'response', payload=io.BytesIO(page.encode(charset)),
+                                           http_headers=http_headers)
+        offset = out.tell()
+        writer.write_record(record)
+        fields = {'url': url, 'mime': 'text/html', 'status': '200', 'length': str(out.tell() - offset),
+                  'offset': str(offset), 'filename': WARC_URI, 'languages': 'zho' if is_chinese else 'eng'}
+        index.append(f'com,example)/{i} 20210101000000 {json.dumps(fields)}')
+        if is_chinese:
+            pages.append(page)
+    return out.getvalue(), index, pages
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'WarcServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if self.path.lstrip('/') != WARC_URI:
+            self.send_error(404)
+            return
+        data = self.server.data
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match is None:
+            self.send_response(200)
+            start, end = 0, len(data)
+        else:
+            start = int(match.group(1))
+            end = int(match.group(2)) + 1 if match.group(2) else len(data)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{len(data)}')
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        self.wfile.write(data[start:end])
+        self.server.transferred += end - start
+
+
+class WarcServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data: bytes, port: int = 0):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.data = data
+        self.transferred = 0
+        self._thread = None
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves a synthetic WARC file and writes its CDXJ index.')
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--chinese', type=float, default=0.1, help='share of Chinese pages')
+    parser.add_argument('--index', type=str, default='index.cdxj', help='where to write the index')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    warc, lines, _ = synthetic_warc(args.records, args.chinese)
+    with open(args.index, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    server = WarcServer(warc, port=args.port)
+    print(f'Serving {WARC_URI} ({len(warc)} bytes) at {server.start()}, index written to {args.index}.')
+    print(f'The matching job is {WET_URI}.')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,65 @@
+"""Checks the count-min sketch of lines and the boilerplate lines it drops.
+
+    python -m pytest tests/test_boilerplate.py
+"""
+import sys
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import records
+import boilerplate
+import selective_server
+
+from collections import Counter
+
+NAVIGATION = '首页 | 新闻 | 体育 | 财经 | 娱乐'
+FOOTER = '版权所有 ©2021 某某网站 京ICP备12345678号'
+
+
+def synthetic_pages(n_pages: int, seed: int = 0):
+    rng = random.Random(seed)
+    pages = []
+    for i in range(n_pages):
+        body = [''.join(rng.choice(selective_server.CHINESE) for _ in range(rng.randint(20, 80)))
+                for _ in range(rng.randint(1, 5))]
+        footer = FOOTER.replace('2021', str(2000 + i % 20))
+        pages.append(''.join(line + '\n' for line in [NAVIGATION] + body + [footer]))
+    return pages
+
+
+def test_sketch_never_underestimates():
+    rng = random.Random(0)
+    lines = [str(rng.randrange(5000)) + '中' for _ in range(20000)]
+    sketch = boilerplate.Sketch(width=1024, depth=3)
+    for i in range(0, len(lines), 10):
+        sketch.add(boilerplate.line_hashes(lines[i:i + 10]), 1)
+    exact = Counter(boilerplate.normalize(line) for line in lines)
+    distinct = list(exact)
+    estimates = sketch.estimate(boilerplate.line_hashes(distinct))
+    assert all(estimate >= exact[line] for line, estimate in zip(distinct, estimates))
+    assert sketch.documents == 2000
+
+
+def test_strip(tmp_path):
+    pages = synthetic_pages(200)
+    path = tmp_path.joinpath('0.warc.wet.jsonl')
+    with records.RecordWriter(path) as out:
+        for page in pages:
+            out.write({'data': page})
+    sketch = boilerplate.build(boilerplate.Sketch(width=1 << 16), [path], processes=2)
+    sketch.save(tmp_path.joinpath('sketch.npz'))
+    assert sketch.documents == 200
+
+    filter_ = boilerplate.Filter(sketch=str(tmp_path.joinpath('sketch.npz')), fraction=0.05, min_documents=10)
+    counts = Counter()
+    for page in pages:
+        stats = utils.text_stats(page)
+        stripped = filter_.strip(page, counts, stats)
+        lines = page.split('\n')[:-1]
+        assert stripped == ''.join(line + '\n' for line in lines[1:-1])
+        assert stats == utils.text_stats(stripped)
+    assert counts['boilerplate'] == 400
+    assert filter_.strip('') == ''
@@ -0,0 +1,88 @@
+"""Checks that an extraction stopped after a checkpoint resumes into the output of an extraction run at once.
+
+    python -m pytest tests/test_checkpoint.py
+"""
+import sys
+import pathlib
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import records
+import parallel
+import checkpoint
+import test_parallel
+
+from warcio.archiveiterator import ArchiveIterator
+
+
+class Stop(Exception):
+    pass
+
+
+def extract(processed_data, downloaded_data, stop_at=None):
+    """Extracts a segment like `main.process_stream`, with a checkpoint after every 7 records."""
+    resume = checkpoint.restore(processed_data, downloaded_data)
+    n_records = 0 if resume is None else resume.n_records
+    with open(downloaded_data, 'rb') as stream, records.RecordWriter(processed_data, append=resume is not None) as out:
+        if resume is not None:
+            stream.seek(resume.offset)
+        saver = checkpoint.Checkpointer(processed_data, out, interval=0)
+        iterator = ArchiveIterator(stream)
+        for record in iterator:
+            if n_records == stop_at:
+                raise Stop()
+            data = utils.extract_chinese(record)
+            if data != '':
+                out.write(utils.dump_data(data, record))
+            n_records += 1
+            if n_records % 7 == 0:
+                saver.save(iterator.get_record_offset() + iterator.get_record_length(), n_records, {})
+    checkpoint.discard(processed_data)
+    return n_records
+
+
+@pytest.mark.parametrize('format_', [records.JSONL, records.JSONL_GZ])
+def test_resume(tmp_path, format_):
+    downloaded_data = tmp_path.joinpath('0.warc.wet.gz')
+    downloaded_data.write_bytes(test_parallel.synthetic_wet(100, seed=2))
+    expected = records.with_format(tmp_path.joinpath('expected.warc.wet.gz'), format_)
+    extract(expected, downloaded_data)
+    processed_data = records.with_format(downloaded_data, format_)
+    for stop_at in [10, 45]:
+        with pytest.raises(Stop):
+            extract(processed_data, downloaded_data, stop_at)
+        assert checkpoint.path_of(processed_data).exists() and records.part_of(processed_data).exists()
+    assert extract(processed_data, downloaded_data) == 100
+    assert list(records.read_records(processed_data)) == list(records.read_records(expected))
+    assert not checkpoint.path_of(processed_data).exists() and not records.part_of(processed_data).exists()
+
+
+def test_meta(tmp_path):
+    processed_data = tmp_path.joinpath('0.warc.wet.jsonl')
+    assert records.read_meta(processed_data) is None
+    records.write_meta(processed_data, {'records': 3, 'duplicates': 1})
+    assert records.read_meta(processed_data) == {'records': 3, 'duplicates': 1}
+    assert records.glob(tmp_path) == []
+
+
+def test_restore_rejects_bad_offset(tmp_path):
+    downloaded_data = tmp_path.joinpath('0.warc.wet.gz')
+    downloaded_data.write_bytes(test_parallel.synthetic_wet(10))
+    processed_data = records.with_format(downloaded_data, records.JSONL)
+    records.part_of(processed_data).write_bytes(b'{}\n')
+    checkpoint.save(processed_data, checkpoint.Checkpoint(offset=1, size=3, n_records=1, counts={}))
+    assert checkpoint.restore(processed_data, downloaded_data) is None
+    checkpoint.save(processed_data, checkpoint.Checkpoint(offset=0, size=3, n_records=0, counts={}))
+    assert checkpoint.restore(processed_data, downloaded_data) is not None
+
+
+def test_spans_from_start(tmp_path):
+    path = tmp_path.joinpath('0.warc.wet.gz')
+    path.write_bytes(test_parallel.synthetic_wet(200))
+    spans = parallel.member_spans(path, 4096)
+    start = spans[3][0]
+    assert parallel.member_spans(path, 4096, start)[0][0] == start
+    assert parallel.member_spans(path, 4096, start)[-1][1] == path.stat().st_size
+    assert parallel.member_spans(path, 4096, path.stat().st_size) == []
@@ -0,0 +1,57 @@
+"""Checks the exact deduplication of the records and lines of a segment.
+
+    python -m pytest tests/test_dedup.py
+"""
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import dedup
+import utils
+
+from collections import Counter
+
+
+def record(text: str):
+    return {'url': 'http://example.com/', 'date': None, 'content_length': 0, 'data': text, 'data_length': len(text),
+            'stats': utils.text_stats(text)}
+
+
+def test_records():
+    seen = dedup.Deduplicator()
+    counts = Counter()
+    texts = ['中文一\n中文二\n', '  中文一\n中文二 \n', '中文一\n', '中文一\n中文二\n']
+    kept = [seen.dedup(record(text), counts) for text in texts]
+    assert [data is not None for data in kept] == [True, False, True, False]
+    assert kept[0] == record(texts[0])
+    assert counts == {'duplicates': 2}
+
+
+def test_lines():
+    seen = dedup.Deduplicator(lines=True)
+    counts = Counter()
+    kept = [seen.dedup(record(text), counts) for text in ['中文一\n中文二\n', '中文三\n 中文二\n', '中文三\n中文一\n']]
+    assert kept == [record('中文一\n中文二\n'), record('中文三\n'), None]
+    assert counts == {'duplicate_lines': 3}
+
+
+def test_resume():
+    texts = ['中文一\n中文二\n', '中文二\n中文三\n', '中文二\n中文三\n', '中文三\n', '中文一\n中文三\n', '中文一\n中文三\n',
+             '中文四\n']
+    seen = dedup.Deduplicator(lines=True)
+    counts = Counter()
+    expected = [seen.dedup(record(text), counts) for text in texts]
+    for stop_at in range(len(texts) + 1):
+        seen = dedup.Deduplicator(lines=True)
+        resumed_counts = Counter()
+        kept = [seen.dedup(record(text), resumed_counts) for text in texts[:stop_at]]
+        # Resumes from the records written, as `main.resumed` does after a checkpoint.
+        resumed = dedup.Deduplicator(lines=True)
+        resumed.restore(seen.state())
+        for data in kept:
+            if data is not None:
+                resumed.remember(data)
+        kept += [resumed.dedup(record(text), resumed_counts) for text in texts[stop_at:]]
+        assert kept == expected
+        assert resumed_counts == counts
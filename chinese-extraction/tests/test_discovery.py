@@ -0,0 +1,75 @@
+"""Checks that jobs are claimed from the rows of the downloaders even when the listing is stale.
+
+    python -m pytest tests/test_discovery.py
+"""
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import models
+import discovery
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+
+def test_stale_listing(tmp_path):
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    listing = discovery.Listing(str(tmp_path), ttl=600)
+    assert listing.uris() == []
+    with Session(bind=engine) as session:
+        worker = models.Worker(name='downloader')
+        session.add(worker)
+        # The files of the first rows are on another device; only the last one arrived here, after the listing.
+        for i in range(7):
+            session.add(models.Data(uri=f'crawl-data/x/{i}.warc.wet.gz', worker=worker,
+                                    download_state=models.Data.DOWNLOAD_FINISHED))
+        session.commit()
+        file = tmp_path.joinpath('crawl-data/x/6.warc.wet.gz')
+        file.parent.mkdir(parents=True)
+        file.write_bytes(b'')
+
+        job = discovery.find_downloaded_job(session, str(tmp_path), ['downloader'], batch_size=2)
+        assert job is not None and job.uri == 'crawl-data/x/6.warc.wet.gz'
+        job.process_state = models.Data.PROCESS_PROCESSING
+        session.commit()
+        assert discovery.find_downloaded_job(session, str(tmp_path), ['downloader'], batch_size=2) is None
+        assert discovery.find_job(session, listing, ['downloader'], batch_size=2) is None
+
+
+def test_idle_rescan(tmp_path):
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    listing = discovery.Listing(str(tmp_path), ttl=600)
+    with Session(bind=engine) as session:
+        session.add(models.Data(uri='crawl-data/x/0.warc.wet.gz'))
+        session.commit()
+        # Rescanned once when nothing is found, then not again until a job is claimed or the listing expires.
+        assert discovery.find_job(session, listing, [], batch_size=2) is None
+        assert listing.idle
+        file = tmp_path.joinpath('crawl-data/x/0.warc.wet.gz')
+        file.parent.mkdir(parents=True)
+        file.write_bytes(b'')
+        assert discovery.find_job(session, listing, [], batch_size=2) is None
+        listing.ttl = 0
+        job = discovery.find_job(session, listing, [], batch_size=2)
+        assert job is not None and not listing.idle
+
+
+def test_no_sync(tmp_path):
+    engine = create_engine('sqlite://')
+    models.Base.metadata.create_all(engine)
+    with Session(bind=engine) as session:
+        worker = models.Worker(name='downloader')
+        session.add(models.Data(uri='crawl-data/x/0.warc.wet.gz', worker=worker,
+                                download_state=models.Data.DOWNLOAD_FINISHED,
+                                process_state=models.Data.PROCESS_FINISHED))
+        session.commit()
+        file = tmp_path.joinpath('crawl-data/x/0.warc.wet.gz')
+        file.parent.mkdir(parents=True)
+        file.write_bytes(b'')
+        assert discovery.find_downloaded_job(session, str(tmp_path), ['downloader'], batch_size=2) is None
+        assert discovery.find_downloaded_job(session, str(tmp_path), ['downloader'], batch_size=2,
+                                             sync=False) is not None
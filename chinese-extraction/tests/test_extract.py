@@ -0,0 +1,176 @@
+"""Checks that the vectorized `filter_chinese` keeps exactly the lines the original per-character loop kept,
+and what the precheck rejects before decoding.
+
+    python -m pytest tests/test_extract.py
+"""
+import io
+import sys
+import random
+import pathlib
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+
+from collections import Counter
+from warcio.warcwriter import WARCWriter
+from warcio.archiveiterator import ArchiveIterator
+
+# Code points around the boundaries of every class, which the strict comparisons of the original leave out.
+EDGES = '0189 .,\r\t' + ''.join(chr(c) for start, end in [(0x2000, 0x206f), (0x3000, 0x303f), (0x4e00, 0x9fef),
+                                                           (0xff00, 0xffef)]
+                                 for c in (start - 1, start, start + 1, end - 1, end, end + 1))
+ALPHABET = EDGES + 'abcXYZéЖ가\uffff\U0001f600\U00020000' + '的一是不了人我在有他这中大来上国'
+
+
+def filter_chinese_loop(text: str) -> str:
+    """The original implementation."""
+    def is_chinese_char(char: str) -> bool:
+        if '\u2000' < char < '\u206f' \
+                or '\u3000' < char < '\u303f' \
+                or '\u4e00' < char < '\u9fef' \
+                or '\uff00' < char < '\uffef':
+            return True
+        return False
+
+    data = ''
+    lines = text.split('\n')
+    for line in lines:
+        n_valid_chars = len(line)
+        n_chinese_chars = 0
+        for ch in line:
+            if '0' < ch < '9' or ch == ' ' or ch == '.':
+                n_valid_chars -= 1
+            else:
+                n_chinese_chars += 1 if is_chinese_char(ch) else 0
+        if n_chinese_chars > n_valid_chars * 0.8 \
+                or n_chinese_chars > n_valid_chars * 0.7 and n_chinese_chars > 50 \
+                or n_chinese_chars > n_valid_chars * 0.6 and n_chinese_chars > 150:
+            data += line
+            data += '\n'
+    return data
+
+
+def random_text(rng: random.Random, n_lines: int) -> str:
+    lines = []
+    for _ in range(n_lines):
+        chinese = rng.random()
+        length = rng.choice([0, 1, 2, 10, 50, 60, 80, 150, 160, 220, 400])
+        lines.append(''.join(rng.choice('的一是不了人我在有他这中大来上国') if rng.random() < chinese
+                             else rng.choice(ALPHABET) for _ in range(length)))
+    return '\n'.join(lines)
+
+
+def test_edges():
+    for ch in EDGES:
+        for text in [ch, ch * 3, ch + '中', '中' * 4 + ch, '中' * 51 + ch * 20, '中' * 151 + ch * 90]:
+            assert utils.filter_chinese(text) == filter_chinese_loop(text), repr(text)
+    for text in ['', '\n', '\n\n', '中\n', '\n中', '中文\r\n中文', ' . 1 中']:
+        assert utils.filter_chinese(text) == filter_chinese_loop(text), repr(text)
+
+
+def test_random():
+    rng = random.Random(0)
+    for _ in range(300):
+        text = random_text(rng, rng.randint(1, 40))
+        assert utils.filter_chinese(text) == filter_chinese_loop(text)
+
+
+def test_thresholds():
+    # Exactly at a threshold the line is dropped, one Chinese character more and it is kept.
+    for n_chinese, n_other in [(8, 2), (51, 21), (151, 100)]:
+        for extra in [0, 1]:
+            text = '中' * (n_chinese + extra) + 'a' * n_other
+            assert utils.filter_chinese(text) == filter_chinese_loop(text)
+
+
+def test_extract_chinese():
+    text = '中文' * 40 + '\nEnglish only\n' + '中' * 10
+    out = io.BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    writer.write_record(writer.create_warc_record('http://example.com/', 'conversion',
+                                                  payload=io.BytesIO(text.encode('utf-8'))))
+    out.seek(0)
+    for record in ArchiveIterator(out):
+        assert utils.extract_chinese(record) == filter_chinese_loop(text)
+
+
+def conversion_records(texts, languages=None):
+    out = io.BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    for i, text in enumerate(texts):
+        headers = {'WARC-Target-URI': f'http://example.com/{i}'}
+        if languages is not None:
+            headers[utils.LANGUAGE_HEADER] = languages[i]
+        writer.write_record(writer.create_warc_record(f'http://example.com/{i}', 'conversion',
+                                                      payload=io.BytesIO(text.encode('utf-8')),
+                                                      warc_headers_dict=headers))
+    out.seek(0)
+    return ArchiveIterator(out)
+
+
+def test_precheck_language():
+    texts = ['中文' * 40, '中文' * 40, 'English only']
+    precheck = utils.Precheck(languages=frozenset(['zho']), sample_size=4096, min_density=0.01)
+    counts = Counter()
+    data = [utils.extract_chinese(record, precheck, counts)
+            for record in conversion_records(texts, ['zho,eng', 'eng,jpn', 'zho'])]
+    assert data == [filter_chinese_loop(texts[0]), '', '']
+    assert counts == {'language': 1}
+
+
+def test_precheck_density():
+    texts = ['中文' * 40, 'English only\n' * 100 + '中' * 20, 'English ' * 10 + '\n' + '中' * 20]
+    precheck = utils.Precheck(languages=frozenset(['zho']), sample_size=1024, min_density=0.01)
+    counts = Counter()
+    data = [utils.extract_chinese(record, precheck, counts) for record in conversion_records(texts)]
+    assert data == [filter_chinese_loop(texts[0]), '', filter_chinese_loop(texts[2])]
+    assert counts == {'density': 1}
+    # The audit keeps what the precheck would lose, and counts it.
+    counts = Counter()
+    data = [utils.extract_chinese(record, precheck._replace(audit=True), counts)
+            for record in conversion_records(texts)]
+    assert data == [filter_chinese_loop(text) for text in texts]
+    assert counts == {'density': 1, 'missed': 1}
+
+
+def test_decode_policies():
+    texts = ['中文' * 40, '中文' * 40]
+    payloads = [texts[0].encode('utf-8'), texts[1].encode('utf-8')[:-1] + b'\xff' + '中文'.encode('utf-8')]
+    out = io.BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    for payload in payloads:
+        writer.write_record(writer.create_warc_record('http://example.com/', 'conversion', payload=io.BytesIO(payload)))
+
+    def extract(policy):
+        out.seek(0)
+        counts = Counter()
+        return [utils.extract_chinese(record, counts=counts, policy=policy) for record in ArchiveIterator(out)], counts
+
+    assert extract('skip') == ([filter_chinese_loop(texts[0]), ''], {'errors': 1})
+    data, counts = extract('replace')
+    assert data[0] == filter_chinese_loop(texts[0]) and '\ufffd' in data[1] and counts == {'errors': 1}
+    with pytest.raises(UnicodeDecodeError):
+        extract('strict')
+
+
+def test_text_stats():
+    text = filter_chinese_loop('中文，１2 3。\n\n英文　句子！好\n' + random_text(random.Random(4), 20))
+    result = utils.text_stats(text)
+    assert result['chinese_chars'] == sum(utils.is_chinese_char(ch) for ch in text)
+    assert result['lines'] == text.count('\n')
+    assert result['digits'] == sum(ch in utils.DIGIT_CHARS for ch in text)
+    assert result['spaces'] == sum(ch in utils.SPACE_CHARS for ch in text)
+    assert result['last_end'] == max(text.rfind(ch) for ch in utils.SENTENCE_ENDS)
+    assert result['hash'] != utils.text_stats(text + '\n')['hash'] and len(result['hash']) == 16
+    assert utils.text_stats('中文\n')['last_end'] == -1
+
+
+def test_filter_chinese_stats():
+    rng = random.Random(5)
+    for _ in range(200):
+        text = random_text(rng, rng.randint(1, 10)) + rng.choice(['', '\n', '中文。', '中文。1'])
+        stats = {}
+        data = utils.filter_chinese(text, stats)
+        assert stats == utils.text_stats(data), repr(text)
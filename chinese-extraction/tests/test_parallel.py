@@ -0,0 +1,74 @@
+"""Checks that extracting a segment span by span on a pool gives the records of the serial extraction, in order.
+
+    python -m pytest tests/test_parallel.py
+"""
+import io
+import sys
+import gzip
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import parallel
+import test_extract
+
+from multiprocessing import Pool
+from warcio.warcwriter import WARCWriter
+from warcio.archiveiterator import ArchiveIterator
+
+
+def synthetic_wet(n_records: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    out = io.BytesIO()
+    writer = WARCWriter(out, gzip=True)
+    for i in range(n_records):
+        text = test_extract.random_text(rng, rng.randint(1, 20))
+        writer.write_record(writer.create_warc_record(f'http://example.com/{i}', 'conversion',
+                                                      payload=io.BytesIO(text.encode('utf-8'))))
+    return out.getvalue()
+
+
+def serial(path: pathlib.Path):
+    with open(path, 'rb') as stream:
+        return [utils.dump_data(data, record) for record in ArchiveIterator(stream)
+                if (data := utils.extract_chinese(record)) != '']
+
+
+def test_spans(tmp_path):
+    path = tmp_path.joinpath('0.warc.wet.gz')
+    path.write_bytes(synthetic_wet(200))
+    with open(path, 'rb') as stream:
+        iterator = ArchiveIterator(stream)
+        offsets = set()
+        for _ in iterator:
+            offsets.add(iterator.get_record_offset())
+    spans = parallel.member_spans(path, 4096)
+    assert len(spans) > 5
+    assert spans[0][0] == 0 and spans[-1][1] == path.stat().st_size
+    for (_, end), (start, _) in zip(spans, spans[1:]):
+        assert end == start and start in offsets
+
+
+def test_parallel_matches_serial(tmp_path):
+    path = tmp_path.joinpath('0.warc.wet.gz')
+    path.write_bytes(synthetic_wet(300, seed=1))
+    with Pool(processes=3) as pool:
+        results = list(parallel.extract(pool, path, 4096))
+    assert sum(n_records for _, n_records, _ in results) == 300
+    assert [data for data_list, _, _ in results for data in data_list] == serial(path)
+
+
+def test_single_member(tmp_path):
+    path = tmp_path.joinpath('0.warc.wet.gz')
+    path.write_bytes(gzip.compress(gzip.decompress(synthetic_wet(50))))
+    assert parallel.member_spans(path, 1024) == [(0, path.stat().st_size)]
+
+
+def test_false_magic(tmp_path):
+    data = synthetic_wet(2)
+    path = tmp_path.joinpath('0.warc.wet.gz')
+    path.write_bytes(parallel.GZIP_MAGIC + b'not a member' + data)
+    with open(path, 'rb') as f:
+        assert parallel.next_member(f, 0, len(data)) == len(parallel.GZIP_MAGIC) + len(b'not a member')
@@ -0,0 +1,59 @@
+"""Checks the selective fetch against a local stand-in server and index file.
+
+    python -m pytest tests/test_selective.py
+"""
+import sys
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import selective
+import selective_server
+
+
+def test_selective_fetch(tmp_path):
+    warc, lines, pages = selective_server.synthetic_warc(200, chinese=0.1)
+    index = tmp_path.joinpath('index.cdxj')
+    index.write_text('\n'.join(lines) + '\n')
+    files = selective.load_index([str(index)], {'zho'})
+    assert list(files) == [selective_server.WARC_URI]
+    assert selective.wet_of(selective_server.WARC_URI) == selective_server.WET_URI
+    assert selective.warc_of(selective_server.WET_URI) == selective_server.WARC_URI
+
+    server = selective_server.WarcServer(warc)
+    url = f'{server.start()}/{selective_server.WARC_URI}'
+    try:
+        texts = []
+        # The synthetic records are far smaller than real ones, so they are not merged.
+        for start, end, batch in selective.plan_ranges(files[selective_server.WARC_URI], max_gap=0):
+            data = selective.fetch_range(url, start, end)
+            for record in selective.records_in(data, start, batch):
+                texts.append(utils.filter_chinese(selective.html_to_text(record)))
+    finally:
+        server.stop()
+
+    assert len(texts) == len(pages)
+    for text, page in zip(texts, pages):
+        assert text != ''
+        assert text.split('\n')[0] in page
+    assert server.transferred == sum(entry.length for entry in files[selective_server.WARC_URI])
+    # With one page in ten in Chinese, well under a fifth of the file should be transferred.
+    assert server.transferred < len(warc) / 5
+
+
+def test_plan_ranges():
+    entries = [selective.IndexEntry('f', offset, length, '', ('zho',))
+               for offset, length in [(0, 10), (15, 10), (1000, 10), (2000, 5000)]]
+    ranges = selective.plan_ranges(entries, max_gap=8, max_span=4096)
+    assert [(start, end, len(batch)) for start, end, batch in ranges] == [(0, 25, 2), (1000, 1010, 1), (2000, 7000, 1)]
+
+
+def test_columnar_index(tmp_path):
+    index = tmp_path.joinpath('index.csv')
+    index.write_text('url,warc_filename,warc_record_offset,warc_record_length,content_languages\n'
+                     'http://a/,crawl-data/x/warc/a.warc.gz,100,20,"zho,eng"\n'
+                     'http://b/,crawl-data/x/warc/a.warc.gz,0,50,eng\n')
+    files = selective.load_index([str(index)], {'zho'})
+    assert files == {'crawl-data/x/warc/a.warc.gz': [selective.IndexEntry('crawl-data/x/warc/a.warc.gz', 100, 20,
+                                                                          'http://a/', ('zho', 'eng'))]}
@@ -29,18 +29,26 @@ create table data
 3 Failed',
     id_worker      int null,
     archive        varchar(30) charset utf8 null,
+    lease_owner      varchar(128) null,
+    lease_expires_at datetime null,
     constraint data_uri_uindex
         unique (uri),
     constraint data_worker_id_fk
         foreign key (id_worker) references worker (id)
 );
 
+create index data_lease_expires_at_index
+    on data (lease_expires_at);
+
 create table process
 (
     id           int auto_increment
         primary key,
     id_data      int           not null,
     size         int default 0 not null,
+    errors       int default 0 not null comment 'Records that are not valid UTF-8',
+    duplicates   int default 0 not null comment 'Records dropped as copies of another in the segment',
+    duplicate_lines int default 0 not null comment 'Lines dropped as already seen in the segment',
     processed_at datetime null,
     id_worker    int null,
     uri          varchar(256) null,
@@ -0,0 +1,38 @@
+-- Columns added to common_crawl.sql after the first release, for databases created before them.
+-- Safe to apply more than once: a column or index that already exists is left as it is.
+
+set @statement = (select if(count(*) = 0,
+    'alter table data add lease_owner varchar(128) null, add lease_expires_at datetime null',
+    'do 0')
+    from information_schema.columns
+    where table_schema = database() and table_name = 'data' and column_name = 'lease_owner');
+prepare statement from @statement;
+execute statement;
+deallocate prepare statement;
+
+set @statement = (select if(count(*) = 0,
+    'create index data_lease_expires_at_index on data (lease_expires_at)',
+    'do 0')
+    from information_schema.statistics
+    where table_schema = database() and table_name = 'data' and index_name = 'data_lease_expires_at_index');
+prepare statement from @statement;
+execute statement;
+deallocate prepare statement;
+
+set @statement = (select if(count(*) = 0,
+    'alter table process add errors int default 0 not null comment ''Records that are not valid UTF-8''',
+    'do 0')
+    from information_schema.columns
+    where table_schema = database() and table_name = 'process' and column_name = 'errors');
+prepare statement from @statement;
+execute statement;
+deallocate prepare statement;
+
+set @statement = (select if(count(*) = 0,
+    'alter table process add duplicates int default 0 not null comment ''Records dropped as copies of another in the segment'', add duplicate_lines int default 0 not null comment ''Lines dropped as already seen in the segment''',
+    'do 0')
+    from information_schema.columns
+    where table_schema = database() and table_name = 'process' and column_name = 'duplicates');
+prepare statement from @statement;
+execute statement;
+deallocate prepare statement;
@@ -1,5 +1,5 @@
 #!/bin/bash
 
 for ((i = 1; i <= $1; i++)); do
-  screen -dmS common-crawl-"$i" bash -c "source activate;conda activate common-crawl; python src/main.py;"
+  screen -dmS common-crawl-"$i" bash -c "source activate;conda activate common-crawl; PARTITION_INDEX=$((i - 1)) python src/main.py;"
 done
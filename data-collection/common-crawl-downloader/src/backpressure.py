@@ -0,0 +1,109 @@
+import time
+import shutil
+import logging
+import pathlib
+import colorama
+import threading
+
+import metrics
+
+from typing import Optional, Tuple
+
+GIB = 1024 * 1024 * 1024
+PATTERN = '*.warc.wet.gz'
+
+
+class Watermarks:
+    """Holds back new downloads while the download folder is ahead of the extraction stage.
+
+    The extraction stage deletes every file it has processed, so the `*.warc.wet.gz` files
+    in the folder are the downloaded but not yet processed segments. The downloader pauses
+    when the free space drops below `pause_free` GiB or the backlog reaches `pause_files`,
+    and resumes only once there are at least `resume_free` GiB free and at most
+    `resume_files` files left. A threshold of 0 is disabled.
+
+    The free space is cheap to read and is checked before every job. The folder is only
+    rescanned once per `interval`; in between, the downloads of this process are added
+    to the last count.
+    """
+
+    def __init__(self,
+                 path: str,
+                 pause_free: float = 0,
+                 resume_free: float = 0,
+                 pause_files: int = 0,
+                 resume_files: int = 0,
+                 interval: float = 30):
+        if resume_free < pause_free:
+            raise ValueError(f'resume_free ({resume_free}) must not be lower than pause_free ({pause_free}).')
+        if pause_files > 0 and resume_files > pause_files:
+            raise ValueError(f'resume_files ({resume_files}) must not exceed pause_files ({pause_files}).')
+        self._path = pathlib.Path(path)
+        self._pause_free = pause_free * GIB
+        self._resume_free = resume_free * GIB
+        self._pause_files = pause_files
+        self._resume_files = resume_files
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._scanned_at: Optional[float] = None
+        self._files = 0
+        self._paused_at = 0.0
+        self.paused = False
+
+    def measure(self) -> Tuple[int, int]:
+        """Returns the free space in bytes and the number of downloaded segments."""
+        self._path.mkdir(parents=True, exist_ok=True)
+        now = time.monotonic()
+        if self._pause_files > 0 and (self._scanned_at is None or now - self._scanned_at >= self._interval):
+            self._scanned_at = now
+            self._files = sum(1 for _ in self._path.rglob(PATTERN))
+        return shutil.disk_usage(self._path).free, self._files
+
+    def downloaded(self):
+        """Counts a segment this process has just finished towards the backlog."""
+        with self._lock:
+            self._files += 1
+
+    def _above_high(self, free: int, files: int) -> bool:
+        return (self._pause_free > 0 and free < self._pause_free) or \
+               (self._pause_files > 0 and files >= self._pause_files)
+
+    def _below_low(self, free: int, files: int) -> bool:
+        return (self._resume_free == 0 or free >= self._resume_free) and \
+               (self._pause_files == 0 or files <= self._resume_files)
+
+    def check(self) -> bool:
+        """Updates the state and returns whether downloads are paused."""
+        with self._lock:
+            now = time.monotonic()
+            free, files = self.measure()
+            metrics.gauge('disk_free_gib', free / GIB)
+            metrics.gauge('pending_files', files)
+            if not self.paused and self._above_high(free, files):
+                self.paused = True
+                self._paused_at = now
+                metrics.incr('backpressure_pauses')
+                logging.warning(f'{colorama.Fore.LIGHTYELLOW_EX}'
+                                f'Download folder is full '
+                                f'{{free={free / GIB:.2f} GiB, pending_files={files}}}, '
+                                f'new jobs are paused until extraction catches up.'
+                                f'{colorama.Fore.RESET}')
+            elif self.paused and self._below_low(free, files):
+                self.paused = False
+                metrics.incr('backpressure_seconds', now - self._paused_at)
+                logging.info(f'{colorama.Fore.LIGHTGREEN_EX}'
+                             f'Download folder has drained '
+                             f'{{free={free / GIB:.2f} GiB, pending_files={files}}}, '
+                             f'new jobs are resumed after {now - self._paused_at:.0f} seconds.'
+                             f'{colorama.Fore.RESET}')
+            metrics.gauge('backpressure_paused', int(self.paused))
+            return self.paused
+
+    def wait(self, cancel: Optional[threading.Event] = None):
+        """Blocks while downloads are paused."""
+        while self.check():
+            if cancel is not None:
+                if cancel.wait(self._interval):
+                    return
+            else:
+                time.sleep(self._interval)
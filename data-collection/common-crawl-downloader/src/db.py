@@ -27,6 +27,11 @@ def get_database_config(config: configparser.ConfigParser) -> DatabaseConfig:
     )
 
 
-def db_connect(conf: DatabaseConfig) -> Engine:
-    return create_engine(f"{conf.drivername}://{conf.username}:{conf.password}@{conf.host}:{conf.port}/{conf.database}",
-                         poolclass=NullPool)
+def db_connect(conf: DatabaseConfig, pool_size: int = 0) -> Engine:
+    if conf.drivername.startswith('sqlite'):
+        url = f"{conf.drivername}:///{conf.database}"
+    else:
+        url = f"{conf.drivername}://{conf.username}:{conf.password}@{conf.host}:{conf.port}/{conf.database}"
+    if pool_size > 0:
+        return create_engine(url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True, pool_recycle=3600)
+    return create_engine(url, poolclass=NullPool)
@@ -0,0 +1,331 @@
+import os
+import json
+import zlib
+import pathlib
+import threading
+import http_pool
+
+from typing import Callable, List, Optional, Tuple
+from http_pool import PooledResponse
+from concurrent.futures import ThreadPoolExecutor
+
+BUFFER_SIZE = 64 * 1024
+MIN_RANGE_SIZE = 8 * 1024 * 1024
+SAVE_INTERVAL = 4 * 1024 * 1024
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadCancelled(Exception):
+    pass
+
+
+class CorruptDataError(DownloadError):
+    pass
+
+
+class _Progress:
+
+    def __init__(self, total: Optional[int], callback: Optional[Callable] = None, current: int = 0):
+        self._total = total
+        self._callback = callback
+        self._current = current
+        self._lock = threading.Lock()
+        if self._callback is not None and current > 0:
+            self._callback(self._current, self._total)
+
+    def add(self, n: int):
+        with self._lock:
+            self._current += n
+            if self._callback is not None:
+                self._callback(self._current, self._total)
+
+
+class _PartState:
+    """Tracks how many bytes of each range have reached the `.part` file.
+
+    The state is persisted next to the `.part` file so that an interrupted download
+    can be continued from the bytes already on disk, even by a new process.
+    """
+
+    def __init__(self, path: pathlib.Path, size: int, ranges: List[List[int]]):
+        self._path = path
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._running = len(ranges)
+        self.size = size
+        self.ranges = ranges
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> Optional['_PartState']:
+        try:
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(path, state['size'], state['ranges'])
+
+    @property
+    def done(self) -> int:
+        with self._lock:
+            return sum(done for _, _, done in self.ranges)
+
+    def advance(self, index: int, n: int):
+        with self._lock:
+            self.ranges[index][2] += n
+            self._changed.notify_all()
+
+    def finish(self, *_):
+        with self._lock:
+            self._running -= 1
+            self._changed.notify_all()
+
+    def wait_available(self, index: int, offset: int) -> int:
+        """Blocks until range `index` has bytes on disk beyond `offset` and returns where those bytes end.
+
+        Returns `offset` if every range has stopped before that happens.
+        """
+        with self._lock:
+            while True:
+                start, _, done = self.ranges[index]
+                if start + done > offset or self._running == 0:
+                    return max(start + done, offset)
+                self._changed.wait()
+
+    def save(self):
+        with self._lock:
+            tmp = self._path.with_name(self._path.name + '.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'size': self.size, 'ranges': self.ranges}, f)
+            os.replace(tmp, self._path)
+
+
+class GzipVerifier:
+    """Incrementally decompresses a multi-member gzip stream, checking the CRC and length of every member."""
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self._in_member = False
+        self.members = 0
+        self.uncompressed_size = 0
+
+    def feed(self, data: bytes):
+        try:
+            while len(data) > 0:
+                self._in_member = True
+                self.uncompressed_size += len(self._decompressor.decompress(data))
+                if not self._decompressor.eof:
+                    break
+                self.members += 1
+                self._in_member = False
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise CorruptDataError(f'Corrupt gzip stream in member {self.members}: {e}')
+
+    def close(self):
+        if self._in_member:
+            raise CorruptDataError(f'Truncated gzip stream in member {self.members}.')
+        if self.members == 0:
+            raise CorruptDataError('Empty gzip stream.')
+
+
+def part_path(file: pathlib.Path) -> pathlib.Path:
+    return file.with_name(file.name + '.part')
+
+
+def state_path(file: pathlib.Path) -> pathlib.Path:
+    return file.with_name(file.name + '.part.json')
+
+
+def split_ranges(size: int, connections: int, min_range_size: int = MIN_RANGE_SIZE) -> List[Tuple[int, int]]:
+    """Splits `[0, size)` into at most `connections` inclusive byte ranges of at least `min_range_size` bytes."""
+    n_ranges = max(1, min(connections, size // max(min_range_size, 1)))
+    range_size = -(-size // n_ranges)
+    return [(start, min(start + range_size, size) - 1) for start in range(0, size, range_size)]
+
+
+def content_range_total(response: PooledResponse) -> int:
+    """Returns the complete length in `Content-Range: bytes <start>-<end>/<total>`, or -1 if it is unknown."""
+    total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+    return int(total) if total.isdigit() else -1
+
+
+def _check_cancelled(cancel: Optional[threading.Event], abort: Optional[threading.Event] = None):
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled()
+    if abort is not None and abort.is_set():
+        raise DownloadError('Download aborted.')
+
+
+def _fetch_range(url: str,
+                 part: pathlib.Path,
+                 state: _PartState,
+                 index: int,
+                 progress: _Progress,
+                 cancel: Optional[threading.Event] = None,
+                 abort: Optional[threading.Event] = None,
+                 response: Optional[PooledResponse] = None,
+                 throttle: Optional[Callable[[int], None]] = None) -> int:
+    start, end, done = state.ranges[index]
+    if start + done > end:
+        if response is not None:
+            response.close()
+        return done
+    if response is None:
+        response = http_pool.request('GET', url, headers={'Range': f'bytes={start + done}-{end}'})
+    unsaved = 0
+    try:
+        with response, open(part, 'r+b') as out:
+            if response.status != 206 or content_range_total(response) != state.size:
+                raise DownloadError(f'Range request bytes={start + done}-{end} answered with HTTP {response.status} '
+                                    f'({response.headers.get("Content-Range")}).')
+            out.seek(start + done)
+            while True:
+                _check_cancelled(cancel, abort)
+                chunk = response.read(min(BUFFER_SIZE, end - start + 1 - done - unsaved))
+                if not chunk:
+                    break
+                out.write(chunk)
+                unsaved += len(chunk)
+                progress.add(len(chunk))
+                if throttle is not None:
+                    throttle(len(chunk))
+                if unsaved >= SAVE_INTERVAL:
+                    out.flush()
+                    state.advance(index, unsaved)
+                    state.save()
+                    done += unsaved
+                    unsaved = 0
+    finally:
+        if unsaved > 0:
+            state.advance(index, unsaved)
+            state.save()
+            done += unsaved
+    if start + done != end + 1:
+        raise DownloadError(f'Range bytes={start}-{end} is incomplete: {done} bytes received.')
+    return done
+
+
+def _fetch_stream(response: PooledResponse,
+                  part: pathlib.Path,
+                  progress: _Progress,
+                  cancel: Optional[threading.Event] = None,
+                  verifier: Optional[GzipVerifier] = None,
+                  throttle: Optional[Callable[[int], None]] = None) -> int:
+    written = 0
+    with response, open(part, 'wb') as out:
+        while True:
+            _check_cancelled(cancel)
+            chunk = response.read(BUFFER_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+            if verifier is not None:
+                verifier.feed(chunk)
+            written += len(chunk)
+            progress.add(len(chunk))
+            if throttle is not None:
+                throttle(len(chunk))
+    return written
+
+
+def _verify_part(part: pathlib.Path, state: _PartState, verifier: GzipVerifier) -> bool:
+    """Feeds the `.part` file to `verifier` in order, following the ranges while they are being written.
+
+    Returns whether the whole file has been verified.
+    """
+    # Unbuffered, so that bytes read ahead before they were written are never served from a stale buffer.
+    with open(part, 'rb', buffering=0) as f:
+        for index, (start, end, _) in enumerate(state.ranges):
+            offset = start
+            while offset <= end:
+                available = state.wait_available(index, offset)
+                if available == offset:
+                    return False
+                f.seek(offset)
+                while offset < available:
+                    chunk = f.read(min(BUFFER_SIZE, available - offset))
+                    verifier.feed(chunk)
+                    offset += len(chunk)
+    return True
+
+
+def _remove_part(file: pathlib.Path):
+    for path in (part_path(file), state_path(file)):
+        if path.exists():
+            path.unlink()
+
+
+def download(url: str,
+             file: pathlib.Path,
+             connections: int = 1,
+             min_range_size: int = MIN_RANGE_SIZE,
+             progress: Optional[Callable] = None,
+             cancel: Optional[threading.Event] = None,
+             verify_gzip: bool = False,
+             throttle: Optional[Callable[[int], None]] = None) -> int:
+    """Downloads `url` into `file` using up to `connections` concurrent range requests.
+
+    Data is written to a `.part` file first, which is renamed to `file` once the size
+    has been verified. The size is taken from the first response, so no request is
+    spent on probing it. If a previous attempt left a `.part` file behind, only the
+    missing bytes are requested. Falls back to a single non-resumable stream if the
+    server does not support range requests. Setting `cancel` aborts the transfer with
+    `DownloadCancelled`, keeping the `.part` file for later. With `verify_gzip`, the
+    data is decompressed while it arrives and a corrupt or truncated gzip stream
+    raises `DownloadError` after discarding the `.part` file. `throttle` is called with
+    the length of every chunk received and may block to limit the bandwidth. Requests
+    go through the shared connection pool of `http_pool`. Returns the size of the
+    downloaded file.
+    """
+    part = part_path(file)
+    verifier = GzipVerifier() if verify_gzip else None
+    state = _PartState.load(state_path(file)) if part.exists() else None
+    first = None
+    if state is None:
+        first = http_pool.request('GET', url, headers={'Range': 'bytes=0-'})
+        # `Content-Range: bytes 0-<end>/*` leaves the total unknown, and the range is then streamed as is.
+        size = content_range_total(first) if first.status == 206 else -1
+        if size >= 0:
+            ranges = split_ranges(size, max(connections, 1), min_range_size)
+            state = _PartState(state_path(file), size, [[start, end, 0] for start, end in ranges])
+            with open(part, 'wb') as out:
+                out.truncate(size)
+            state.save()
+    try:
+        if state is None:
+            # A chunked response has no length, and the progress is then shown without a total.
+            length = first.headers.get('Content-Length')
+            size = int(length) if length is not None else None
+            written = _fetch_stream(first, part, _Progress(size, progress), cancel, verifier, throttle)
+        else:
+            size = state.size
+            abort = threading.Event()
+            tracker = _Progress(size, progress, current=state.done)
+            with ThreadPoolExecutor(max_workers=len(state.ranges)) as executor:
+                futures = [executor.submit(_fetch_range, url, part, state, index, tracker, cancel, abort,
+                                           first if index == 0 else None, throttle)
+                           for index in range(len(state.ranges))]
+                for future in futures:
+                    future.add_done_callback(state.finish)
+                try:
+                    if verifier is not None:
+                        _verify_part(part, state, verifier)
+                except CorruptDataError:
+                    abort.set()
+                    raise
+                written = sum(future.result() for future in futures)
+        if verifier is not None:
+            verifier.close()
+    except CorruptDataError:
+        _remove_part(file)
+        raise
+    if size is not None and (written != size or part.stat().st_size != size):
+        raise DownloadError(f'Size mismatch: expected {size} bytes, got {written} bytes.')
+    os.replace(part, file)
+    if state_path(file).exists():
+        state_path(file).unlink()
+    return written
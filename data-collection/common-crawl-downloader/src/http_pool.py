@@ -0,0 +1,177 @@
+import time
+import socket
+import threading
+import http.client
+
+from typing import Dict, List, Optional, Tuple
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+MAX_IDLE_PER_HOST = 8
+MAX_IDLE_TIME = 30
+MAX_REDIRECTS = 5
+# Like `urlopen`, connections time out after `socket.getdefaulttimeout()` unless told otherwise.
+DEFAULT_TIMEOUT = socket._GLOBAL_DEFAULT_TIMEOUT
+
+_Key = Tuple[str, str, int]
+
+
+class PooledResponse:
+    """Wraps an `HTTPResponse` and hands its connection back to the pool once the body has been read and closed.
+
+    A response closed before its body was exhausted takes its connection down with it,
+    since the unread bytes would otherwise be mistaken for the next response.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', key: _Key, connection: http.client.HTTPConnection,
+                 response: http.client.HTTPResponse):
+        self._pool = pool
+        self._key = key
+        self._connection = connection
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self._response.read(amt)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        if self._response.isclosed() and not self._response.will_close:
+            self._pool.release(self._key, connection)
+        else:
+            self._response.close()
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class ConnectionPool:
+    """Keeps idle keep-alive connections per scheme, host and port.
+
+    Successive requests to the same host thus skip the TCP and TLS handshakes.
+    """
+
+    def __init__(self, max_idle_per_host: int = MAX_IDLE_PER_HOST, max_idle_time: float = MAX_IDLE_TIME):
+        self._max_idle_per_host = max_idle_per_host
+        self._max_idle_time = max_idle_time
+        self._idle: Dict[_Key, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0, 'connections_dropped': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _acquire(self, key: _Key, timeout: Optional[float]) -> Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while len(idle) > 0:
+                connection, since = idle.pop()
+                if now - since < self._max_idle_time:
+                    self._stats['connections_reused'] += 1
+                    connection.timeout = socket.getdefaulttimeout() if timeout is DEFAULT_TIMEOUT else timeout
+                    if connection.sock is not None:
+                        connection.sock.settimeout(connection.timeout)
+                    return connection, True
+                connection.close()
+                self._stats['connections_dropped'] += 1
+            self._stats['connections_opened'] += 1
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def release(self, key: _Key, connection: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self._max_idle_per_host:
+                idle.append((connection, time.monotonic()))
+                return
+            self._stats['connections_dropped'] += 1
+        connection.close()
+
+    def _send(self, method: str, url: str, headers: Dict[str, str], timeout: Optional[float]) -> PooledResponse:
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f'Unsupported URL scheme: {url}')
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        while True:
+            connection, reused = self._acquire(key, timeout)
+            try:
+                connection.request(method, path, headers=headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    # The server has closed the idle connection in the meantime, so try again on a fresh one.
+                    self._count('connections_dropped')
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            self._count('requests')
+            return PooledResponse(self, key, connection, response)
+
+    def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = DEFAULT_TIMEOUT) -> PooledResponse:
+        """Sends a request over a pooled connection, following redirects.
+
+        Like `urlopen`, raises `HTTPError` for error statuses. The response must be
+        closed, preferably after reading the whole body so its connection can be reused.
+        """
+        headers = dict(headers or {})
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers, timeout)
+            if response.status in (301, 302, 303, 307, 308) and 'Location' in response.headers:
+                response.read()
+                response.close()
+                url = urljoin(url, response.headers['Location'])
+                continue
+            if response.status >= 400:
+                response.read()
+                response.close()
+                raise HTTPError(url, response.status, response.reason, response.headers, None)
+            return response
+        raise HTTPError(url, response.status, 'Too many redirects.', response.headers, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            result = dict(self._stats)
+            result['connections_idle'] = sum(len(idle) for idle in self._idle.values())
+        return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection, _ in connections:
+                connection.close()
+
+
+_default = ConnectionPool()
+
+
+def request(method: str, url: str, headers: Optional[Dict[str, str]] = None,
+            timeout: Optional[float] = DEFAULT_TIMEOUT) -> PooledResponse:
+    return _default.request(method, url, headers, timeout)
+
+
+def stats() -> Dict[str, int]:
+    return _default.stats()
+
+
+def close():
+    _default.close()
@@ -0,0 +1,121 @@
+import re
+import gzip
+import time
+import socket
+import logging
+import argparse
+import contextlib
+import colorama
+
+import db
+import models
+import configs
+import http_pool
+
+from typing import IO, Iterator, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+URL_BASE = 'https://commoncrawl.s3.amazonaws.com'
+CONFIG_PATH = 'configs'
+BATCH_SIZE = 5000
+READ_SIZE = 64 * 1024
+ARCHIVE_PATTERN = re.compile(r'CC-MAIN-(\d{4}-\d{2})')
+
+
+def archive_of(uri: str) -> Optional[str]:
+    """Returns the crawl of a URI, e.g. `2021-10` for `crawl-data/CC-MAIN-2021-10/...`."""
+    match = ARCHIVE_PATTERN.search(uri)
+    return match.group(1) if match is not None else None
+
+
+@contextlib.contextmanager
+def open_manifest(source: str) -> Iterator[IO[bytes]]:
+    """Opens a local or remote `wet.paths` manifest as a stream, decompressing it if it is gzipped."""
+    if re.match(r'https?://', source):
+        raw = http_pool.request('GET', source)
+    else:
+        raw = open(source, 'rb')
+    with raw:
+        if source.endswith('.gz'):
+            with gzip.GzipFile(fileobj=raw) as stream:
+                yield stream
+        else:
+            yield raw
+
+
+def read_uris(stream: IO[bytes]) -> Iterator[str]:
+    rest = b''
+    while True:
+        chunk = stream.read(READ_SIZE)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            uri = line.decode('utf-8').strip()
+            if uri:
+                yield uri
+    uri = rest.decode('utf-8').strip()
+    if uri:
+        yield uri
+
+
+def insert_batch(db_engine: Engine, uris: List[str], archive: Optional[str]) -> int:
+    """Inserts a batch in one transaction, skipping URIs already in the table. Returns the number of new rows.
+
+    The rows are passed as one `executemany`, which the MySQL drivers send as multi-row
+    `INSERT` statements instead of one round trip per row.
+    """
+    statement = insert(models.Data.__table__) \
+        .prefix_with('IGNORE', dialect='mysql') \
+        .prefix_with('OR IGNORE', dialect='sqlite')
+    rows = [{'uri': uri, 'archive': archive or archive_of(uri)} for uri in uris]
+    with db_engine.begin() as connection:
+        return connection.execute(statement, rows).rowcount
+
+
+def load(db_engine: Engine, source: str, archive: Optional[str] = None, batch_size: int = BATCH_SIZE):
+    start = time.time()
+    total = 0
+    inserted = 0
+    batch = []
+    with open_manifest(source) as stream:
+        for uri in read_uris(stream):
+            batch.append(uri)
+            if len(batch) >= batch_size:
+                inserted += insert_batch(db_engine, batch, archive)
+                total += len(batch)
+                batch = []
+                logging.info(f'{total} URIs read, {inserted} inserted.')
+        if len(batch) > 0:
+            inserted += insert_batch(db_engine, batch, archive)
+            total += len(batch)
+    logging.info(f'Manifest loaded: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{source={source}, read={total}, inserted={inserted}, skipped={total - inserted}, '
+                 f'time={time.time() - start:.2f}s}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seeds the data table from a Common Crawl wet.paths manifest.')
+    parser.add_argument('manifest', type=str,
+                        help='path or URL of a wet.paths(.gz) file, or a crawl ID such as CC-MAIN-2021-10')
+    parser.add_argument('--archive', type=str, default=None,
+                        help='value of the archive column, taken from each URI by default')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='rows per INSERT statement')
+    args = parser.parse_args()
+
+    colorama.init()
+    logging.basicConfig(level=logging.INFO,
+                        format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
+    manifest = args.manifest
+    if re.fullmatch(r'CC-MAIN-\d{4}-\d{2}', manifest):
+        manifest = f'{URL_BASE}/crawl-data/{manifest}/wet.paths.gz'
+    config = configs.config(CONFIG_PATH)
+    socket.setdefaulttimeout(config.getint('worker', 'socket_timeout'))
+    engine = db.db_connect(db.get_database_config(config))
+    load(engine, manifest, archive=args.archive, batch_size=args.batch_size)
+    engine.dispose()
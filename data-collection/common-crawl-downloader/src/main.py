@@ -1,25 +1,45 @@
+import os
 import sys
-import wget
 import time
 import pytz
+import signal
 import socket
+import asyncio
 import logging
 import pathlib
 import colorama
 import datetime
+import functools
+import http.client
+import threading
+import collections
 
 import db
 import utils
+import health
 import models
 import configs
+import lease
+import metrics
+import http_pool
+import ratelimit
+import downloader
+import partition
+import backpressure
+import load_manifest
 
-from urllib.request import urlopen
+from typing import Callable, List, Optional, Sequence
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlparse
+from sqlalchemy import text
 from sqlalchemy.orm import Session
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, NoResultFound
+from concurrent.futures import ThreadPoolExecutor
 
-CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 URL_BASE = 'https://commoncrawl.s3.amazonaws.com'
 TIMEZONE = 'Asia/Shanghai'
+HTTP_ERRORS = (URLError, ConnectionError, TimeoutError, socket.gaierror, http.client.HTTPException)
 CONFIG_PATH = 'configs'
 
 
@@ -28,25 +48,58 @@ def panic(message: str):
     sys.exit(-1)
 
 
-def check_connectivity():
-    tries = 0
-    while True:
-        try:
-            urlopen(CONNECTIVITY_CHECK_URL, timeout=30)
-        except Exception as e:
-            if tries < RETRIES:
-                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                              f'Connectivity check failed: {e}'
-                              f'{colorama.Fore.RESET}')
-                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                time.sleep(RETRY_INTERVAL)
-                tries += 1
-            else:
-                panic(f'{colorama.Fore.LIGHTRED_EX}'
-                      f'Connectivity check failed after {RETRIES} retries.'
-                      f'{colorama.Fore.RESET}')
-            continue
-        break
+def probe_database(db_engine: Engine):
+    with db_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def probe_url_base():
+    try:
+        with http_pool.request('HEAD', URL_BASE, timeout=SOCKET_TIMEOUT) as response:
+            response.read()
+    except HTTPError:
+        # The server has answered, which is all the probe needs to know.
+        pass
+
+
+def register_health(db_engine: Optional[Engine]):
+    if db_engine is not None:
+        health.register('database', (DBAPIError,),
+                        probe=functools.partial(probe_database, db_engine),
+                        threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
+    health.register(urlparse(URL_BASE).hostname, HTTP_ERRORS,
+                    probe=probe_url_base,
+                    threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
+
+
+def observe_job(start: float, size: int):
+    """Records a finished job, timed from its first attempt so that retries are included."""
+    health.succeeded()
+    metrics.observe('job_time', time.time() - start)
+    metrics.incr('jobs_finished')
+    metrics.incr('bytes_downloaded', size)
+    if BACKPRESSURE is not None:
+        BACKPRESSURE.downloaded()
+
+
+def log_metrics():
+    for name, value in http_pool.stats().items():
+        metrics.gauge(f'http_{name}', value)
+    metrics.log_summary()
+
+
+def now_time() -> str:
+    return datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')
+
+
+def in_schedule(start_time: str, end_time: str) -> bool:
+    return ratelimit.in_window(now_time(), start_time, end_time)
+
+
+def throttle(url: str) -> Optional[Callable[[int], None]]:
+    if LIMITER is None:
+        return None
+    return functools.partial(LIMITER.consume, urlparse(url).hostname)
 
 
 def check_schedule(start_time: str, end_time: str, enabled: bool = True):
@@ -56,18 +109,8 @@ def check_schedule(start_time: str, end_time: str, enabled: bool = True):
                      f'{{start_time={start_time}, end_time={end_time}}}'
                      f'{colorama.Fore.RESET}'
                      f'.')
-        while True:
-            now = datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).strftime('%H:%M:%S')
-            if start_time <= end_time:
-                if now < start_time or now > end_time:
-                    time.sleep(SCHEDULE_RETRY_INTERVAL)
-                else:
-                    break
-            else:
-                if end_time < now < start_time:
-                    time.sleep(SCHEDULE_RETRY_INTERVAL)
-                else:
-                    break
+        while not in_schedule(start_time, end_time):
+            time.sleep(SCHEDULE_RETRY_INTERVAL)
 
 
 def find_worker_by_name(session: Session, name: str) -> models.Worker:
@@ -88,59 +131,135 @@ def find_job_by_uri(session: Session, uri: str) -> models.Data:
         .one()
 
 
+def claim_jobs(session: Session, batch_size: int) -> List[str]:
+    """Reserves up to `batch_size` pending jobs in a single transaction and returns their URIs."""
+    start = time.perf_counter()
+    LEASES.reap(session, [(models.Data.download_state, models.Data.DOWNLOAD_DOWNLOADING, models.Data.DOWNLOAD_PENDING),
+                          (models.Data.process_state, models.Data.PROCESS_PROCESSING, models.Data.PROCESS_PENDING)])
+    session.begin()
+    jobs = session \
+        .query(models.Data.id, models.Data.uri) \
+        .with_for_update(of=models.Data, skip_locked=True) \
+        .filter_by(download_state=models.Data.DOWNLOAD_PENDING) \
+        .limit(batch_size) \
+        .all()
+    if len(jobs) > 0:
+        session \
+            .query(models.Data) \
+            .filter(models.Data.id.in_([id_ for id_, _ in jobs])) \
+            .update({models.Data.started_at: datetime.datetime.now(tz=pytz.timezone(TIMEZONE)),
+                     models.Data.download_state: models.Data.DOWNLOAD_DOWNLOADING,
+                     **LEASES.values()},
+                    synchronize_session=False)
+    session.commit()
+    LEASES.hold(*[uri for _, uri in jobs])
+    latency = time.perf_counter() - start
+    health.succeeded('database')
+    metrics.observe('claim_latency', latency)
+    metrics.incr('jobs_claimed', len(jobs))
+    if len(jobs) > 0:
+        logging.info(f'New jobs fetched: '
+                     f'{colorama.Fore.LIGHTCYAN_EX}'
+                     f'{{id=[{", ".join(str(id_) for id_, _ in jobs)}], latency={latency * 1000:.1f}ms}}'
+                     f'{colorama.Fore.RESET}'
+                     f'.')
+    return [uri for _, uri in jobs]
+
+
+def release_jobs(session: Session, uris: Sequence[str]):
+    """Returns claimed but unfinished jobs to the pending state."""
+    if len(uris) > 0:
+        session \
+            .query(models.Data) \
+            .filter(models.Data.uri.in_(uris),
+                    models.Data.download_state == models.Data.DOWNLOAD_DOWNLOADING) \
+            .update({models.Data.started_at: None,
+                     models.Data.download_state: models.Data.DOWNLOAD_PENDING,
+                     **LEASES.cleared()},
+                    synchronize_session=False)
+        LEASES.unhold(*uris)
+        metrics.incr('jobs_released', len(uris))
+    session.commit()
+
+
+def finish_job(session: Session, uri: str, size: int):
+    job = find_job_by_uri(session=session, uri=uri)
+    job.worker = find_worker_by_name(session=session, name=WORKER_NAME)
+    job.finished_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
+    job.size = size
+    job.download_state = models.Data.DOWNLOAD_FINISHED
+    LEASES.drop(job)
+    session.add(job)
+    session.commit()
+
+
+def fail_job(session: Session, uri: str):
+    job = find_job_by_uri(session=session, uri=uri)
+    job.download_state = models.Data.DOWNLOAD_FAILED
+    LEASES.drop(job)
+    session.add(job)
+    session.commit()
+
+
+def run_in_session(db_engine: Engine, fn: Callable, *args):
+    session = Session(bind=db_engine)
+    try:
+        return fn(session, *args)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
 def main():
     db_engine = db.db_connect(DB_CONF)
+    queue = collections.deque()
+    LEASES.start(db_engine)
+    register_health(db_engine)
 
     while True:
         try:
             check_schedule(start_time=START_TIME, end_time=END_TIME, enabled=SCHEDULE_ENABLED)
-            check_connectivity()
+            health.wait()
+            if BACKPRESSURE is not None:
+                BACKPRESSURE.wait()
         except KeyboardInterrupt:
+            run_in_session(db_engine, release_jobs, list(queue))
+            log_metrics()
             logging.info(f'Bye.')
             return
 
-        logging.info('Fetching a new job...')
-        session = Session(bind=db_engine)
-        uri = None
-        tries = 0
-        while True:
-            try:
-                session.begin()
-                job: models.Data = session \
-                    .query(models.Data) \
-                    .with_for_update(of=models.Data, skip_locked=True) \
-                    .filter_by(download_state=models.Data.DOWNLOAD_PENDING) \
-                    .first()
-                if job is None:
-                    logging.info('No unclaimed job found. This program is about to exit.')
+        if len(queue) == 0:
+            logging.info('Fetching new jobs...')
+            session = Session(bind=db_engine)
+            tries = 0
+            while True:
+                try:
+                    queue.extend(claim_jobs(session, BATCH_SIZE))
                     session.close()
-                    return
-                uri = job.uri
-                job.started_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
-                job.download_state = models.Data.DOWNLOAD_DOWNLOADING
-                session.add(job)
-                session.commit()
-                logging.info(f'New job fetched: '
-                             f'{colorama.Fore.LIGHTCYAN_EX}'
-                             f'{{id={job.id}, uri={job.uri}}}'
-                             f'{colorama.Fore.RESET}'
-                             f'.')
-                session.close()
-            except Exception as e:
-                if tries < RETRIES:
-                    session.rollback()
-                    logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                                  f'An error has occurred: {e}'
-                                  f'{colorama.Fore.RESET}')
-                    logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                    time.sleep(RETRY_INTERVAL)
-                    tries += 1
-                else:
-                    panic(f'{colorama.Fore.LIGHTRED_EX}'
-                          f'Failed to fetch a new job after {RETRIES} retries.'
-                          f'{colorama.Fore.RESET}')
-                continue
-            break
+                    if len(queue) == 0:
+                        logging.info('No unclaimed job found. This program is about to exit.')
+                        log_metrics()
+                        return
+                except Exception as e:
+                    health.record(e)
+                    if tries < RETRIES:
+                        session.rollback()
+                        logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                      f'An error has occurred: {e}'
+                                      f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        time.sleep(RETRY_INTERVAL)
+                        health.wait('database')
+                        tries += 1
+                    else:
+                        panic(f'{colorama.Fore.LIGHTRED_EX}'
+                              f'Failed to fetch a new job after {RETRIES} retries.'
+                              f'{colorama.Fore.RESET}')
+                    continue
+                break
+        uri = queue.popleft()
 
         url = f'{URL_BASE}/{uri}'
         logging.info(f'Download from '
@@ -154,15 +273,17 @@ def main():
             file.parent.mkdir(parents=True, exist_ok=True)
 
             tries = 0
+            start = time.time()
             while True:
                 try:
                     progbar = utils.DownloadProgBar()
-                    wget.download(url, out=str(file), bar=progbar.update)
-                    job = find_job_by_uri(session=session, uri=uri)
-                    job.worker = find_worker_by_name(session=session, name=WORKER_NAME)
-                    job.finished_at = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
-                    job.size = int(urlopen(url).info().get('Content-Length', -1))
-                    job.download_state = models.Data.DOWNLOAD_FINISHED
+                    size = downloader.download(url, file,
+                                               connections=CONNECTIONS,
+                                               progress=progbar.update,
+                                               verify_gzip=file.suffix == '.gz',
+                                               throttle=throttle(url))
+                    finish_job(session=session, uri=uri, size=size)
+                    observe_job(start, size)
                     logging.info(f'Job '
                                  f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
                                  f'succeeded'
@@ -172,40 +293,353 @@ def main():
                 except KeyboardInterrupt:
                     raise KeyboardInterrupt
                 except Exception as e:
+                    health.record(e)
                     if tries < RETRIES:
+                        session.rollback()
                         logging.error(f'{colorama.Fore.LIGHTRED_EX}'
                                       f'An error has occurred: {e}'
                                       f'{colorama.Fore.RESET}')
                         logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        metrics.incr('retries')
                         time.sleep(RETRY_INTERVAL)
+                        health.wait(urlparse(url).hostname)
                         tries += 1
                     else:
-                        job = find_job_by_uri(session=session, uri=uri)
-                        job.download_state = models.Data.DOWNLOAD_FAILED
+                        fail_job(session=session, uri=uri)
+                        metrics.incr('jobs_failed')
                         logging.error(f'Job '
                                       f'{colorama.Back.RED}'
                                       f'failed'
                                       f'{colorama.Back.RESET}'
                                       f'.')
                         break
-
-            session.add(job)
-            session.commit()
             session.close()
 
         except KeyboardInterrupt:
-            job = find_job_by_uri(session=session, uri=uri)
-            job.started_at = None
-            job.download_state = models.Data.DOWNLOAD_PENDING
+            session.rollback()
+            release_jobs(session=session, uris=[uri, *queue])
             logging.warning(f'Job '
                             f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
                             f'cancelled'
                             f'{colorama.Fore.RESET}{colorama.Back.RESET}'
                             f'.')
-            session.add(job)
-            session.commit()
             session.close()
+            log_metrics()
+            return
+
+
+def partition_jobs() -> List[str]:
+    """The URIs of the manifest in this worker's partition that the journal has not recorded as finished."""
+    finished = {uri for uri, entry in JOURNAL.latest().items() if entry['state'] == partition.FINISHED}
+    with load_manifest.open_manifest(PARTITION_MANIFEST) as stream:
+        return [uri for uri in load_manifest.read_uris(stream)
+                if partition.owns(uri, PARTITION_INDEX, PARTITION_COUNT) and uri not in finished]
+
+
+def partition_main():
+    """Downloads worker `PARTITION_INDEX` of `PARTITION_COUNT`'s share of the manifest without the database.
+
+    The outcome of every job goes to the local journal instead, and `reconcile.py` syncs
+    the journals into the data table later in bulk.
+    """
+    if not 0 <= PARTITION_INDEX < PARTITION_COUNT:
+        panic(f'{colorama.Fore.LIGHTRED_EX}'
+              f'Partition index {PARTITION_INDEX} is out of range for {PARTITION_COUNT} partitions.'
+              f'{colorama.Fore.RESET}')
+    register_health(None)
+    queue = collections.deque(partition_jobs())
+    logging.info(f'Partition loaded: '
+                 f'{colorama.Fore.LIGHTMAGENTA_EX}'
+                 f'{{index={PARTITION_INDEX}, count={PARTITION_COUNT}, jobs={len(queue)}, journal={JOURNAL.path}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+    try:
+        while len(queue) > 0:
+            check_schedule(start_time=START_TIME, end_time=END_TIME, enabled=SCHEDULE_ENABLED)
+            health.wait()
+            if BACKPRESSURE is not None:
+                BACKPRESSURE.wait()
+            uri = queue[0]
+
+            url = f'{URL_BASE}/{uri}'
+            logging.info(f'Download from '
+                         f'{colorama.Fore.LIGHTCYAN_EX}'
+                         f'{url}'
+                         f'{colorama.Fore.RESET}')
+            file = pathlib.Path(DOWNLOAD_PATH).joinpath(uri)
+            file.parent.mkdir(parents=True, exist_ok=True)
+
+            tries = 0
+            start = time.time()
+            while True:
+                try:
+                    progbar = utils.DownloadProgBar()
+                    size = downloader.download(url, file,
+                                               connections=CONNECTIONS,
+                                               progress=progbar.update,
+                                               verify_gzip=file.suffix == '.gz',
+                                               throttle=throttle(url))
+                    JOURNAL.append(uri=uri,
+                                   state=partition.FINISHED,
+                                   size=size,
+                                   worker=WORKER_NAME,
+                                   finished_at=datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).isoformat())
+                    observe_job(start, size)
+                    logging.info(f'Job '
+                                 f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
+                                 f'succeeded'
+                                 f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                                 f'.')
+                    break
+                except KeyboardInterrupt:
+                    raise KeyboardInterrupt
+                except Exception as e:
+                    health.record(e)
+                    if tries < RETRIES:
+                        logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                                      f'An error has occurred: {e}'
+                                      f'{colorama.Fore.RESET}')
+                        logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                        metrics.incr('retries')
+                        time.sleep(RETRY_INTERVAL)
+                        health.wait(urlparse(url).hostname)
+                        tries += 1
+                    else:
+                        JOURNAL.append(uri=uri,
+                                       state=partition.FAILED,
+                                       worker=WORKER_NAME,
+                                       finished_at=datetime.datetime.now(tz=pytz.timezone(TIMEZONE)).isoformat())
+                        metrics.incr('jobs_failed')
+                        logging.error(f'Job '
+                                      f'{colorama.Back.RED}'
+                                      f'failed'
+                                      f'{colorama.Back.RESET}'
+                                      f'.')
+                        break
+            queue.popleft()
+        logging.info('No job left in this partition. This program is about to exit.')
+
+    except KeyboardInterrupt:
+        logging.warning(f'Job '
+                        f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
+                        f'cancelled'
+                        f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                        f'.')
+    finally:
+        JOURNAL.close()
+    log_metrics()
+
+
+async def wait_event(event: asyncio.Event, timeout: float) -> bool:
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return event.is_set()
+
+
+async def daemon_job(uri: str,
+                     run_db: Callable,
+                     executor: ThreadPoolExecutor,
+                     stop: asyncio.Event,
+                     cancel: threading.Event):
+    loop = asyncio.get_event_loop()
+    url = f'{URL_BASE}/{uri}'
+    file = pathlib.Path(DOWNLOAD_PATH).joinpath(uri)
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tries = 0
+    start = time.time()
+    while True:
+        try:
+            size = await loop.run_in_executor(executor, functools.partial(downloader.download, url, file,
+                                                                          connections=CONNECTIONS,
+                                                                          cancel=cancel,
+                                                                          verify_gzip=file.suffix == '.gz',
+                                                                          throttle=throttle(url)))
+            await run_db(finish_job, uri, size)
+            observe_job(start, size)
+            logging.info(f'Job '
+                         f'{colorama.Fore.LIGHTCYAN_EX}'
+                         f'{{uri={uri}, speed={size / ratelimit.MIB / max(time.time() - start, 1e-3):.2f} MiB/s}}'
+                         f'{colorama.Fore.RESET} '
+                         f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
+                         f'succeeded'
+                         f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                         f'.')
+            return
+        except downloader.DownloadCancelled:
+            break
+        except Exception as e:
+            health.record(e)
+            if tries < RETRIES:
+                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                              f'An error has occurred in job {{uri={uri}}}: {e}'
+                              f'{colorama.Fore.RESET}')
+                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                metrics.incr('retries')
+                if await wait_event(stop, RETRY_INTERVAL):
+                    break
+                await loop.run_in_executor(executor, functools.partial(health.wait, urlparse(url).hostname,
+                                                                       cancel=cancel))
+                if stop.is_set():
+                    break
+                tries += 1
+            else:
+                await run_db(fail_job, uri)
+                metrics.incr('jobs_failed')
+                logging.error(f'Job '
+                              f'{colorama.Fore.LIGHTCYAN_EX}'
+                              f'{{uri={uri}}}'
+                              f'{colorama.Fore.RESET} '
+                              f'{colorama.Back.RED}'
+                              f'failed'
+                              f'{colorama.Back.RESET}'
+                              f'.')
+                return
+    await run_db(release_jobs, [uri])
+    logging.warning(f'Job '
+                    f'{colorama.Fore.LIGHTCYAN_EX}'
+                    f'{{uri={uri}}}'
+                    f'{colorama.Fore.RESET} '
+                    f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
+                    f'cancelled'
+                    f'{colorama.Fore.RESET}{colorama.Back.RESET}'
+                    f'.')
+
+
+async def next_job(queue: collections.deque, lock: asyncio.Lock, run_db: Callable):
+    async with lock:
+        if len(queue) == 0:
+            queue.extend(await run_db(claim_jobs, BATCH_SIZE))
+        return queue.popleft() if len(queue) > 0 else None
+
+
+async def adjust_concurrency(controller: ratelimit.ConcurrencyController, stop: asyncio.Event):
+    transferred = LIMITER.transferred
+    last = time.monotonic()
+    while not await wait_event(stop, RATELIMIT_ADJUST_INTERVAL):
+        now = time.monotonic()
+        throughput = (LIMITER.transferred - transferred) / (now - last)
+        transferred, last = LIMITER.transferred, now
+        limit = controller.update(throughput, LIMITER.rate)
+        metrics.gauge('throughput_mib_s', throughput / ratelimit.MIB)
+        metrics.gauge('concurrency', limit)
+        logging.info(f'Bandwidth: '
+                     f'{colorama.Fore.LIGHTMAGENTA_EX}'
+                     f'{{throughput={throughput / ratelimit.MIB:.2f} MiB/s, '
+                     f'cap={LIMITER.rate / ratelimit.MIB:g} MiB/s, jobs={limit}}}'
+                     f'{colorama.Fore.RESET}'
+                     f'.')
+
+
+async def renew_leases(run_db: Callable, stop: asyncio.Event):
+    while not await wait_event(stop, LEASE_HEARTBEAT_INTERVAL):
+        try:
+            await run_db(LEASES.renew)
+        except Exception as e:
+            health.record(e)
+            logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                          f'Failed to renew leases: {e}'
+                          f'{colorama.Fore.RESET}')
+
+
+async def daemon_worker(index: int,
+                        run_db: Callable,
+                        queue: collections.deque,
+                        lock: asyncio.Lock,
+                        executor: ThreadPoolExecutor,
+                        stop: asyncio.Event,
+                        drained: asyncio.Event,
+                        cancel: threading.Event,
+                        controller: Optional[ratelimit.ConcurrencyController] = None):
+    loop = asyncio.get_event_loop()
+    tries = 0
+    while not stop.is_set() and not drained.is_set():
+        if controller is not None and index >= controller.limit:
+            await wait_event(stop, 1)
+            continue
+        if SCHEDULE_ENABLED and not in_schedule(START_TIME, END_TIME):
+            await wait_event(stop, SCHEDULE_RETRY_INTERVAL)
+            continue
+        if BACKPRESSURE is not None and await loop.run_in_executor(executor, BACKPRESSURE.check):
+            await wait_event(stop, BACKPRESSURE_CHECK_INTERVAL)
+            continue
+        await loop.run_in_executor(executor, functools.partial(health.wait, cancel=cancel))
+        try:
+            uri = await next_job(queue, lock, run_db)
+        except Exception as e:
+            health.record(e)
+            if tries < RETRIES:
+                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                              f'An error has occurred: {e}'
+                              f'{colorama.Fore.RESET}')
+                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
+                await wait_event(stop, RETRY_INTERVAL)
+                await loop.run_in_executor(executor, functools.partial(health.wait, 'database', cancel=cancel))
+                tries += 1
+                continue
+            panic(f'{colorama.Fore.LIGHTRED_EX}'
+                  f'Failed to fetch a new job after {RETRIES} retries.'
+                  f'{colorama.Fore.RESET}')
+        tries = 0
+        if uri is None:
+            logging.info('No unclaimed job found. This download slot is about to exit.')
+            drained.set()
             return
+        await daemon_job(uri, run_db=run_db, executor=executor, stop=stop, cancel=cancel)
+
+
+async def daemon():
+    """Keeps up to `DAEMON_JOBS` downloads in flight from a single process.
+
+    All database traffic goes through one engine on a dedicated thread, so the
+    process holds a single MySQL connection regardless of the number of jobs.
+    """
+    loop = asyncio.get_event_loop()
+    db_engine = db.db_connect(DB_CONF, pool_size=1)
+    register_health(db_engine)
+    db_executor = ThreadPoolExecutor(max_workers=1)
+    executor = ThreadPoolExecutor(max_workers=DAEMON_JOBS)
+    queue = collections.deque()
+    lock = asyncio.Lock()
+    stop = asyncio.Event()
+    drained = asyncio.Event()
+    cancel = threading.Event()
+    controller = ratelimit.ConcurrencyController(DAEMON_JOBS) if LIMITER is not None else None
+
+    def run_db(fn: Callable, *args):
+        return loop.run_in_executor(db_executor, functools.partial(run_in_session, db_engine, fn, *args))
+
+    def shutdown():
+        logging.warning('Stopping, in-flight jobs will be cancelled...')
+        stop.set()
+        cancel.set()
+
+    loop.add_signal_handler(signal.SIGINT, shutdown)
+    loop.add_signal_handler(signal.SIGTERM, shutdown)
+    logging.info(f'Daemon started: '
+                 f'{colorama.Fore.LIGHTMAGENTA_EX}'
+                 f'{{jobs={DAEMON_JOBS}}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+    adjuster = asyncio.ensure_future(adjust_concurrency(controller, stop)) if controller is not None else None
+    heartbeat = asyncio.ensure_future(renew_leases(run_db, stop))
+    try:
+        await asyncio.gather(*[daemon_worker(index, run_db, queue=queue, lock=lock, executor=executor, stop=stop,
+                                             drained=drained, cancel=cancel, controller=controller)
+                               for index in range(DAEMON_JOBS)])
+    finally:
+        if adjuster is not None:
+            adjuster.cancel()
+        heartbeat.cancel()
+        cancel.set()
+        executor.shutdown(wait=True)
+        await run_db(release_jobs, list(queue))
+        db_executor.shutdown(wait=True)
+        db_engine.dispose()
+    log_metrics()
+    logging.info(f'Bye.')
 
 
 if __name__ == '__main__':
@@ -216,13 +650,57 @@ if __name__ == '__main__':
     RETRIES = config.getint('worker', 'retries')
     SOCKET_TIMEOUT = config.getint('worker', 'socket_timeout')
     DOWNLOAD_PATH = config.get('worker', 'download_path')
+    CONNECTIONS = config.getint('worker', 'connections')
+    BATCH_SIZE = config.getint('worker', 'batch_size')
     SCHEDULE_ENABLED = config.getboolean('schedule', 'enabled')
     START_TIME = config.get('schedule', 'start_time')
     END_TIME = config.get('schedule', 'end_time')
     SCHEDULE_RETRY_INTERVAL = config.getint('schedule', 'retry_interval')
+    DAEMON_ENABLED = config.getboolean('daemon', 'enabled')
+    DAEMON_JOBS = config.getint('daemon', 'jobs')
+    LEASE_DURATION = config.getint('lease', 'duration')
+    LEASE_HEARTBEAT_INTERVAL = config.getint('lease', 'heartbeat_interval')
+    LEASES = lease.Leases(models.Data,
+                          owner=lease.default_owner(WORKER_NAME),
+                          duration=LEASE_DURATION,
+                          interval=LEASE_HEARTBEAT_INTERVAL,
+                          timezone=TIMEZONE,
+                          key='uri')
+    HEALTH_THRESHOLD = config.getint('health', 'threshold')
+    HEALTH_BACKOFF = config.getfloat('health', 'backoff')
+    HEALTH_MAX_BACKOFF = config.getfloat('health', 'max_backoff')
+    BACKPRESSURE_ENABLED = config.getboolean('backpressure', 'enabled')
+    BACKPRESSURE_CHECK_INTERVAL = config.getint('backpressure', 'check_interval')
+    BACKPRESSURE = backpressure.Watermarks(
+        DOWNLOAD_PATH,
+        pause_free=config.getfloat('backpressure', 'pause_free_space'),
+        resume_free=config.getfloat('backpressure', 'resume_free_space'),
+        pause_files=config.getint('backpressure', 'pause_pending_files'),
+        resume_files=config.getint('backpressure', 'resume_pending_files'),
+        interval=BACKPRESSURE_CHECK_INTERVAL
+    ) if BACKPRESSURE_ENABLED else None
+    PARTITION_ENABLED = config.getboolean('partition', 'enabled')
+    PARTITION_INDEX = int(os.environ.get('PARTITION_INDEX', config.get('partition', 'index')))
+    PARTITION_COUNT = config.getint('partition', 'count')
+    PARTITION_MANIFEST = config.get('partition', 'manifest')
+    JOURNAL = partition.Journal(pathlib.Path(config.get('partition', 'journal_path'))
+                                .joinpath(f'{PARTITION_INDEX}-of-{PARTITION_COUNT}.jsonl'))
+    RATELIMIT_ENABLED = config.getboolean('ratelimit', 'enabled')
+    RATELIMIT_ADJUST_INTERVAL = config.getint('ratelimit', 'adjust_interval')
+    LIMITER = ratelimit.RateLimiter(
+        ratelimit.RateSchedule(ratelimit.parse_windows(config.get('ratelimit', 'windows')),
+                               default=config.getfloat('ratelimit', 'default'),
+                               clock=now_time),
+        burst=config.getfloat('ratelimit', 'burst') * ratelimit.MIB
+    ) if RATELIMIT_ENABLED else None
 
     colorama.init()
     logging.basicConfig(level=logging.INFO,
                         format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
     socket.setdefaulttimeout(SOCKET_TIMEOUT)
-    main()
+    if PARTITION_ENABLED:
+        partition_main()
+    elif DAEMON_ENABLED:
+        asyncio.run(daemon())
+    else:
+        main()
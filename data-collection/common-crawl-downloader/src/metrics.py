@@ -0,0 +1,70 @@
+import logging
+import threading
+import collections
+import numpy as np
+
+from typing import Deque, Dict
+
+MAX_SAMPLES = 10000
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_samples: Dict[str, Deque[float]] = {}
+
+
+def incr(name: str, n: float = 1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name: str, value: float):
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, value: float):
+    with _lock:
+        if name not in _samples:
+            _samples[name] = collections.deque(maxlen=MAX_SAMPLES)
+        _samples[name].append(value)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _samples.clear()
+
+
+def summary() -> Dict:
+    """Returns the counters, the gauges and p50/p99 of the most recent samples of every observed value."""
+    with _lock:
+        result = {
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'samples': {},
+        }
+        for name, samples in _samples.items():
+            if len(samples) > 0:
+                result['samples'][name] = {
+                    'count': len(samples),
+                    'mean': float(np.mean(samples)),
+                    'p50': float(np.percentile(samples, 50)),
+                    'p99': float(np.percentile(samples, 99)),
+                }
+    return result
+
+
+def log_summary():
+    result = summary()
+    for name, value in result['counters'].items():
+        logging.info(f'Metric {name}: {value:g}')
+    for name, value in result['gauges'].items():
+        logging.info(f'Metric {name}: {value:g}')
+    for name, stats in result['samples'].items():
+        logging.info(f'Metric {name}: '
+                     f'count={stats["count"]}, '
+                     f'mean={stats["mean"]:.4f}, '
+                     f'p50={stats["p50"]:.4f}, '
+                     f'p99={stats["p99"]:.4f}')
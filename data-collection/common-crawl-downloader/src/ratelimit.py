@@ -0,0 +1,189 @@
+import time
+import threading
+import collections
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+MIB = 1024 * 1024
+
+
+def in_window(now: str, start_time: str, end_time: str) -> bool:
+    """Whether `now` falls into `[start_time, end_time]`, all formatted as `%H:%M:%S`. Windows may wrap around midnight."""
+    if start_time <= end_time:
+        return start_time <= now <= end_time
+    return not end_time < now < start_time
+
+
+def parse_windows(value: str) -> List[Tuple[str, str, float]]:
+    """Parses `08:00:00-19:59:59=2, 20:00:00-07:59:59=0` into `(start_time, end_time, MiB/s)` tuples."""
+    windows = []
+    for item in value.split(','):
+        item = item.strip()
+        if item:
+            span, rate = item.split('=')
+            start_time, end_time = span.strip().split('-')
+            windows.append((start_time, end_time, float(rate)))
+    return windows
+
+
+class RateSchedule:
+    """Maps the time of day to a bandwidth cap in bytes per second. A cap of 0 means unlimited."""
+
+    def __init__(self, windows: List[Tuple[str, str, float]], default: float = 0, clock: Callable[[], str] = None):
+        self._windows = windows
+        self._default = default
+        self._clock = clock or (lambda: time.strftime('%H:%M:%S'))
+
+    def rate(self) -> float:
+        now = self._clock()
+        for start_time, end_time, rate in self._windows:
+            if in_window(now, start_time, end_time):
+                return rate * MIB
+        return self._default * MIB
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill()
+            self._rate = rate
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def consume(self, n: int):
+        """Takes `n` tokens, sleeping until they are available. Does nothing while the rate is unlimited."""
+        with self._lock:
+            if self._rate <= 0:
+                return
+            self._refill()
+            self._tokens -= n
+            delay = -self._tokens / self._rate if self._tokens < 0 else 0
+        if delay > 0:
+            time.sleep(delay)
+
+
+class RateLimiter:
+    """Keeps one token bucket per remote host and follows the caps of a `RateSchedule`.
+
+    The buckets are shared by every download of the process, so the caps hold for
+    the whole process rather than for a single connection.
+    """
+
+    REFRESH_INTERVAL = 1
+
+    def __init__(self, schedule: RateSchedule, burst: float = 4 * MIB):
+        self._schedule = schedule
+        self._burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._rate = schedule.rate()
+        self._refreshed = time.monotonic()
+        self.transferred = 0
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._refreshed >= self.REFRESH_INTERVAL:
+            self._refreshed = now
+            rate = self._schedule.rate()
+            if rate != self._rate:
+                self._rate = rate
+                for bucket in self._buckets.values():
+                    bucket.set_rate(rate)
+
+    def consume(self, host: str, n: int):
+        with self._lock:
+            self._refresh()
+            self.transferred += n
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self._rate, self._burst)
+            bucket = self._buckets[host]
+        bucket.consume(n)
+
+
+class ConcurrencyController:
+    """Adjusts the number of concurrent downloads to the measured throughput.
+
+    Each decision is taken on the mean throughput of the `settle` updates since the last
+    change, so that a change is judged once it has taken effect. While a cap is in force,
+    one download is dropped when the throughput is within `high` of it, since more transfers
+    would only share the same bandwidth, and one is added when it is below `low`; in between
+    the limit is kept. Without a cap, one download is added as long as that keeps improving
+    the throughput.
+
+    A change that made things worse, an addition that did not improve the throughput or a
+    drop that fell below `low`, is undone and the limit is held for `hold` updates, doubled
+    on every consecutive undo, so that the limit settles instead of swinging back and forth.
+    """
+
+    def __init__(self,
+                 maximum: int,
+                 minimum: int = 1,
+                 hold: int = 5,
+                 settle: int = 3,
+                 low: float = 0.8,
+                 high: float = 0.95):
+        self._maximum = maximum
+        self._minimum = minimum
+        self._hold = hold
+        self._settle = settle
+        self._low = low
+        self._high = high
+        self._samples = collections.deque(maxlen=settle)
+        self._wait = settle
+        self._undone = 0
+        self._step = 0
+        self._baseline: Optional[float] = None
+        self._cap: Optional[float] = None
+        self.limit = maximum
+
+    def _change(self, step: int, throughput: float, wait: int):
+        self.limit = min(self._maximum, max(self._minimum, self.limit + step))
+        self._step = step
+        self._baseline = throughput
+        self._samples.clear()
+        self._wait = wait
+
+    def update(self, throughput: float, cap: float) -> int:
+        if cap != self._cap:
+            self._cap = cap
+            self._undone = 0
+            self._step = 0
+            self._samples.clear()
+            self._wait = self._settle
+        self._samples.append(throughput)
+        self._wait -= 1
+        if self._wait > 0:
+            return self.limit
+        throughput = sum(self._samples) / len(self._samples)
+        undo = (self._step > 0 and throughput < self._baseline * 1.05) or \
+               (self._step < 0 and cap > 0 and throughput < cap * self._low)
+        if undo:
+            self._undone += 1
+            self._change(-self._step, throughput, self._settle + self._hold * 2 ** min(self._undone - 1, 4))
+            self._step = 0
+            return self.limit
+        if self._step != 0:
+            self._undone = 0
+        if cap > 0 and throughput >= cap * self._high and self.limit > self._minimum:
+            self._change(-1, throughput, self._settle)
+        elif (cap == 0 or throughput < cap * self._low) and self.limit < self._maximum:
+            self._change(1, throughput, self._settle)
+        else:
+            self._step = 0
+            self._wait = 1
+        return self.limit
@@ -0,0 +1,88 @@
+import time
+import logging
+import datetime
+import argparse
+import colorama
+
+import db
+import models
+import configs
+import partition
+import load_manifest
+
+from typing import Dict, List
+from sqlalchemy import and_, bindparam, select, update
+from sqlalchemy.engine import Engine
+
+CONFIG_PATH = 'configs'
+BATCH_SIZE = 5000
+
+
+def worker_ids(db_engine: Engine, names: List[str]) -> Dict[str, int]:
+    """Returns the ids of the named workers, creating the missing ones."""
+    table = models.Worker.__table__
+    with db_engine.begin() as connection:
+        ids = dict(connection.execute(select(table.c.name, table.c.id).where(table.c.name.in_(names))).all())
+        for name in names:
+            if name not in ids:
+                ids[name] = connection.execute(table.insert().values(name=name)).inserted_primary_key[0]
+    return ids
+
+
+def apply_batch(db_engine: Engine, entries: List[Dict]) -> int:
+    """Writes the journaled outcome of a batch of jobs into the data table. Returns the number of updated rows.
+
+    Rows missing from the table are inserted first. A row that is already finished in the
+    database is left as it is.
+    """
+    load_manifest.insert_batch(db_engine, [entry['uri'] for entry in entries], None)
+    ids = worker_ids(db_engine, sorted({entry['worker'] for entry in entries}))
+    table = models.Data.__table__
+    statement = update(table) \
+        .where(and_(table.c.uri == bindparam('b_uri'),
+                    table.c.download_state != models.Data.DOWNLOAD_FINISHED)) \
+        .values(download_state=bindparam('b_state'),
+                size=bindparam('b_size'),
+                finished_at=bindparam('b_finished_at'),
+                id_worker=bindparam('b_worker'),
+                lease_owner=None,
+                lease_expires_at=None)
+    rows = [{'b_uri': entry['uri'],
+             'b_state': models.Data.DOWNLOAD_FINISHED if entry['state'] == partition.FINISHED
+             else models.Data.DOWNLOAD_FAILED,
+             'b_size': entry.get('size', 0),
+             'b_finished_at': datetime.datetime.fromisoformat(entry['finished_at']),
+             'b_worker': ids[entry['worker']]}
+            for entry in entries]
+    with db_engine.begin() as connection:
+        return connection.execute(statement, rows).rowcount
+
+
+def reconcile(db_engine: Engine, journals: List[str], batch_size: int = BATCH_SIZE):
+    start = time.time()
+    entries = list(partition.merge(partition.Journal(path) for path in journals).values())
+    updated = 0
+    for i in range(0, len(entries), batch_size):
+        updated += apply_batch(db_engine, entries[i:i + batch_size])
+        logging.info(f'{min(i + batch_size, len(entries))} of {len(entries)} journal entries applied.')
+    logging.info(f'Journals reconciled: '
+                 f'{colorama.Fore.LIGHTCYAN_EX}'
+                 f'{{journals={len(journals)}, entries={len(entries)}, updated={updated}, '
+                 f'time={time.time() - start:.2f}s}}'
+                 f'{colorama.Fore.RESET}'
+                 f'.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Syncs the journals of partitioned workers into the data table.')
+    parser.add_argument('journals', type=str, nargs='+', help='journal files written in partition mode')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='rows per transaction')
+    args = parser.parse_args()
+
+    colorama.init()
+    logging.basicConfig(level=logging.INFO,
+                        format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
+    config = configs.config(CONFIG_PATH)
+    engine = db.db_connect(db.get_database_config(config))
+    reconcile(engine, args.journals, batch_size=args.batch_size)
+    engine.dispose()
@@ -0,0 +1,156 @@
+"""Measures the downloader against a local stand-in for the Common Crawl bucket.
+
+Each variant runs `main()` or `daemon()` from `src/main.py` over a fresh SQLite job table,
+then reports the throughput, the p50/p99 time per job and the number of retries.
+
+    python tests/bench_downloader.py --jobs 8 --size 32 --latency 0.05 --bandwidth 20 --fail-rate 0.05
+"""
+import io
+import sys
+import json
+import time
+import asyncio
+import logging
+import pathlib
+import argparse
+import tempfile
+import contextlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import db
+import main
+import lease
+import models
+import metrics
+import http_pool
+import bench_server
+
+from typing import Dict
+from sqlalchemy.orm import Session
+
+BASE = dict(
+    WORKER_NAME='bench',
+    RETRY_INTERVAL=0,
+    RETRIES=3,
+    SOCKET_TIMEOUT=30,
+    CONNECTIONS=1,
+    BATCH_SIZE=1,
+    SCHEDULE_ENABLED=False,
+    START_TIME='00:00:00',
+    END_TIME='23:59:59',
+    SCHEDULE_RETRY_INTERVAL=60,
+    DAEMON_ENABLED=False,
+    DAEMON_JOBS=4,
+    LEASE_HEARTBEAT_INTERVAL=60,
+    HEALTH_THRESHOLD=3,
+    HEALTH_BACKOFF=1,
+    HEALTH_MAX_BACKOFF=10,
+    BACKPRESSURE=None,
+    BACKPRESSURE_CHECK_INTERVAL=30,
+    RATELIMIT_ENABLED=False,
+    RATELIMIT_ADJUST_INTERVAL=30,
+    LIMITER=None,
+)
+
+VARIANTS = {
+    'sequential': {},
+    'ranged': {'CONNECTIONS': 4},
+    'batched': {'CONNECTIONS': 4, 'BATCH_SIZE': 8},
+    'daemon': {'BATCH_SIZE': 4, 'DAEMON_ENABLED': True},
+    'daemon-ranged': {'CONNECTIONS': 4, 'BATCH_SIZE': 4, 'DAEMON_ENABLED': True},
+}
+
+
+def create_jobs(path: pathlib.Path, n_jobs: int) -> db.DatabaseConfig:
+    conf = db.DatabaseConfig(drivername='sqlite', database=str(path))
+    engine = db.db_connect(conf)
+    models.Base.metadata.create_all(engine)
+    with Session(bind=engine) as session:
+        for i in range(n_jobs):
+            data = models.Data()
+            data.uri = f'crawl-data/CC-MAIN-BENCH/segments/{i}/wet/CC-MAIN-BENCH-{i:05d}.warc.wet.gz'
+            session.add(data)
+        session.commit()
+    engine.dispose()
+    return conf
+
+
+def run_variant(name: str, url_base: str, workdir: pathlib.Path, n_jobs: int) -> Dict:
+    workdir.mkdir(parents=True)
+    settings = dict(BASE, **VARIANTS[name])
+    settings['DB_CONF'] = create_jobs(workdir.joinpath('jobs.db'), n_jobs)
+    settings['DOWNLOAD_PATH'] = str(workdir.joinpath('downloaded'))
+    settings['LEASES'] = lease.Leases(models.Data, owner=lease.default_owner('bench'),
+                                      interval=settings['LEASE_HEARTBEAT_INTERVAL'], timezone=main.TIMEZONE, key='uri')
+    for key, value in settings.items():
+        setattr(main, key, value)
+    main.URL_BASE = url_base
+
+    http_pool.close()
+    metrics.reset()
+    opened = http_pool.stats()['connections_opened']
+    start = time.time()
+    # The progress bars would drown the report.
+    with contextlib.redirect_stdout(io.StringIO()):
+        if settings['DAEMON_ENABLED']:
+            asyncio.run(main.daemon())
+        else:
+            main.main()
+    elapsed = time.time() - start
+
+    result = metrics.summary()
+    counters = result['counters']
+    job_time = result['samples'].get('job_time', {'p50': float('nan'), 'p99': float('nan')})
+    return {
+        'variant': name,
+        'jobs': int(counters.get('jobs_finished', 0)),
+        'failed': int(counters.get('jobs_failed', 0)),
+        'mib_s': counters.get('bytes_downloaded', 0) / bench_server.MIB / elapsed,
+        'p50': job_time['p50'],
+        'p99': job_time['p99'],
+        'retries': int(counters.get('retries', 0)),
+        'connections': http_pool.stats()['connections_opened'] - opened,
+        'elapsed': elapsed,
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description='Downloader throughput benchmark.')
+    parser.add_argument('--jobs', type=int, default=8, help='number of segments per variant')
+    parser.add_argument('--size', type=float, default=32, help='segment size in MiB')
+    parser.add_argument('--latency', type=float, default=0, help='time to first byte in seconds')
+    parser.add_argument('--bandwidth', type=float, default=0, help='MiB/s per response, 0 for unlimited')
+    parser.add_argument('--fail-rate', type=float, default=0, help='probability that a response fails')
+    parser.add_argument('--variants', nargs='+', choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show the downloader log')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    server = bench_server.CrawlServer(size=int(args.size * bench_server.MIB),
+                                      latency=args.latency,
+                                      bandwidth=args.bandwidth * bench_server.MIB,
+                                      fail_rate=args.fail_rate)
+    url_base = server.start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in args.variants:
+                results.append(run_variant(name, url_base, pathlib.Path(tmp).joinpath(name), args.jobs))
+    finally:
+        server.stop()
+        http_pool.close()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f'{"variant":<16}{"jobs":>6}{"failed":>8}{"MiB/s":>10}{"p50 (s)":>10}{"p99 (s)":>10}'
+          f'{"retries":>9}{"conns":>7}')
+    for result in results:
+        print(f'{result["variant"]:<16}{result["jobs"]:>6}{result["failed"]:>8}{result["mib_s"]:>10.2f}'
+              f'{result["p50"]:>10.3f}{result["p99"]:>10.3f}{result["retries"]:>9}{result["connections"]:>7}')
+
+
+if __name__ == '__main__':
+    main_()
@@ -0,0 +1,148 @@
+import io
+import re
+import gzip
+import time
+import random
+import threading
+import http.server
+
+from typing import Optional
+
+MIB = 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+WORDS = ['the', 'of', 'and', 'common', 'crawl', 'data', 'web', 'page', 'archive', 'segment',
+         '中文', '数据', '网页', '下载', '我们', '今天', '公园', '天气', '非常', '好']
+
+
+def synthetic_wet(size: int, seed: int = 0) -> bytes:
+    """Builds a multi-member gzip file of at least `size` bytes that looks like a `.warc.wet.gz` segment."""
+    rnd = random.Random(seed)
+    blocks = [' '.join(rnd.choice(WORDS) for _ in range(4096)).encode('utf-8') for _ in range(64)]
+    out = io.BytesIO()
+    index = 0
+    while out.tell() < size:
+        payload = b'\n'.join(rnd.choice(blocks) for _ in range(rnd.randint(1, 4)))
+        record = (f'WARC/1.0\r\n'
+                  f'WARC-Type: conversion\r\n'
+                  f'WARC-Target-URI: http://example.com/{index}\r\n'
+                  f'Content-Type: text/plain\r\n'
+                  f'Content-Length: {len(payload)}\r\n\r\n').encode('utf-8') + payload + b'\r\n\r\n'
+        out.write(gzip.compress(record, compresslevel=1))
+        index += 1
+    return out.getvalue()
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *_):
+        pass
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def _serve(self, body: bool):
+        crawl: CrawlServer = self.server.crawl
+        if self.path == '/':
+            # Answers health probes of the bucket root without a segment download.
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            if body:
+                self.wfile.write(b'OK')
+            return
+        crawl.count('requests')
+        if crawl.latency > 0:
+            time.sleep(crawl.latency)
+        failure = crawl.draw_failure() if body else None
+        if failure == 'error':
+            self.send_error(503)
+            return
+        data = crawl.data
+        match = re.match(r'bytes=(\d+)-(\d*)$', self.headers.get('Range', ''))
+        if match is not None:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else len(data) - 1, len(data) - 1)
+            if start > end:
+                self.send_error(416)
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            start, end = 0, len(data) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        if not body:
+            return
+        if failure == 'truncate':
+            end = start + (end - start) // 2
+        began = time.monotonic()
+        sent = 0
+        try:
+            for offset in range(start, end + 1, CHUNK_SIZE):
+                chunk = data[offset:min(offset + CHUNK_SIZE, end + 1)]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if crawl.bandwidth > 0:
+                    delay = sent / crawl.bandwidth - (time.monotonic() - began)
+                    if delay > 0:
+                        time.sleep(delay)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client may hang up early, e.g. after the part of an open-ended range it needs.
+            self.close_connection = True
+            return
+        if failure == 'truncate':
+            self.wfile.flush()
+            self.close_connection = True
+
+
+class CrawlServer:
+    """A local stand-in for the Common Crawl bucket.
+
+    Every path but `/` serves the same synthetic segment and supports `Range` requests. Each
+    response is delayed by `latency` seconds and paced at `bandwidth` bytes per second
+    (0 for unlimited). With probability `fail_rate`, a response either fails with HTTP
+    503 or is cut off halfway through its body.
+    """
+
+    def __init__(self, size: int = 16 * MIB, latency: float = 0, bandwidth: float = 0, fail_rate: float = 0,
+                 seed: int = 0):
+        self.data = synthetic_wet(size, seed)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.fail_rate = fail_rate
+        self.stats = {'requests': 0, 'failures': 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server: Optional[http.server.ThreadingHTTPServer] = None
+
+    def count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def draw_failure(self) -> Optional[str]:
+        with self._lock:
+            if self._random.random() >= self.fail_rate:
+                return None
+            self.stats['failures'] += 1
+            return self._random.choice(['error', 'truncate'])
+
+    def start(self) -> str:
+        """Starts serving on a free local port and returns the base URL."""
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.crawl = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
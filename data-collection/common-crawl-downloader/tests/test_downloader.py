@@ -0,0 +1,65 @@
+"""Checks the download of a segment from servers that ignore ranges or leave the length unknown.
+
+    python -m pytest tests/test_downloader.py
+"""
+import sys
+import pathlib
+import threading
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import utils
+import downloader
+
+BODY = b'segment data ' * 10000
+
+
+class ChunkedHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for start in range(0, len(BODY), 4096):
+            chunk = BODY[start:start + 4096]
+            self.wfile.write(f'{len(chunk):x}\r\n'.encode('ascii') + chunk + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def log_message(self, *_):
+        pass
+
+
+class UnknownTotalHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes 0-{len(BODY) - 1}/*')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture(params=[ChunkedHandler, UnknownTotalHandler])
+def url(request):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), request.param)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/segment.warc.wet.gz'
+    server.shutdown()
+    server.server_close()
+
+
+def test_unknown_length(tmp_path, url):
+    file = tmp_path.joinpath('segment.warc.wet.gz')
+    progbar = utils.DownloadProgBar()
+    assert downloader.download(url, file, connections=4, progress=progbar.update) == len(BODY)
+    assert file.read_bytes() == BODY
+    assert not downloader.part_path(file).exists()
+    assert not downloader.state_path(file).exists()
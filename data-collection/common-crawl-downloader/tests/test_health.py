@@ -0,0 +1,40 @@
+"""Checks that a retry waits for the breaker of the dependency it failed on, and only for that one.
+
+    python -m pytest tests/test_health.py
+"""
+import sys
+import time
+import pathlib
+import threading
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import health
+
+
+def test_wait_named(monkeypatch):
+    monkeypatch.setattr(health, '_breakers', [])
+    host = health.register('data.commoncrawl.org', (OSError,), threshold=1, backoff=0.5)
+    health.register('database', (RuntimeError,), threshold=1, backoff=0.5)
+    opened_at = time.monotonic()
+    assert health.record(OSError('connection reset'))
+    assert host.state == health.CircuitBreaker.OPEN
+
+    start = time.monotonic()
+    health.wait('database')
+    assert time.monotonic() - start < 0.1
+
+    health.wait('data.commoncrawl.org')
+    assert time.monotonic() - opened_at >= 0.5
+    assert host.state == health.CircuitBreaker.HALF_OPEN
+
+
+def test_wait_cancelled(monkeypatch):
+    monkeypatch.setattr(health, '_breakers', [])
+    health.register('data.commoncrawl.org', (OSError,), threshold=1, backoff=60)
+    health.record(OSError('connection reset'))
+    cancel = threading.Event()
+    threading.Timer(0.1, cancel.set).start()
+    start = time.monotonic()
+    health.wait('data.commoncrawl.org', cancel=cancel)
+    assert time.monotonic() - start < 5
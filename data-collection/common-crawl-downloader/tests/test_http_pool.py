@@ -0,0 +1,56 @@
+"""Checks that pooled requests time out on a server that stalls in the middle of a body.
+
+    python -m pytest tests/test_http_pool.py
+"""
+import sys
+import socket
+import pathlib
+import threading
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import http_pool
+
+
+class StallingHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '1024')
+        self.end_headers()
+        self.wfile.write(b'x' * 16)
+        self.wfile.flush()
+        self.server.release.wait(10)
+
+    def log_message(self, *_):
+        pass
+
+
+@pytest.fixture
+def url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StallingHandler)
+    server.release = threading.Event()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/'
+    server.release.set()
+    server.shutdown()
+    server.server_close()
+
+
+def test_default_timeout(url):
+    timeout = socket.getdefaulttimeout()
+    socket.setdefaulttimeout(0.5)
+    try:
+        with pytest.raises(socket.timeout):
+            with http_pool.request('GET', url) as response:
+                response.read()
+    finally:
+        socket.setdefaulttimeout(timeout)
+
+
+def test_explicit_timeout(url):
+    with pytest.raises(socket.timeout):
+        with http_pool.request('GET', url, timeout=0.5) as response:
+            response.read()
@@ -0,0 +1,48 @@
+"""Checks that journals which disagree on a job merge into the same entry whatever order they are read in.
+
+    python -m pytest tests/test_partition.py
+"""
+import sys
+import pathlib
+import itertools
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import partition
+
+
+def journal(path, *entries):
+    journal = partition.Journal(path)
+    for entry in entries:
+        journal.append(**entry)
+    journal.close()
+    return journal
+
+
+def test_merge_conflicting_journals(tmp_path):
+    journals = [
+        journal(tmp_path.joinpath('a.jsonl'),
+                {'uri': 'a', 'state': partition.FAILED, 'finished_at': '2021-03-01T10:00:00+08:00'},
+                {'uri': 'b', 'state': partition.FAILED, 'finished_at': '2021-03-01T10:00:00+08:00'},
+                {'uri': 'c', 'state': partition.FINISHED, 'finished_at': '2021-03-01T10:00:00+08:00'}),
+        journal(tmp_path.joinpath('b.jsonl'),
+                {'uri': 'a', 'state': partition.FINISHED, 'finished_at': '2021-03-01T09:00:00+08:00'},
+                {'uri': 'b', 'state': partition.FAILED, 'finished_at': '2021-03-01T02:30:00+00:00'},
+                {'uri': 'c', 'state': partition.FAILED, 'finished_at': '2021-03-01T11:00:00+08:00'}),
+    ]
+    for order in itertools.permutations(journals):
+        entries = partition.merge(order)
+        assert entries['a']['state'] == partition.FINISHED
+        assert entries['b']['finished_at'] == '2021-03-01T02:30:00+00:00'
+        assert entries['c']['state'] == partition.FINISHED
+
+
+def test_latest_failure_after_success(tmp_path):
+    # A stale worker journals a failure after the job has been finished, e.g. once its lease ran out.
+    entries = journal(tmp_path.joinpath('a.jsonl'),
+                      {'uri': 'a', 'state': partition.FINISHED, 'finished_at': '2021-03-01T10:00:00+08:00'},
+                      {'uri': 'a', 'state': partition.FAILED, 'finished_at': '2021-03-01T11:00:00+08:00'},
+                      {'uri': 'b', 'state': partition.FAILED, 'finished_at': '2021-03-01T10:00:00+08:00'},
+                      {'uri': 'b', 'state': partition.FAILED, 'finished_at': '2021-03-01T11:00:00+08:00'}).latest()
+    assert entries['a']['state'] == partition.FINISHED
+    assert entries['b']['finished_at'] == '2021-03-01T11:00:00+08:00'
@@ -0,0 +1,52 @@
+"""Checks that the concurrency controller settles on a limit instead of swinging around it.
+
+    python -m pytest tests/test_ratelimit.py
+"""
+import sys
+import random
+import pathlib
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent.joinpath('src')))
+
+import ratelimit
+
+
+def simulate(controller, throughput_of, cap, updates, seed=0):
+    """Feeds the controller the throughput of its own limit, with a little noise. Returns the limit after every update."""
+    rng = random.Random(seed)
+    limits = []
+    for _ in range(updates):
+        throughput = throughput_of(controller.limit) * rng.uniform(0.98, 1.02)
+        limits.append(controller.update(throughput, cap))
+    return limits
+
+
+def changes(limits):
+    return sum(1 for a, b in zip(limits, limits[1:]) if a != b)
+
+
+def test_steady_under_cap():
+    # 30 per download under a cap of 100: three downloads reach 90% of the cap, four saturate it.
+    limits = simulate(ratelimit.ConcurrencyController(8), lambda n: min(n * 30, 100), 100, 300)
+    assert limits[-1] == 3
+    assert changes(limits[100:]) == 0
+
+
+def test_coarse_steps_under_cap():
+    # A single download takes 60% of the cap, so no limit falls into the dead band: the
+    # controller keeps two and retries one less ever more rarely.
+    limits = simulate(ratelimit.ConcurrencyController(8), lambda n: min(n * 60, 100), 100, 300)
+    assert changes(limits[100:]) <= 6
+    assert limits[100:].count(2) > 180
+
+
+def test_cap_change():
+    controller = ratelimit.ConcurrencyController(8)
+    simulate(controller, lambda n: min(n * 30, 100), 100, 100)
+    assert controller.limit == 3
+    limits = simulate(controller, lambda n: min(n * 30, 200), 200, 100)
+    assert limits[-1] == 6
+    assert changes(limits[50:]) == 0
+    limits = simulate(controller, lambda n: n * 30, 0, 100)
+    assert limits[-1] == 8
+    assert changes(limits[50:]) == 0
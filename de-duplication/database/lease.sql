@@ -0,0 +1,16 @@
+-- Lease columns of the filter and dedup stages, which map both tables.
+-- Apply once to an existing database; the filter claims rows of data, the dedup rows of filtered.
+
+alter table data
+    add lease_owner      varchar(128) null,
+    add lease_expires_at datetime null;
+
+create index data_lease_expires_at_index
+    on data (lease_expires_at);
+
+alter table filtered
+    add lease_owner      varchar(128) null,
+    add lease_expires_at datetime null;
+
+create index filtered_lease_expires_at_index
+    on filtered (lease_expires_at);
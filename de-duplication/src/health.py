@@ -0,0 +1,136 @@
+import time
+import logging
+import colorama
+import threading
+
+from typing import Callable, List, Optional, Tuple, Type
+
+THRESHOLD = 3
+BACKOFF = 5
+MAX_BACKOFF = 300
+
+
+class CircuitBreaker:
+    """Tracks the health of one dependency from the outcome of the real I/O against it.
+
+    After `threshold` consecutive failures the breaker opens, and `wait` blocks new jobs
+    for an exponentially growing backoff. Once the backoff has passed, the breaker is
+    half-open: a single probe (or, without a probe, the next real call) decides whether
+    it closes again or reopens with a doubled backoff.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self,
+                 name: str,
+                 errors: Tuple[Type[BaseException], ...],
+                 probe: Optional[Callable[[], None]] = None,
+                 threshold: int = THRESHOLD,
+                 backoff: float = BACKOFF,
+                 max_backoff: float = MAX_BACKOFF):
+        self.name = name
+        self.errors = errors
+        self._probe = probe
+        self._threshold = threshold
+        self._backoff = backoff
+        self._max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._trips = 0
+        self._opened_at = 0.0
+        self.state = self.CLOSED
+
+    def _delay(self) -> float:
+        return min(self._backoff * 2 ** max(self._trips - 1, 0), self._max_backoff)
+
+    def success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logging.info(f'{colorama.Fore.LIGHTGREEN_EX}'
+                             f'Connection to {self.name} restored.'
+                             f'{colorama.Fore.RESET}')
+            self._failures = 0
+            self._trips = 0
+            self.state = self.CLOSED
+
+    def failure(self, error: BaseException):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self._threshold:
+                self._trips += 1
+                self._opened_at = time.monotonic()
+                self.state = self.OPEN
+                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
+                              f'Connection to {self.name} is unhealthy ({error}), '
+                              f'new jobs are held back for {self._delay():g} seconds.'
+                              f'{colorama.Fore.RESET}')
+
+    def wait(self, cancel: Optional[threading.Event] = None):
+        """Blocks while the breaker is open, then probes the dependency if a probe is available."""
+        while True:
+            with self._lock:
+                if self.state == self.CLOSED:
+                    return
+                remaining = self._opened_at + self._delay() - time.monotonic()
+                if remaining <= 0:
+                    self.state = self.HALF_OPEN
+            if remaining > 0:
+                if cancel is not None:
+                    if cancel.wait(remaining):
+                        return
+                else:
+                    time.sleep(remaining)
+                continue
+            if self._probe is None:
+                return
+            try:
+                self._probe()
+            except self.errors as e:
+                self.failure(e)
+                continue
+            self.success()
+            return
+
+
+_breakers: List[CircuitBreaker] = []
+
+
+def register(name: str,
+             errors: Tuple[Type[BaseException], ...],
+             probe: Optional[Callable[[], None]] = None,
+             threshold: int = THRESHOLD,
+             backoff: float = BACKOFF,
+             max_backoff: float = MAX_BACKOFF) -> CircuitBreaker:
+    breaker = CircuitBreaker(name, errors, probe, threshold=threshold, backoff=backoff, max_backoff=max_backoff)
+    _breakers[:] = [b for b in _breakers if b.name != name] + [breaker]
+    return breaker
+
+
+def record(error: BaseException) -> bool:
+    """Counts `error` against every breaker it belongs to. Returns whether it is a connectivity error."""
+    matched = False
+    for breaker in _breakers:
+        if isinstance(error, breaker.errors):
+            breaker.failure(error)
+            matched = True
+    return matched
+
+
+def succeeded(*names: str):
+    """Marks the named dependencies, or all of them, as healthy after real I/O went through."""
+    for breaker in _breakers:
+        if len(names) == 0 or breaker.name in names:
+            breaker.success()
+
+
+def wait(*names: str, cancel: Optional[threading.Event] = None):
+    """Blocks until none of the named dependencies, or none at all, is known to be down.
+
+    Replaces probing before every job, and holds back retries while the dependency that
+    failed them is down.
+    """
+    for breaker in _breakers:
+        if len(names) == 0 or breaker.name in names:
+            breaker.wait(cancel)
@@ -1,20 +1,25 @@
 import datetime
+import functools
 import logging
 import socket
 from typing import Sequence
-from urllib.request import urlopen
 
 import colorama
 import pytz
-from sqlalchemy.exc import NoResultFound
+from pymongo.errors import PyMongoError
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, NoResultFound
 from sqlalchemy.orm import Session
 
 import configs
 import db
+import health
+import lease
 import models
+import records
 from utils import *
 
-CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 TIMEZONE = 'Asia/Shanghai'
 CONFIG_PATH = 'configs'
 
@@ -24,27 +29,6 @@ def panic(message: str):
     sys.exit(-1)
 
 
-def check_connectivity():
-    tries = 0
-    while True:
-        try:
-            urlopen(CONNECTIVITY_CHECK_URL, timeout=30)
-        except Exception as e:
-            if tries < RETRIES:
-                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                              f'Connectivity check failed: {e}'
-                              f'{colorama.Fore.RESET}')
-                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                time.sleep(RETRY_INTERVAL)
-                tries += 1
-            else:
-                panic(f'{colorama.Fore.LIGHTRED_EX}'
-                      f'Connectivity check failed after {RETRIES} retries.'
-                      f'{colorama.Fore.RESET}')
-            continue
-        break
-
-
 def find_device_by_name(session: Session, name: str) -> models.Device:
     try:
         device = session.query(models.Device).filter_by(device_name=name).one()
@@ -149,8 +133,28 @@ def update_deduped(session: Session, parameters: dict) -> models.Deduped:
     return deduped
 
 
+def probe_database(db_engine: Engine):
+    with db_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
+def probe_mongo():
+    client = db.mongo_connect(MONGO_DB_CONF)
+    try:
+        client.admin.command('ping')
+    finally:
+        client.close()
+
+
 def main():
     db_engine = db.db_connect(DB_CONF)
+    LEASES.start(db_engine)
+    health.register('database', (DBAPIError,),
+                    probe=functools.partial(probe_database, db_engine),
+                    threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
+    health.register('MongoDB', (PyMongoError,),
+                    probe=probe_mongo,
+                    threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
     if IF_ARCHIVE:
         to_de_dup_path = pathlib.Path(ARCHIVE).joinpath(TO_DE_DUP_PREFIX)
         de_duped_backup_path = pathlib.Path(ARCHIVE).joinpath(DE_DUPED_BACKUP_PREFIX)
@@ -164,7 +168,7 @@ def main():
 
     while True:
         try:
-            check_connectivity()
+            health.wait()
         except KeyboardInterrupt:
             logging.info(f'Bye.')
             return
@@ -176,13 +180,16 @@ def main():
         while True:
             try:
                 logging.info('Scanning preocessed folder...')
-                data_list = list(to_de_dup_path.rglob('*.warc.wet.json'))
+                data_list = records.glob(to_de_dup_path)
                 if len(data_list) == 0:
                     logging.info('No unclaimed job found. This program is about to exit.')
                     return
                 out_path_list_ = []
                 for file in data_list:
                     out_path_list_.append(file.relative_to(to_de_dup_path).as_posix())
+                LEASES.reap(session, [(models.Filtered.dedup_state,
+                                       models.Filtered.DEDUP_PROCESSING,
+                                       models.Filtered.DEDUP_PENDING)])
                 session.begin()
                 jobs = find_filtered_jobs_by_path_list(session, TO_DE_DUP_PREFIX, out_path_list_)
                 if len(jobs) == 0:
@@ -233,6 +240,7 @@ def main():
                     return
                 for job in jobs:
                     job.dedup_state = models.Filtered.DEDUP_PROCESSING
+                    LEASES.take(job)
                     job.start_deal_time = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
                     out_path = find_storage_by_filtered(session, job).out_path
                     out_path_in_job.append(out_path)
@@ -245,6 +253,7 @@ def main():
                              f'.')
                 session.close()
             except Exception as e:
+                health.record(e)
                 if tries < RETRIES:
                     session.rollback()
                     logging.error(f'{colorama.Fore.LIGHTRED_EX}'
@@ -321,11 +330,13 @@ def main():
                         session.add(dup)
 
                         job.dedup_state = models.Filtered.DEDUP_PENDING
+                        LEASES.drop(job)
                     logging.warning(f'=====ENTERING CRITICAL ZONE=====')
                     logging.warning(f'Do not interrupt this process!')
                     for o_data, n_data in zip(to_de_dup_data_path_list, processed_de_dup_data_path_list):
                         o_data.replace(n_data)
                     logging.warning(f'=====EXITING CRITICAL ZONE=====')
+                    health.succeeded()
                     logging.info(f'Job '
                                  f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
                                  f'succeeded'
@@ -335,6 +346,7 @@ def main():
                 except KeyboardInterrupt:
                     raise KeyboardInterrupt
                 except Exception as e:
+                    health.record(e)
                     # raise e
                     if tries < RETRIES:
                         logging.error(f'{colorama.Fore.LIGHTRED_EX}'
@@ -348,6 +360,7 @@ def main():
                                                                out_path_list=out_path_in_job)
                         for job in jobs:
                             job.dedup_state = models.Filtered.DEDUP_FAILED
+                            LEASES.drop(job)
                         logging.error(f'Job '
                                       f'{colorama.Back.RED}'
                                       f'failed'
@@ -364,6 +377,7 @@ def main():
                                                    out_path_list=out_path_in_job)
             for job in jobs:
                 job.dedup_state = models.Filtered.DEDUP_PENDING
+                LEASES.drop(job)
             logging.warning(f'Job '
                             f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
                             f'cancelled'
@@ -400,6 +414,14 @@ if __name__ == '__main__':
     MONGO_DB_COLLECTION = config.get('mongo_db', 'collection')
     MONGO_DB_POOL_NUM = config.getint('mongo_db', 'mongo_db_pool_num')
     MINHASH_POOL_NUM = config.getint('minhash', 'minhash_pool_num')
+    HEALTH_THRESHOLD = config.getint('health', 'threshold')
+    HEALTH_BACKOFF = config.getfloat('health', 'backoff')
+    HEALTH_MAX_BACKOFF = config.getfloat('health', 'max_backoff')
+    LEASES = lease.Leases(models.Filtered,
+                          owner=lease.default_owner(DEVICE),
+                          duration=config.getint('lease', 'duration'),
+                          interval=config.getint('lease', 'heartbeat_interval'),
+                          timezone=TIMEZONE)
     colorama.init()
     logging.basicConfig(level=logging.INFO,
                         format=f'{colorama.Style.BRIGHT}[%(asctime)s] [%(levelname)8s]{colorama.Style.RESET_ALL} %(message)s')
@@ -18,6 +18,8 @@ class Data(Base):
     filter_state = Column(SmallInteger, nullable=False, default=0)
     archive = Column(String(20))
     start_deal_time = Column(DateTime)
+    lease_owner = Column(String(128))
+    lease_expires_at = Column(DateTime)
 
     storage = relationship('Storage', back_populates='data')
     filtered = relationship('Filtered', back_populates='data')
@@ -69,6 +71,8 @@ class Filtered(Base):
     id_storage = Column(Integer, ForeignKey('storage.id'))
     dedup_state = Column(SmallInteger, nullable=False, default=0)
     start_deal_time = Column(DateTime)
+    lease_owner = Column(String(128))
+    lease_expires_at = Column(DateTime)
 
     data = relationship('Data', back_populates='filtered')
     storage = relationship('Storage', back_populates='filtered')
@@ -1,5 +1,4 @@
 import itertools
-import simdjson as json
 import os
 import pathlib
 import sys
@@ -11,6 +10,8 @@ from typing import Optional, List, Iterable
 import numpy as np
 from lsh import minhash  # https://github.com/mattilyra/lsh
 from pymongo.database import Database, Collection
+
+import records
 # shingle没有传ngram参数，需要改
 
 class ProgBar:
@@ -232,6 +233,16 @@ def shingles(text, char_ngram=5):
     return set(text[head:head + char_ngram] for head in range(0, len(text) - char_ngram))
 
 
+def same_text(a, b):
+    """Whether two records hold the same text, from the hashes in their `stats` if both still have them.
+
+    Otherwise the texts are compared, which is as cheap for texts of different lengths.
+    """
+    if 'stats' in a and 'stats' in b:
+        return a['stats']['hash'] == b['stats']['hash']
+    return a['data'] == b['data']
+
+
 def get_jaccard(set_a, set_b):
     intersection = set_a & set_b
     union = set_a | set_b
@@ -243,6 +254,9 @@ def get_jaccard_each_progress(candidate_pairs, data,
     dup_id_set = set()
     baike_keywords = ['baike', 'wikipedia']
     for id_a, id_b in candidate_pairs:
+        if same_text(data[id_a], data[id_b]):
+            dup_id_set.add(id_b)
+            continue
         jaccard_sim = get_jaccard(shingles(data[id_a]["data"]), shingles(data[id_b]["data"]))
         if any(keyword in data[id_a]['url'] for keyword in baike_keywords) \
                 and any(keyword in data[id_b]['url'] for keyword in baike_keywords):
@@ -289,15 +303,13 @@ def get_all_data(data_file_list):
     data = {}
     id_global = 0
     for file in sorted(data_file_list):
-        with open(file, 'r') as r:
-            lines = json.load(r)
-            for id_, values in lines.items():
-                data[id_global] = values
-                # data[id_global]["url"] = values["url"]
-                # data[id_global]["data"] = values["data"]
-                data[id_global]["path"] = file
-                data[id_global]["id"] = id_
-                id_global += 1
+        for id_, values in records.read_records(file):
+            data[id_global] = values
+            # data[id_global]["url"] = values["url"]
+            # data[id_global]["data"] = values["data"]
+            data[id_global]["path"] = file
+            data[id_global]["id"] = id_
+            id_global += 1
     return data
 
 
@@ -334,6 +346,8 @@ def cal_sim_with_db(to_insert, db_ids, db_file_data, if_path, jac_thred, jac_bai
             db_data = db_file_data.get(db_id)
             if db_id == to_insert["id"] and if_path:
                 return True
+            if same_text(to_insert, db_data):
+                return True
             jaccard_sim = get_jaccard(shingles(to_insert_data), shingles(db_data["data"]))
             if jaccard_sim > thred:
                 return True
@@ -342,6 +356,8 @@ def cal_sim_with_db(to_insert, db_ids, db_file_data, if_path, jac_thred, jac_bai
             db_data = db_file_data.get(db_id)
             if db_id == to_insert["id"] and if_path:
                 return True
+            if same_text(to_insert, db_data):
+                return True
             jaccard_sim = get_jaccard(shingles(to_insert_data), shingles(db_data["data"]))
             if any(keyword in db_data["url"] for keyword in baike_keywords):
                 thred = jac_baike_thred
@@ -410,8 +426,8 @@ def check_insert_to_db_all(data, to_insert_db_id_set, MONGO_DB_CONF,
 
     dup_set = set()
     for file, data_db in to_check_db_path_local_id_file_id.items():
-        with open(file, "r") as r:
-            db_file_data = json.load(r)
+        db_ids_in_file = set(itertools.chain.from_iterable(data_db.values()))
+        db_file_data = {id_: values for id_, values in records.read_records(file) if id_ in db_ids_in_file}
         for global_id, db_ids in data_db.items():
             if global_id in dup_set:
                 continue
@@ -436,8 +452,9 @@ def write_div_data(all_data, to_write_set, to_remove_prefix, to_add_prefix):
             path_data[to_write_path] = {}
             path_data[to_write_path][id_] = data
     for path, values in path_data.items():
-        with open(path, "w") as w:
-            json.dump(values, w)
+        with records.RecordWriter(path, keyed=True) as w:
+            for id_, data in values.items():
+                w.write(data, id_)
     path_data.clear()
 
 
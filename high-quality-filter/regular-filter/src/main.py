@@ -6,24 +6,28 @@ import socket
 import logging
 import pathlib
 import datetime
+import functools
 import colorama
+import itertools
 import json as pyjson
-import simdjson as json
 
 from typing import Sequence, Tuple
-from urllib.request import urlopen
-from sqlalchemy.exc import NoResultFound
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, NoResultFound
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 
 import db
+import lease
+import health
 import utils
 import models
 import configs
+import records
 
-CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 TIMEZONE = 'Asia/Shanghai'
 CONFIG_PATH = 'configs'
+CHUNK_SIZE = 10000
 
 
 def panic(message: str):
@@ -31,39 +35,26 @@ def panic(message: str):
     sys.exit(-1)
 
 
-def check_connectivity():
-    tries = 0
-    while True:
-        try:
-            urlopen(CONNECTIVITY_CHECK_URL, timeout=SOCKET_TIMEOUT)
-        except Exception as e:
-            if tries < RETRIES:
-                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                              f'Connectivity check failed: {e}'
-                              f'{colorama.Fore.RESET}')
-                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                time.sleep(RETRY_INTERVAL)
-                tries += 1
-            else:
-                panic(f'{colorama.Fore.LIGHTRED_EX}'
-                      f'Connectivity check failed after {RETRIES} retries.'
-                      f'{colorama.Fore.RESET}')
-            continue
-        break
-
-
 def filter_data(data: pathlib.Path,
                 filters: Sequence[models.Filter],
                 filtered_clean_data: pathlib.Path,
                 filtered_deleted_data: pathlib.Path) -> Tuple[int, int]:
+    """Filters the records of `data` `CHUNK_SIZE` at a time. The outputs keep the format of their file name."""
+    progbar = utils.ProgBar()
+    data = records.read_records(data)
     with \
-            open(data, 'rb') as f_data, \
-            open(filtered_clean_data, 'w') as f_clean, \
-            open(filtered_deleted_data, 'w') as f_deleted:
-        data = json.load(f_data)['data']
-        clean_data, deleted_data = utils.filter_data(data, filters=filters)
-        json.dump(clean_data, f_clean)
-        json.dump(deleted_data, f_deleted)
+            records.RecordWriter(filtered_clean_data, keyed=True) as f_clean, \
+            records.RecordWriter(filtered_deleted_data, keyed=True) as f_deleted:
+        while True:
+            chunk = dict(itertools.islice(data, CHUNK_SIZE))
+            if len(chunk) == 0:
+                break
+            clean_data, deleted_data = utils.filter_data(chunk, filters=filters, progress=False)
+            for id_, record in clean_data.items():
+                f_clean.write(record, id_)
+            for id_, record in deleted_data.items():
+                f_deleted.write(record, id_)
+            progbar.add(len(chunk))
     return filtered_clean_data.stat().st_size, filtered_deleted_data.stat().st_size
 
 
@@ -144,12 +135,21 @@ def update_filtered(session: Session, parameters: dict) -> models.Filtered:
     return filtered
 
 
+def probe_database(db_engine: Engine):
+    with db_engine.connect() as connection:
+        connection.execute(text('SELECT 1'))
+
+
 def main():
     db_engine = db.db_connect(DB_CONF)
+    LEASES.start(db_engine)
+    health.register('database', (DBAPIError,),
+                    probe=functools.partial(probe_database, db_engine),
+                    threshold=HEALTH_THRESHOLD, backoff=HEALTH_BACKOFF, max_backoff=HEALTH_MAX_BACKOFF)
     data_path = pathlib.Path(DATA_ROOT).joinpath(ARCHIVE, DATA_PREFIX)
     while True:
         try:
-            check_connectivity()
+            health.wait()
         except KeyboardInterrupt:
             logging.info(f'Bye.')
             return
@@ -161,11 +161,14 @@ def main():
         while True:
             try:
                 logging.info('Scanning data folder...')
-                data_list = list(data_path.rglob('*.warc.wet.json'))
+                data_list = records.glob(data_path)
                 if len(data_list) == 0:
                     logging.info('No unclaimed job found. This program is about to exit.')
                     return
                 out_path = str(random.choice(data_list).relative_to(data_path).as_posix())
+                LEASES.reap(session, [(models.Data.filter_state,
+                                       models.Data.FILTER_PROCESSING,
+                                       models.Data.FILTER_PENDING)])
                 session.begin()
                 job: models.Data = session \
                     .query(models.Data) \
@@ -213,6 +216,7 @@ def main():
                     time.sleep(RETRY_INTERVAL)
                     continue
                 job.filter_state = models.Data.FILTER_PROCESSING
+                LEASES.take(job)
                 job.start_deal_time = datetime.datetime.now(tz=pytz.timezone(TIMEZONE))
                 session.add(job)
                 session.commit()
@@ -223,6 +227,7 @@ def main():
                              f'.')
                 session.close()
             except Exception as e:
+                health.record(e)
                 if tries < RETRIES:
                     session.rollback()
                     logging.error(f'{colorama.Fore.LIGHTRED_EX}'
@@ -283,6 +288,7 @@ def main():
                         'storage': deleted_storage
                     })
                     job.filter_state = models.Data.FILTER_PENDING
+                    LEASES.drop(job)
                     session.add(clean_storage)
                     session.add(deleted_storage)
                     session.add(clean_filtered)
@@ -293,6 +299,7 @@ def main():
                     processed_data = pathlib.Path(DATA_ROOT).joinpath(ARCHIVE, PROCESSED_PREFIX, out_path)
                     processed_data.parent.mkdir(parents=True, exist_ok=True)
                     unprocessed_data.replace(processed_data)
+                    health.succeeded()
                     logging.info(f'Job '
                                  f'{colorama.Back.GREEN}{colorama.Fore.BLACK}'
                                  f'succeeded'
@@ -302,6 +309,7 @@ def main():
                 except KeyboardInterrupt:
                     raise KeyboardInterrupt
                 except Exception as e:
+                    health.record(e)
                     if tries < RETRIES:
                         logging.error(f'{colorama.Fore.LIGHTRED_EX}'
                                       f'An error has occurred: {e}'
@@ -312,6 +320,7 @@ def main():
                     else:
                         job = find_job_by_prefix_and_out_path(session=session, prefix=DATA_PREFIX, out_path=out_path)
                         job.filter_state = models.Data.FILTER_FAILED
+                        LEASES.drop(job)
                         logging.error(f'Job '
                                       f'{colorama.Back.RED}'
                                       f'failed'
@@ -326,6 +335,7 @@ def main():
         except KeyboardInterrupt:
             job = find_job_by_prefix_and_out_path(session=session, prefix=DATA_PREFIX, out_path=out_path)
             job.filter_state = models.Data.FILTER_PENDING
+            LEASES.drop(job)
             logging.warning(f'Job '
                             f'{colorama.Back.YELLOW}{colorama.Fore.BLACK}'
                             f'cancelled'
@@ -351,6 +361,14 @@ if __name__ == '__main__':
     PROCESSED_PREFIX = config.get('worker', 'processed_prefix')
     FILTERED_CLEAN_PREFIX = config.get('worker', 'filtered_clean_prefix')
     FILTERED_DELETED_PREFIX = config.get('worker', 'filtered_deleted_prefix')
+    HEALTH_THRESHOLD = config.getint('health', 'threshold')
+    HEALTH_BACKOFF = config.getfloat('health', 'backoff')
+    HEALTH_MAX_BACKOFF = config.getfloat('health', 'max_backoff')
+    LEASES = lease.Leases(models.Data,
+                          owner=lease.default_owner(DEVICE),
+                          duration=config.getint('lease', 'duration'),
+                          interval=config.getint('lease', 'heartbeat_interval'),
+                          timezone=TIMEZONE)
 
     filters_str = '-'.join([str(f) for f in FILTERS])
     colorama.init()
@@ -7,8 +7,8 @@ import logging
 import pathlib
 import datetime
 import colorama
+import itertools
 import json as pyjson
-import simdjson as json
 
 from typing import Sequence, Tuple
 from urllib.request import urlopen
@@ -20,10 +20,12 @@ import db
 import utils
 import models
 import configs
+import records
 
 CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 TIMEZONE = 'Asia/Shanghai'
 CONFIG_PATH = 'configs'
+CHUNK_SIZE = 10000
 
 
 def panic(message: str):
@@ -55,10 +57,17 @@ def check_connectivity():
 def filter_data(data: pathlib.Path,
                 filters: Sequence[models.Filter],
                 filtered_clean_data: pathlib.Path) -> int:
-    with open(data, 'rb') as f_data, open(filtered_clean_data, 'w') as f_clean:
-        data = json.load(f_data)['data']
-        clean_data, deleted_data = utils.filter_data(data, filters=filters)
-        json.dump(clean_data, f_clean)
+    progbar = utils.ProgBar()
+    data = records.read_records(data)
+    with records.RecordWriter(filtered_clean_data, keyed=True) as f_clean:
+        while True:
+            chunk = dict(itertools.islice(data, CHUNK_SIZE))
+            if len(chunk) == 0:
+                break
+            clean_data, deleted_data = utils.filter_data(chunk, filters=filters, progress=False)
+            for id_, record in clean_data.items():
+                f_clean.write(record, id_)
+            progbar.add(len(chunk))
     return filtered_clean_data.stat().st_size
 
 
@@ -156,7 +165,7 @@ def main():
         while True:
             try:
                 logging.info('Scanning data folder...')
-                data_list = list(data_path.rglob('*.warc.wet.json'))
+                data_list = records.glob(data_path)
                 if len(data_list) == 0:
                     logging.info('No unclaimed job found. This program is about to exit.')
                     return
@@ -3,11 +3,16 @@ import re
 import sys
 import copy
 import time
+import itertools
+import functools
 import numpy as np
-from typing import Iterable, Sequence, List, Dict, Optional, Tuple, Set
+from typing import Iterable, Sequence, List, Dict, Optional, Tuple, Set, Union
 
 from flashtext import KeywordProcessor
 
+# The sentence ends that the `last_end` of the extraction `stats` refers to, as in its `utils.SENTENCE_ENDS`.
+SENTENCE_ENDS = '\u3002\uff01\uff1f\uff1b\u2026.!?;'
+
 
 class ProgBar:
     """
@@ -213,6 +218,24 @@ def kernel_filter_length(clean, deleted, parameter):
     return clean_data, deleted_data
 
 
+def last_end_scan(data, end_char):
+    """The offsets to look for the last of `end_char` at, backwards.
+
+    When the `last_end` of the extraction `stats` is one of `end_char`, and no other one of
+    them follows it, the search starts there instead of at the end of the text.
+    """
+    length = data["data_length"]
+    if "stats" not in data or data["stats"]["last_end"] < 0:
+        return range(length - 1, -1, -1)
+    last_end = data["stats"]["last_end"]
+    if data["data"][last_end] in end_char:
+        extra_char = [char for char in end_char if char not in SENTENCE_ENDS]
+        tail = data["data"][last_end + 1:]
+        if not any(char in tail for char in extra_char):
+            return range(last_end, -1, -1)
+    return range(length - 1, -1, -1)
+
+
 def kernel_filter_end(clean, deleted, parameter):
     clean_data = copy.deepcopy(clean)
     deleted_data = copy.deepcopy(deleted)
@@ -220,7 +243,7 @@ def kernel_filter_end(clean, deleted, parameter):
     for id_, data in clean.items():
         content = data["data"]
         flag = 0
-        for i in range(data["data_length"] - 1, -1, -1):
+        for i in last_end_scan(data, end_char):
             tem_char = content[i]
             if tem_char in end_char:
                 flag = 1
@@ -298,6 +321,7 @@ def kernel_filter_ctrl_char(clean, deleted, parameter):
     return clean_data, deleted_data
 
 
+@functools.lru_cache(maxsize=None)
 def load_blacklist_words(path: str) -> Tuple[KeywordProcessor, Set]:
     blacklist_words = {}
     categories = set()
@@ -342,8 +366,10 @@ def list_to_indexed_dict(data: Sequence) -> Dict:
     return data_dict
 
 
-def filter_data(data: Sequence, filters: Sequence) -> Tuple:
+def filter_data(data: Union[Sequence, Dict], filters: Sequence, progress: bool = True) -> Tuple:
     """
+    `data` is a list of records, or a dict of records by id to filter a chunk of a file.
+
     :return:
     (
         {
@@ -367,13 +393,21 @@ def filter_data(data: Sequence, filters: Sequence) -> Tuple:
             ...
         }
     )
+
+    The `stats` of the extraction are dropped from the records once a filter changes their
+    text, so that they are only ever read while they hold.
     """
     filters = get_filters(filters)
-    data = list_to_indexed_dict(data)
-    clean_data = data
+    clean_data = data if isinstance(data, dict) else list_to_indexed_dict(data)
     deleted_data = {}
-    progbar = ProgBar(len(filters))
+    # The kernels only ever take text away, so a record that kept its length kept its text.
+    lengths = {id_: d['data_length'] for id_, d in clean_data.items()}
+    progbar = ProgBar(len(filters)) if progress else None
     for filter_ in filters:
         clean_data, deleted_data = filter_['kernel'](clean_data, deleted_data, filter_['parameters'])
-        progbar.add(1)
+        for id_, d in itertools.chain(clean_data.items(), deleted_data.items()):
+            if 'stats' in d and d['data_length'] != lengths[id_]:
+                del d['stats']
+        if progbar is not None:
+            progbar.add(1)
     return clean_data, deleted_data
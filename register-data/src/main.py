@@ -1,5 +1,4 @@
 import sys
-import time
 import socket
 import shutil
 import logging
@@ -11,12 +10,13 @@ import utils
 import models
 import configs
 
-from urllib.request import urlopen
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import NoResultFound
 
-CONNECTIVITY_CHECK_URL = 'https://www.baidu.com'
 CONFIG_PATH = 'configs'
+RECORD_SUFFIXES = ['.json', '.jsonl', '.jsonl.gz']
+# The metadata the extraction writes next to a record file, see `records.meta_of`.
+META_SUFFIX = '.meta'
 
 
 def panic(message: str):
@@ -24,27 +24,6 @@ def panic(message: str):
     sys.exit(-1)
 
 
-def check_connectivity():
-    tries = 0
-    while True:
-        try:
-            urlopen(CONNECTIVITY_CHECK_URL, timeout=30)
-        except Exception as e:
-            if tries < RETRIES:
-                logging.error(f'{colorama.Fore.LIGHTRED_EX}'
-                              f'Connectivity check failed: {e}'
-                              f'{colorama.Fore.RESET}')
-                logging.info(f'Retry after {RETRY_INTERVAL} seconds ({RETRIES - tries} left)).')
-                time.sleep(RETRY_INTERVAL)
-                tries += 1
-            else:
-                panic(f'{colorama.Fore.LIGHTRED_EX}'
-                      f'Connectivity check failed after {RETRIES} retries.'
-                      f'{colorama.Fore.RESET}')
-            continue
-        break
-
-
 def find_device_by_name(session: Session, name: str) -> models.Device:
     try:
         device = session.query(models.Device).filter_by(device_name=name).one()
@@ -69,26 +48,20 @@ def main():
     copy_source = pathlib.Path(COPY_SOURCE)
     copy_dest = pathlib.Path(COPY_DEST)
 
-    try:
-        check_connectivity()
-    except KeyboardInterrupt:
-        logging.info(f'Bye.')
-        return
-
     if COPY_ENABLED:
         logging.info(f'Scanning source folder: '
                      f'{colorama.Fore.LIGHTCYAN_EX}'
                      f'{{path={COPY_SOURCE}}}'
                      f'{colorama.Fore.RESET}'
                      f'.')
-        file_list = list(copy_source.rglob('*.warc.wet.json'))
+        file_list = [file for suffix in RECORD_SUFFIXES for file in copy_source.rglob(f'*.warc.wet{suffix}')]
     else:
         logging.info(f'Scanning device: '
                      f'{colorama.Fore.LIGHTCYAN_EX}'
                      f'{{path={device_path}}}'
                      f'{colorama.Fore.RESET}'
                      f'.')
-        file_list = list(device_path.rglob('*.warc.wet.json'))
+        file_list = [file for suffix in RECORD_SUFFIXES for file in device_path.rglob(f'*.warc.wet{suffix}')]
 
     session = Session(bind=db_engine)
     progbar = utils.ProgBar(target=len(file_list))
@@ -112,6 +85,9 @@ def main():
                 full_path = copy_dest.joinpath(segments)
                 full_path.parent.mkdir(parents=True, exist_ok=True)
                 shutil.copy(file, full_path)
+                meta = file.with_name(file.name + META_SUFFIX)
+                if meta.exists():
+                    shutil.copy(meta, full_path.with_name(full_path.name + META_SUFFIX))
                 full_path = str(full_path.relative_to(device_path).as_posix())
             else:
                 full_path = str(file.relative_to(device_path).as_posix())
@@ -119,7 +95,7 @@ def main():
             out_path_idx = remain.find('crawl-data/')
             prefix = remain[:out_path_idx - 1]
             out_path = remain[out_path_idx:]
-            uri = str(pathlib.Path(out_path).with_suffix('.gz').as_posix())
+            uri = out_path[:out_path.rindex('.warc.wet.')] + '.warc.wet.gz'
 
             data = find_data_by_uri(session, uri=uri)
             if data.storage is None: